@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Cold-start budget: import time of each entry point in a fresh interpreter.
+
+  api    lovefi-agents/api/index.py, the module Vercel loads (FastAPI app + Mangum handler)
+  agent  lovefi/dating_match_agent.py (needs uagents; skipped without it)
+
+Each target is imported --runs times in new processes and the median is
+checked against its budget; the script exits 1 if any target is over, so it
+can gate CI. The slowest modules from `python -X importtime` are listed to
+show where the time goes.
+
+    python benchmarks/bench_cold_start.py [--runs 7] [--budget api=800 --budget agent=2000]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from importlib.util import find_spec
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import AGENTS_DIR, LOVEFI_DIR, save_results
+
+# target -> (directory to import from, module, budget in ms)
+TARGETS = {
+    'api': (os.path.join(AGENTS_DIR, 'api'), 'index', 800.0),
+    'agent': (LOVEFI_DIR, 'dating_match_agent', 2000.0),
+}
+
+PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(f"COLD_START {{elapsed}} {{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}", file=sys.stderr)
+"""
+
+def run_once(directory: str, module: str, importtime: bool = False):
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE.format(module=module)]
+    proc = subprocess.run(args, cwd=directory, capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    line = next(line for line in proc.stderr.splitlines() if line.startswith("COLD_START "))
+    _, seconds, max_rss_kib = line.split()
+    return float(seconds), int(max_rss_kib), proc.stderr
+
+def slowest_modules(importtime_output: str, top: int = 8):
+    """(self time us, cumulative us, module) of the modules with the largest self time"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--only", action="append", choices=list(TARGETS))
+    parser.add_argument("--budget", action="append", default=[], metavar="TARGET=MS", help="override a budget")
+    parser.add_argument("--out", help="result file (default benchmarks/results/cold_start-<commit>.json)")
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (_, _, budget) in TARGETS.items()}
+    for item in args.budget:
+        name, _, ms = item.partition("=")
+        budgets[name] = float(ms)
+
+    results = []
+    over_budget = []
+    for name, (directory, module, _) in TARGETS.items():
+        if args.only and name not in args.only:
+            continue
+        if name == 'agent' and find_spec('uagents') is None:
+            print("uagents is not installed: skipping the agent target")
+            continue
+        runs = [run_once(directory, module)[:2] for _ in range(args.runs)]
+        median_ms = statistics.median(seconds for seconds, _ in runs) * 1000
+        max_rss_kib = max(rss for _, rss in runs)
+        status = "ok" if median_ms <= budgets[name] else "OVER BUDGET"
+        print(f"{name:<6} import {median_ms:8.1f} ms (min {min(s for s, _ in runs) * 1000:.1f}, budget {budgets[name]:.0f} ms)"
+              f"  max RSS {max_rss_kib / 1024:.1f} MiB  {status}")
+        for self_us, cumulative_us, module_name in slowest_modules(run_once(directory, module, importtime=True)[2]):
+            print(f"         {self_us / 1000:7.1f} ms self {cumulative_us / 1000:8.1f} ms total  {module_name.strip()}")
+        results.append({
+            'name': f"cold_start/{name}",
+            'ns_per_op': median_ms * 1e6,
+            'ops_per_sec': 1000 / median_ms,
+            'budget_ms': budgets[name],
+            'max_rss_kib': max_rss_kib,
+            'runs': args.runs,
+        })
+        if median_ms > budgets[name]:
+            over_budget.append(name)
+
+    path = save_results("cold_start", {'runs': args.runs, 'budgets': budgets}, results, args.out)
+    print(f"\nResults written to {path}")
+    if over_budget:
+        print(f"Over the cold-start budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
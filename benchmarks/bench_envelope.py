@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Envelope codec throughput on one core: parse + validate an incoming envelope
+and decode its base64 JSON payload, then encode a reply envelope. Every
+installed codec (msgspec, orjson, stdlib json) runs against the legacy path,
+which went bytes -> str -> base64 -> str -> json on the way in and back.
+
+    python benchmarks/bench_envelope.py [--quick]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import make_profiles, measure, print_results, save_results, to_matcher_profile
+
+from envelope_codec import CODECS, available_codecs
+
+REPLY_HEADER = {"version": 1, "sender": "agent1qlovefi", "target": "agent1qsender", "session": "s",
+                "schema_digest": "matching_response_schema", "protocol_digest": None, "expires": 0, "nonce": 0,
+                "signature": None}
+
+def make_request(pairs: int) -> bytes:
+    profiles = [to_matcher_profile(p) for p in make_profiles(pairs + 1, seed=3)]
+    if pairs == 1:
+        payload = {'profile1': profiles[0], 'profile2': profiles[1]}
+    else:
+        payload = {'profiles': profiles, 'index_pairs': [[i, i + 1] for i in range(pairs)]}
+    envelope = dict(REPLY_HEADER, payload=base64.b64encode(json.dumps(payload).encode()).decode())
+    return json.dumps(envelope).encode()
+
+def make_reply(pairs: int):
+    if pairs == 1:
+        return {'score': 72.5, 'explanation': "Compatibility Analysis: ..." * 4, 'recommendations': ["Meet up"] * 3}
+    return {'results': [{'index': i, 'score': 50.0 + i % 50} for i in range(pairs)], 'count': pairs, 'errors': 0}
+
+def legacy_decode(raw: bytes):
+    body = json.loads(raw)
+    return json.loads(base64.b64decode(body['payload']).decode('utf-8'))
+
+def legacy_encode(payload) -> bytes:
+    envelope = dict(REPLY_HEADER, payload=base64.b64encode(json.dumps(payload).encode()).decode())
+    return json.dumps(envelope).encode()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="shorter timing runs")
+    parser.add_argument("--out", help="result file (default benchmarks/results/envelope-<commit>.json)")
+    args = parser.parse_args()
+    min_time = 0.05 if args.quick else 0.2
+
+    results = []
+    for pairs in (1, 1000):
+        raw, reply = make_request(pairs), make_reply(pairs)
+        cases = [("legacy", legacy_decode, legacy_encode)]
+        for name in available_codecs():
+            codec = CODECS[name]()
+            assert codec.decode_payload(codec.decode_envelope(raw)['payload']) == legacy_decode(raw)
+            cases.append((name, lambda raw, codec=codec: codec.decode_payload(codec.decode_envelope(raw)['payload']),
+                          lambda payload, codec=codec: codec.encode_envelope(REPLY_HEADER, payload)))
+        for name, decode, encode in cases:
+            encoded_size = len(encode(reply))
+            for step, fn, size in (("decode", lambda: decode(raw), len(raw)), ("encode", lambda: encode(reply), encoded_size)):
+                result = measure(f"{step}/{name}/{pairs}-pair", fn, min_time=min_time)
+                result['bytes'] = size
+                result['mb_per_sec'] = size * result['ops_per_sec'] / 1e6
+                results.append(result)
+
+    print_results(results)
+    print(f"\n{'benchmark':<36} {'bytes':>10} {'MB/s/core':>10}")
+    for r in results:
+        print(f"{r['name']:<36} {r['bytes']:>10,} {r['mb_per_sec']:>10.1f}")
+    path = save_results("envelope", {'min_time': min_time, 'codecs': available_codecs()}, results, args.out)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""
+Local match-request extraction: how many chat prompts it answers without the
+LLM, how many of those answers are right, and what that saves in latency.
+
+Two corpora are scored with the threshold the agent uses:
+
+  corpus     benchmarks/extractor_corpus.jsonl, hand-written chat lines, each
+             labelled with whether it should be read locally and the fields
+             expected from it
+  synthetic  synthetic profiles rendered as chat in several styles, from
+             terse lists to prose that only the LLM should read
+
+A prompt read locally costs the extraction time. Every other prompt costs the
+extraction time plus one LLM round trip (--llm-ms, 2 s by default; the agent's
+`llm` stage timing gives the real figure). The saving is measured against
+always calling the LLM.
+
+    python benchmarks/bench_extractor.py [--quick] [--llm-ms 2000] [--threshold 0.95]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import date
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import make_profiles, measure, print_results, save_results
+
+from match_extractor import extract_match_request
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extractor_corpus.jsonl')
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _interest_list(interests: List[str]) -> str:
+    return interests[0] if len(interests) == 1 else f"{', '.join(interests[:-1])} and {interests[-1]}"
+
+# style -> (renders one person, joins two, read locally?)
+STYLES = {
+    'terse': (lambda p: f"{p['first_name']}, {p['age']}, {p['gender']}, {p['address']}, likes {_interest_list(p['interests'])}",
+              " vs ", True),
+    'labelled': (lambda p: f"{p['first_name']} {p['last_name']}, {p['age']} years old, {p['gender']}, lives in {p['address']}, "
+                           f"interests: {', '.join(p['interests'])}, within {p['search_radius']} km",
+                 "\n", True),
+    'prose': (lambda p: f"{p['first_name']} is {p['age']}, lives in {p['address']} and enjoys {_interest_list(p['interests'])}.",
+              " What about ", False),
+}
+
+def synthetic_corpus(n: int, seed: int = 5) -> List[Dict]:
+    rng = random.Random(seed)
+    profiles = make_profiles(2 * n, seed=seed)
+    items = []
+    for i in range(n):
+        style = rng.choice(sorted(STYLES))
+        render, separator, local = STYLES[style]
+        pair = profiles[2 * i], profiles[2 * i + 1]
+        expect = {}
+        if local:
+            for suffix, p in zip("12", pair):
+                expect.update({f"first_name{suffix}": p['first_name'], f"age{suffix}": p['age'], f"gender{suffix}": p['gender'],
+                               f"address{suffix}": p['address'], f"interests{suffix}": p['interests']})
+        items.append({'text': separator.join(map(render, pair)), 'local': local, 'expect': expect, 'style': style})
+    return items
+
+def _age(birthday: str) -> int:
+    born, today = date.fromisoformat(birthday), date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+def extracted_fields(request: Dict) -> Dict:
+    fields = {}
+    for suffix in "12":
+        info, location = request[f'personal_info{suffix}'], request[f'location{suffix}']
+        fields.update({
+            f'first_name{suffix}': info['first_name'],
+            f'last_name{suffix}': info['last_name'],
+            f'birthday{suffix}': info['birthday'],
+            f'age{suffix}': _age(info['birthday']) if info['birthday'] else None,
+            f'gender{suffix}': request[f'gender{suffix}'],
+            f'address{suffix}': location['address'],
+            f'search_radius{suffix}': location['search_radius'],
+            f'interests{suffix}': request[f'personal_interests{suffix}'],
+        })
+    return fields
+
+def _matches(expected, actual) -> bool:
+    if isinstance(expected, list):
+        return sorted(expected) == sorted(actual)
+    return expected == actual
+
+def evaluate(items: List[Dict], threshold: float) -> Tuple[Dict, List[str]]:
+    """Counts of local reads, correct ones, wrong routing; plus a line per mistake"""
+    counts = {'prompts': len(items), 'local': 0, 'correct': 0, 'wrong_fields': 0, 'false_local': 0, 'missed_local': 0}
+    mistakes = []
+    for item in items:
+        extraction = extract_match_request(item['text'])
+        local = extraction.confidence >= threshold
+        if local and not item['local']:
+            counts['false_local'] += 1
+            mistakes.append(f"read locally, should go to the LLM: {item['text'][:70]!r}")
+        elif item['local'] and not local:
+            counts['missed_local'] += 1
+            mistakes.append(f"sent to the LLM (confidence {extraction.confidence}, missing {extraction.missing}): {item['text'][:70]!r}")
+        if not local:
+            continue
+        counts['local'] += 1
+        fields = extracted_fields(extraction.request)
+        wrong = [key for key, value in item.get('expect', {}).items() if not _matches(value, fields[key])]
+        if wrong:
+            counts['wrong_fields'] += 1
+            mistakes.append(f"wrong {', '.join(wrong)}: {item['text'][:70]!r}")
+        elif item['local']:
+            counts['correct'] += 1
+    return counts, mistakes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller synthetic corpus, shorter timing runs")
+    parser.add_argument("--llm-ms", type=float, default=2000.0, help="LLM round trip assumed for prompts not read locally")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("LOVEFI_EXTRACTOR_CONFIDENCE", "0.95")),
+                        help="confidence at which a prompt is read locally (the agent's LOVEFI_EXTRACTOR_CONFIDENCE)")
+    parser.add_argument("--out", help="result file (default benchmarks/results/extractor-<commit>.json)")
+    args = parser.parse_args()
+    min_time = 0.05 if args.quick else 0.2
+
+    corpora = {'corpus': load_corpus(), 'synthetic': synthetic_corpus(200 if args.quick else 2000)}
+    results = []
+    for name, items in corpora.items():
+        counts, mistakes = evaluate(items, args.threshold)
+        texts = [item['text'] for item in items]
+        result = measure(f"extract/{name}", lambda: [extract_match_request(text) for text in texts],
+                         pairs_per_op=len(texts), min_time=min_time)
+        extract_ms = result['ns_per_op'] / len(texts) / 1e6
+        hit_rate = counts['local'] / counts['prompts']
+        # Mean latency per prompt before the match is scored
+        with_extractor_ms = extract_ms + (1 - hit_rate) * args.llm_ms
+        result.update(counts, hit_rate=hit_rate, extract_ms=extract_ms, always_llm_ms=args.llm_ms,
+                      with_extractor_ms=with_extractor_ms, saved_ms=args.llm_ms - with_extractor_ms)
+        results.append(result)
+        for mistake in mistakes[:10]:
+            print(f"{name}: {mistake}")
+
+    print_results(results)
+    print(f"\n{'corpus':<12} {'prompts':>8} {'local':>7} {'hit rate':>9} {'correct':>8} {'wrong':>6} {'false':>6} "
+          f"{'missed':>7} {'extract us':>11} {'saved ms':>9}")
+    for r in results:
+        print(f"{r['name'].split('/')[1]:<12} {r['prompts']:>8} {r['local']:>7} {r['hit_rate']:>9.1%} {r['correct']:>8} "
+              f"{r['wrong_fields']:>6} {r['false_local']:>6} {r['missed_local']:>7} {r['extract_ms'] * 1000:>11.1f} "
+              f"{r['saved_ms']:>9.1f}")
+    print(f"\nSaved: mean latency per prompt vs always calling the LLM ({args.llm_ms:.0f} ms round trip)")
+    path = save_results("extractor", {'min_time': min_time, 'llm_ms': args.llm_ms, 'threshold': args.threshold}, results, args.out)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+Offline load test of the two match entry points with synthetic profile pairs.
+
+  submit  the FastAPI /submit route, driven in-process through an ASGI
+          transport (or over HTTP with --url), all requests through one
+          httpx client and its connection pool
+  agent   the dating match agent's MatchRequest handler, run in a uAgents
+          Bureau next to a load-generator agent. Messages are dispatched
+          in-process, and each request waits for its MatchResponse in its
+          own session.
+
+Geocoding goes through the stub backend from common.py, so no request leaves
+the machine. Load is either closed-loop (--concurrency requests in flight,
+each sent as soon as the previous one finishes) or open-loop (--rate
+requests per second, capped at --concurrency in flight). Open-loop latency
+counts from the scheduled send time, so queueing behind a slow server shows
+up in the percentiles instead of lowering the offered load.
+
+Each target reports p50/p95/p99/max latency, throughput and error rate. Every
+pair is distinct by default, so the score cache only helps with --pairs
+smaller than --requests.
+
+    python benchmarks/bench_load.py [--target submit --target agent] [--requests 2000]
+                                    [--concurrency 32] [--rate 0] [--pairs N] [--url http://localhost:8000]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import AGENTS_DIR, make_profiles, save_results, to_agent_kwargs, to_matcher_profile, use_stub_geocoder
+
+TARGETS = ["submit", "agent"]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+async def run_load(send: Callable[[int], Awaitable[bool]], requests: int, concurrency: int, rate: float) -> Dict:
+    """Call send(i) for i in range(requests); send returns whether the request succeeded"""
+    latencies: List[float] = []
+    errors = 0
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, scheduled: float) -> None:
+        nonlocal errors
+        try:
+            ok = await send(i)
+        except Exception:
+            ok = False
+        finally:
+            slots.release()
+        if ok:
+            latencies.append(time.perf_counter() - scheduled)
+        else:
+            errors += 1
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(requests):
+        scheduled = start + i / rate if rate > 0 else None
+        if scheduled is not None and scheduled > time.perf_counter():
+            await asyncio.sleep(scheduled - time.perf_counter())
+        await slots.acquire()
+        tasks.append(asyncio.create_task(one(i, scheduled if scheduled is not None else time.perf_counter())))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'ok': len(latencies),
+        'errors': errors,
+        'error_rate': errors / requests if requests else 0.0,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(latencies) / elapsed if elapsed else float('inf'),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000 if latencies else float('nan'),
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else float('nan'),
+    }
+
+def profile_pairs(count: int, seed: int = 11):
+    profiles = make_profiles(count + 1, seed=seed)
+    return list(zip(profiles, profiles[1:]))
+
+async def load_submit(args, pairs) -> Dict:
+    import httpx
+
+    bodies = [
+        json.dumps({
+            'version': 1, 'sender': f"agent1qload{i}", 'session': f"load-{i}", 'expires': 0, 'nonce': i,
+            'payload': base64.b64encode(json.dumps({
+                'profile1': to_matcher_profile(p1), 'profile2': to_matcher_profile(p2)
+            }).encode()).decode(),
+        }).encode()
+        for i, (p1, p2) in enumerate(pairs)
+    ]
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout)
+    else:
+        sys.path.append(os.path.join(AGENTS_DIR, 'api'))
+        from index import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=args.timeout)
+
+    async def send(i: int) -> bool:
+        response = await client.post("/submit", content=bodies[i % len(bodies)],
+                                     headers={"content-type": "application/json"})
+        return response.status_code == 200 and 'payload' in response.json()
+
+    async with client:
+        return await run_load(send, args.requests, args.concurrency, args.rate)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def load_agent(args, pairs) -> Dict:
+    from uagents import Agent, Bureau
+    import dating_match_agent as target
+
+    requests = [
+        target.MatchRequest(**{f"{key}1": value for key, value in to_agent_kwargs(p1, target).items()},
+                            **{f"{key}2": value for key, value in to_agent_kwargs(p2, target).items()})
+        for p1, p2 in pairs
+    ]
+    generator = Agent(name="load_generator", seed="lovefi_load_generator_seed")
+    bureau = Bureau(agents=[target.agent, generator], port=_free_port(), loop=asyncio.get_running_loop(),
+                    log_level=logging.WARNING)
+    for agent in (target.agent, generator):
+        # The agent logs every request at INFO, which would dominate the measurement
+        logging.getLogger(agent.name).setLevel(logging.WARNING)
+        agent._logger.setLevel(logging.WARNING)
+    asyncio.create_task(bureau.run_async())
+    await asyncio.sleep(0.5)
+
+    async def send(i: int) -> bool:
+        # A fresh context per request, so each response is awaited in its own session
+        ctx = generator._build_context()
+        response, status = await ctx.send_and_receive(
+            target.agent.address, requests[i % len(requests)], response_type=target.MatchResponse, timeout=args.timeout
+        )
+        return response is not None and response.score >= 0
+
+    # The Bureau cancels every other task on its loop when it shuts down, including one
+    # awaiting it, so it is left running here and torn down by asyncio.run afterwards
+    return await run_load(send, args.requests, args.concurrency, args.rate)
+
+LOADERS = {'submit': load_submit, 'agent': load_agent}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", choices=TARGETS, help="entry point to load (repeatable; default all)")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per target")
+    parser.add_argument("--concurrency", type=int, default=32, help="most requests in flight at once")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second to offer (0: closed loop)")
+    parser.add_argument("--pairs", type=int, help="distinct profile pairs, cycled (default: one per request)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--url", help="load a running API server at this base URL instead of the in-process app")
+    parser.add_argument("--quick", action="store_true", help="200 requests per target")
+    parser.add_argument("--out", help="result file (default benchmarks/results/load-<commit>.json)")
+    args = parser.parse_args()
+    if args.quick:
+        args.requests = min(args.requests, 200)
+    if args.concurrency < 1 or args.requests < 1:
+        parser.error("--requests and --concurrency must be at least 1")
+
+    use_stub_geocoder()
+    pairs = profile_pairs(args.pairs or args.requests)
+    results = []
+    for target in args.target or TARGETS:
+        stats = asyncio.run(LOADERS[target](args, pairs))
+        # ns_per_op is the median latency, so compare.py can flag regressions
+        results.append(dict(stats, name=f"load/{target}", ns_per_op=stats['p50_ms'] * 1e6))
+
+    print(f"{'target':<14} {'requests':>9} {'errors':>7} {'err %':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for r in results:
+        print(f"{r['name']:<14} {r['requests']:>9} {r['errors']:>7} {r['error_rate'] * 100:>6.2f} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}")
+    params = {'requests': args.requests, 'concurrency': args.concurrency, 'rate': args.rate,
+              'pairs': args.pairs or args.requests, 'url': args.url}
+    path = save_results("load", params, results, args.out)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
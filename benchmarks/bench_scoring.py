@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmarks for the scoring implementations, fully offline.
+
+Scorers:
+  internal       dating_match_agent.calculate_match_score_internal (40/20/20/20, birthdays)
+  simple         dating_match_agent.calculate_match_score_simple (40/20/20/20, direct ages)
+  compatibility  lovefi-agents CompatibilityAnalyzer pipeline (compatibility.score_profiles)
+  batch          batch_scoring.score_candidates, the vectorized 40/20/20/20 path (1-vs-N and N-vs-N only)
+
+Each is run pairwise, one profile against N candidates, and all pairs of M
+profiles. Results are printed and written as JSON; compare two runs with
+benchmarks/compare.py.
+
+    python benchmarks/bench_scoring.py [--n 1000] [--m 100] [--quick] [--only compatibility]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import (PREFERENCE_QUESTIONS, make_profiles, measure, print_results, save_results, to_agent_kwargs,
+                    to_matcher_profile, use_stub_geocoder)
+
+from batch_scoring import CandidateTable, QueryProfile, score_candidates
+from compatibility import score_profiles
+from geocoding import get_coordinates
+
+try:
+    import dating_match_agent
+except ImportError:
+    # uagents is not installed; the agent scorers are skipped
+    dating_match_agent = None
+
+SCORERS = ["internal", "simple", "compatibility", "batch"]
+
+def agent_args(side):
+    return (side['personal_info'], side['gender'], side['location'], side['personal_interests'], side['partner_preferences'])
+
+def pair_scorers():
+    """name -> (prepare(profile) -> side, score(side1, side2))"""
+    scorers = {
+        'compatibility': (to_matcher_profile, score_profiles),
+    }
+    if dating_match_agent is not None:
+        def internal(side1, side2):
+            return dating_match_agent.calculate_match_score_internal(*agent_args(side1), *agent_args(side2))
+
+        def simple(side1, side2):
+            return dating_match_agent.calculate_match_score_simple(
+                side1['age'], side2['age'], side1['personal_interests'], side2['personal_interests'],
+                side1['location'], side2['location'], side1['partner_preferences'], side2['partner_preferences'],
+                10, 10
+            )
+
+        def prepare(profile):
+            return dict(to_agent_kwargs(profile, dating_match_agent), age=profile['age'])
+
+        scorers['internal'] = (prepare, internal)
+        scorers['simple'] = (prepare, simple)
+    return scorers
+
+def query_profile(profile):
+    return QueryProfile(
+        profile['age'], get_coordinates(profile['address']), profile['search_radius'], profile['address'],
+        profile['interests'], [options[i] for (_, _, options), i in zip(PREFERENCE_QUESTIONS, profile['preferences'])]
+    )
+
+def run(n: int, m: int, only, min_time: float):
+    use_stub_geocoder()
+    profiles = make_profiles(max(n + 1, m, 64), seed=42)
+    query, candidates = profiles[0], profiles[1:n + 1]
+    group = profiles[:m]
+    results = []
+
+    for name, (prepare, score) in pair_scorers().items():
+        if only and name not in only:
+            continue
+        sides = [prepare(p) for p in profiles[:64]]
+        pairs = itertools.cycle(list(zip(sides, sides[1:] + sides[:1])))
+
+        def pairwise():
+            side1, side2 = next(pairs)
+            return score(side1, side2)
+
+        query_side = prepare(query)
+        candidate_sides = [prepare(p) for p in candidates]
+
+        def one_vs_n():
+            for side in candidate_sides:
+                score(query_side, side)
+
+        group_sides = [prepare(p) for p in group]
+
+        def n_vs_n():
+            for side1, side2 in itertools.combinations(group_sides, 2):
+                score(side1, side2)
+
+        results.append(measure(f"{name}/pairwise", pairwise, min_time=min_time))
+        results.append(measure(f"{name}/1-vs-{n}", one_vs_n, pairs_per_op=n, min_time=min_time, repeat=3, alloc_ops=2))
+        results.append(measure(f"{name}/{m}-vs-{m}", n_vs_n, pairs_per_op=m * (m - 1) // 2, min_time=min_time,
+                               repeat=3, alloc_ops=2))
+
+    if not only or 'batch' in only:
+        # Features are derived once, as the candidate pool does at registration
+        query_features = query_profile(query)
+        table = CandidateTable.from_profiles([p['id'] for p in candidates], [query_profile(p) for p in candidates])
+        group_features = [query_profile(p) for p in group]
+        group_table = CandidateTable.from_profiles([p['id'] for p in group], group_features)
+
+        def batch_one_vs_n():
+            score_candidates(query_features, table)
+
+        def batch_n_vs_n():
+            # Row i is scored against rows i+1.., the same pairs as combinations()
+            for i, features in enumerate(group_features[:-1]):
+                score_candidates(features, group_table.take(slice(i + 1, None)))
+
+        results.append(measure(f"batch/1-vs-{n}", batch_one_vs_n, pairs_per_op=n, min_time=min_time))
+        results.append(measure(f"batch/{m}-vs-{m}", batch_n_vs_n, pairs_per_op=m * (m - 1) // 2, min_time=min_time,
+                               repeat=3, alloc_ops=2))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1000, help="candidates in the 1-vs-N case")
+    parser.add_argument("--m", type=int, default=100, help="profiles in the N-vs-N case")
+    parser.add_argument("--only", action="append", choices=SCORERS, help="run only these scorers (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes and shorter timing runs")
+    parser.add_argument("--out", help="result file (default benchmarks/results/scoring-<commit>.json)")
+    args = parser.parse_args()
+
+    n, m, min_time = (100, 30, 0.05) if args.quick else (args.n, args.m, 0.2)
+    if dating_match_agent is None:
+        print("uagents is not installed: skipping the internal and simple scorers")
+    results = run(n, m, args.only, min_time)
+    print_results(results)
+    path = save_results("scoring", {'n': n, 'm': m, 'min_time': min_time, 'only': args.only}, results, args.out)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+Per-request cost of the /api/submit scoring path: the legacy handler body,
+which rebuilt the analyzer class and its tables on every POST, against the
+shared module-level engine in compatibility.py. Both run on the same
+envelopes (base64 payload decode, scoring, reply envelope encode) so the
+difference is the per-request construction overhead. A batch envelope of
+BATCH_SIZE pairs shows the per-pair cost once envelope handling is shared.
+
+    python benchmarks/bench_submit.py [--quick]
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import AGENTS_DIR, make_profiles, measure, print_results, save_results, to_matcher_profile
+
+sys.path.append(os.path.join(AGENTS_DIR, 'api'))
+from index import score_envelope
+from legacy_submit import legacy_score_envelope
+
+# Pairs in the single-envelope batch case
+BATCH_SIZE = 1000
+
+def make_envelopes(count: int):
+    profiles = [to_matcher_profile(p) for p in make_profiles(count + 1, seed=7)]
+    return [
+        {
+            'version': 1, 'sender': f"agent1qsender{i}", 'session': f"session-{i}", 'expires': 0, 'nonce': i,
+            'payload': base64.b64encode(json.dumps({'profile1': p1, 'profile2': p2}).encode()).decode(),
+        }
+        for i, (p1, p2) in enumerate(zip(profiles, profiles[1:]))
+    ]
+
+def make_batch_envelope(count: int):
+    """One envelope scoring `count` pairs over a shared profile table"""
+    profiles = [to_matcher_profile(p) for p in make_profiles(count + 1, seed=7)]
+    payload = {'profiles': profiles, 'index_pairs': [[i, i + 1] for i in range(count)]}
+    return {'version': 1, 'sender': "agent1qsender", 'session': "batch", 'expires': 0, 'nonce': 0,
+            'payload': base64.b64encode(json.dumps(payload).encode()).decode()}
+
+def check_same_results(envelopes) -> None:
+    """Both paths must produce the same reply before their timings are comparable"""
+    for body in envelopes:
+        legacy = json.loads(base64.b64decode(legacy_score_envelope(body)['payload']))
+        shared = json.loads(base64.b64decode(json.loads(score_envelope(body))['payload']))
+        for payload in (legacy, shared):
+            payload['compatibility_factors']['interests']['common_categories'].sort()
+        assert legacy == shared, (legacy, shared)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="shorter timing runs")
+    parser.add_argument("--out", help="result file (default benchmarks/results/submit-<commit>.json)")
+    args = parser.parse_args()
+    min_time = 0.05 if args.quick else 0.2
+
+    envelopes = make_envelopes(64)
+    check_same_results(envelopes)
+
+    legacy_bodies = itertools.cycle(envelopes)
+    shared_bodies = itertools.cycle(envelopes)
+    results = [
+        measure("submit/legacy", lambda: legacy_score_envelope(next(legacy_bodies)), min_time=min_time),
+        measure("submit/shared", lambda: score_envelope(next(shared_bodies)), min_time=min_time),
+    ]
+    batch = make_batch_envelope(BATCH_SIZE)
+    results.append(measure(f"submit/batch-{BATCH_SIZE}", lambda: score_envelope(batch), pairs_per_op=BATCH_SIZE,
+                           min_time=min_time, repeat=3, alloc_ops=2))
+    print_results(results)
+    legacy, shared = results[:2]
+    overhead = legacy['ns_per_op'] - shared['ns_per_op']
+    print(f"\nPer-request overhead removed: {overhead:,.0f} ns ({overhead / legacy['ns_per_op']:.0%} of the legacy path)")
+    path = save_results("submit", {'min_time': min_time}, results, args.out)
+    print(f"Results written to {path}")
+
+if __name__ == "__main__":
+    main()
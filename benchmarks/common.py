@@ -0,0 +1,201 @@
+"""
+Shared helpers for the offline benchmarks: import paths, a stub geocoder,
+synthetic profiles, the measurement loop and JSON result files.
+"""
+
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOVEFI_DIR = os.path.join(ROOT, 'lovefi')
+AGENTS_DIR = os.path.join(ROOT, 'lovefi-agents')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+sys.path.extend([LOVEFI_DIR, AGENTS_DIR])
+
+from geocoders import Geocoder
+from geocoding import GeocodeCache, set_geocode_cache, set_geocoders
+
+# Cities the synthetic profiles live in; the last one is unknown to the stub
+# geocoder so the string-similarity fallback is exercised too
+CITIES = [
+    ("New York", 40.7128, -74.0060),
+    ("Brooklyn, New York", 40.6782, -73.9442),
+    ("Los Angeles, California", 34.0522, -118.2437),
+    ("San Francisco, California", 37.7749, -122.4194),
+    ("Chicago", 41.8781, -87.6298),
+    ("Houston, Texas", 29.7604, -95.3698),
+    ("Austin, Texas", 30.2672, -97.7431),
+    ("Miami, Florida", 25.7617, -80.1918),
+    ("Atlantis", None, None),
+]
+
+INTERESTS = [
+    "hiking", "camping", "running", "surfing", "art", "music", "photography", "writing",
+    "reading", "chess", "philosophy", "science", "dancing", "volunteering", "cooking", "wine tasting",
+    "restaurants", "gym", "yoga", "martial arts", "programming", "gaming", "AI", "blockchain",
+    "travel", "movies", "gardening", "astronomy",
+]
+
+PREFERENCE_QUESTIONS = [
+    ("lifestyle", "Weekend plans?", ["Homebody", "Night owl", "Outdoors"]),
+    ("lifestyle", "Travel style?", ["Nomad", "Planner", "Staycation"]),
+    ("values", "Kids?", ["Want", "Don't want", "Open"]),
+    ("values", "Pets?", ["Dog", "Cat", "None"]),
+]
+
+class StubGeocoder(Geocoder):
+    """Answers from the CITIES table so no benchmark touches the network"""
+
+    name = "stub"
+
+    def __init__(self):
+        self._coordinates = {name: (lat, lon) for name, lat, lon in CITIES}
+
+    def geocode(self, address):
+        return self._coordinates.get(address, (None, None))
+
+def use_stub_geocoder() -> None:
+    set_geocoders([StubGeocoder()])
+    set_geocode_cache(GeocodeCache(path=""))
+
+def make_profiles(n: int, seed: int = 0) -> List[Dict]:
+    """Deterministic synthetic people, as plain dicts (see to_agent_kwargs / to_matcher_profile)"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    profiles = []
+    for i in range(n):
+        age = rng.randint(20, 50)
+        city = rng.choice(CITIES)[0]
+        profiles.append({
+            'id': f"p{i}",
+            'first_name': f"First{i}",
+            'last_name': f"Last{i}",
+            'gender': rng.choice(["female", "male", "non-binary"]),
+            'age': age,
+            'birthday': today.replace(year=today.year - age, day=1).isoformat(),
+            'address': city,
+            'search_radius': rng.choice([10, 25, 50, 100]),
+            'interests': rng.sample(INTERESTS, rng.randint(1, 8)),
+            'preferences': [rng.randrange(len(options)) for _, _, options in PREFERENCE_QUESTIONS],
+        })
+    return profiles
+
+def to_agent_kwargs(profile: Dict, models) -> Dict:
+    """Arguments of dating_match_agent's scorers for one side, built from its message models"""
+    return {
+        'personal_info': models.PersonalInfo(
+            first_name=profile['first_name'], last_name=profile['last_name'], birthday=profile['birthday']
+        ),
+        'gender': profile['gender'],
+        'location': models.Location(address=profile['address'], search_radius=profile['search_radius']),
+        'personal_interests': profile['interests'],
+        'partner_preferences': [
+            models.Preference(category=category, question=question, options=options,
+                              selected_index=index, selected_option=options[index])
+            for (category, question, options), index in zip(PREFERENCE_QUESTIONS, profile['preferences'])
+        ],
+    }
+
+def to_matcher_profile(profile: Dict) -> Dict:
+    """The profile dict lovefi-agents' CompatibilityAnalyzer pipeline takes"""
+    return {'age': profile['age'], 'interests': profile['interests'], 'location': profile['address'], 'name': profile['first_name']}
+
+def measure(name: str, fn: Callable[[], object], pairs_per_op: int = 1, min_time: float = 0.2,
+            repeat: int = 5, alloc_ops: int = 20) -> Dict:
+    """Time fn like timeit (best of `repeat` auto-sized runs) and trace its allocations.
+
+    Allocations are measured in a separate pass because tracemalloc slows the
+    interpreter down: `alloc_peak_bytes` is the peak extra memory held while
+    one op runs, `alloc_blocks_per_op` the net number of memory blocks
+    allocated per op (both from tracemalloc).
+    """
+    fn()
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9 or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time * 1e9 / elapsed) + 1))
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        timings = [elapsed]
+        for _ in range(repeat - 1):
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                fn()
+            timings.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    ns_per_op = min(timings) / number
+
+    tracemalloc.start()
+    try:
+        fn()
+        blocks_before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        for _ in range(alloc_ops - 1):
+            fn()
+        blocks_after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'name': name,
+        'ops': number * repeat,
+        'ns_per_op': ns_per_op,
+        'ops_per_sec': 1e9 / ns_per_op if ns_per_op else float('inf'),
+        'pairs_per_sec': pairs_per_op * 1e9 / ns_per_op if ns_per_op else float('inf'),
+        'alloc_peak_bytes': peak - base,
+        'alloc_blocks_per_op': (blocks_after - blocks_before) / alloc_ops,
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(suite: str, params: Dict, results: List[Dict], out: Optional[str] = None) -> str:
+    """Write one run to benchmarks/results/<suite>-<commit>.json (or `out`) and return the path"""
+    commit = git_commit()
+    document = {
+        'suite': suite,
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{suite}-{commit or 'nogit'}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+    return out
+
+def print_results(results: List[Dict]) -> None:
+    print(f"{'benchmark':<36} {'ns/op':>14} {'ops/s':>12} {'pairs/s':>12} {'peak KiB':>10} {'blocks/op':>10}")
+    for r in results:
+        print(f"{r['name']:<36} {r['ns_per_op']:>14,.0f} {r['ops_per_sec']:>12,.1f} {r['pairs_per_sec']:>12,.0f} "
+              f"{r['alloc_peak_bytes'] / 1024:>10.1f} {r['alloc_blocks_per_op']:>10.1f}")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""
+Compare two benchmark result files and flag regressions.
+
+    python benchmarks/compare.py benchmarks/results/scoring-abc123.json benchmarks/results/scoring-def456.json
+
+Exits with status 1 when any benchmark's ns/op grew by more than --threshold percent.
+"""
+
+import argparse
+import json
+import sys
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    base_results = {r['name']: r for r in base['results']}
+    print(f"{base.get('commit')} -> {new.get('commit')}")
+    print(f"{'benchmark':<36} {'base ns/op':>14} {'new ns/op':>14} {'change':>9} {'peak KiB':>17}")
+    regressions = []
+    for result in new['results']:
+        before = base_results.get(result['name'])
+        if before is None:
+            print(f"{result['name']:<36} {'-':>14} {result['ns_per_op']:>14,.0f} {'new':>9}")
+            continue
+        change = (result['ns_per_op'] / before['ns_per_op'] - 1) * 100
+        if 'alloc_peak_bytes' in result and 'alloc_peak_bytes' in before:
+            peak = f"{before['alloc_peak_bytes'] / 1024:.1f} -> {result['alloc_peak_bytes'] / 1024:.1f}"
+        else:
+            peak = "-"
+        flag = " !" if change > args.threshold else ""
+        print(f"{result['name']:<36} {before['ns_per_op']:>14,.0f} {result['ns_per_op']:>14,.0f} {change:>+8.1f}% {peak:>17}{flag}")
+        if flag:
+            regressions.append(result['name'])
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0f}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
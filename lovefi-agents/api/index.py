@@ -1,8 +1,19 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import json
-from typing import List, Dict, Optional, Any
-import base64
+import os
+import sys
+from typing import AsyncIterator, List, Dict, Optional, Any
+
+# Shared modules: compatibility.py sits next to dating_matcher.py, the ranking helpers in ../lovefi
+AGENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.extend([AGENTS_DIR, os.path.join(os.path.dirname(AGENTS_DIR), 'lovefi')])
+
+from compatibility import EncodedInterests, analyze_profiles, encode_interests, register_interests, score_profiles, scoring_fields
+from envelope_codec import EnvelopeError, get_codec
+import metrics
+from score_cache import build_score_cache, cached_score
 
 try:
     from mangum import Mangum
@@ -12,6 +23,103 @@ except ImportError:
 
 app = FastAPI(title="Dating Matcher API")
 
+# Single-pair submits are often retries or refreshes of a pair already scored, in either order
+score_cache = build_score_cache()
+if score_cache is not None:
+    metrics.get_metrics().add_collector("score_cache", metrics.stats_collector("lovefi_score_cache", score_cache.stats))
+
+def _decode_payload(body: Dict) -> Dict:
+    """JSON payload of a uAgent envelope (base64-encoded in 'payload')"""
+    return get_codec().decode_payload(body['payload'])
+
+def _response_envelope(body: Dict, response_payload: Dict) -> bytes:
+    """Serialized reply envelope addressed back to the sender of `body`"""
+    with metrics.timed("serialize"):
+        return get_codec().encode_envelope({
+            "version": 1,
+            "sender": "agent1qlovefi...",  # Your agent address
+            "target": body.get('sender', ''),
+            "session": body.get('session', ''),
+            "schema_digest": "matching_response_schema",
+            "protocol_digest": None,
+            "expires": body.get('expires', 0),
+            "nonce": body.get('nonce', 0),
+            "signature": None
+        }, response_payload)
+
+def _score_item(profile1: Dict, profile2: Dict, encoded1: EncodedInterests, encoded2: EncodedInterests,
+                details: bool) -> Dict:
+    if details:
+        return score_profiles(profile1, profile2)
+    return {"score": analyze_profiles(profile1, profile2, encoded1, encoded2)['overall_score']}
+
+def _table_profile(table, key) -> Dict:
+    # Negative list indices would silently wrap around
+    if isinstance(table, list) and (not isinstance(key, int) or key < 0):
+        raise IndexError(f"profile index {key!r} out of range")
+    return table[key]
+
+def score_batch(payload_data: Dict) -> Dict:
+    """
+    Score many pairs from one payload, either
+      {"pairs": [{"profile1": {...}, "profile2": {...}}, ...]} or
+      {"profiles": [...] or {"id": {...}}, "index_pairs": [[i, j], ...]}.
+
+    Table profiles are encoded once however many pairs reference them. Results
+    come back in input order; an item that fails gets an "error" entry instead
+    of failing the batch. With "details": true each result is the full
+    score_profiles payload, otherwise just the score.
+    """
+    details = bool(payload_data.get('details', False))
+    if 'index_pairs' in payload_data:
+        table = payload_data.get('profiles', [])
+        items = payload_data['index_pairs']
+    else:
+        table = None
+        items = payload_data['pairs']
+
+    encoded: Dict[Any, EncodedInterests] = {}
+    # Interests outside the registered vocabulary get bits local to this batch
+    scope: Dict[str, tuple] = {}
+    results = []
+    errors = 0
+    for index, item in enumerate(items):
+        try:
+            if table is None:
+                profile1, profile2 = item['profile1'], item['profile2']
+                pair_scope: Dict[str, tuple] = {}
+                encoded1 = encode_interests(profile1.get('interests', []), pair_scope)
+                encoded2 = encode_interests(profile2.get('interests', []), pair_scope)
+            else:
+                key1, key2 = item
+                profile1, profile2 = _table_profile(table, key1), _table_profile(table, key2)
+                for key, profile in ((key1, profile1), (key2, profile2)):
+                    if key not in encoded:
+                        encoded[key] = encode_interests(profile.get('interests', []), scope)
+                encoded1, encoded2 = encoded[key1], encoded[key2]
+            result = _score_item(profile1, profile2, encoded1, encoded2, details)
+        except Exception as e:
+            errors += 1
+            result = {"error": f"{type(e).__name__}: {e}"}
+        results.append(dict(result, index=index))
+    return {"results": results, "count": len(results), "errors": errors}
+
+def score_envelope(body: Dict) -> Optional[bytes]:
+    """Score the profile pair(s) in a matching-request envelope; None if it carries none"""
+    if 'payload' not in body:
+        return None
+    with metrics.timed("parse"):
+        payload_data = _decode_payload(body)
+    if 'pairs' in payload_data or 'index_pairs' in payload_data:
+        return _response_envelope(body, score_batch(payload_data))
+    if 'profile1' not in payload_data or 'profile2' not in payload_data:
+        return None
+    # Same scoring engine and cache setup as dating_matcher.py
+    profile1, profile2 = payload_data['profile1'], payload_data['profile2']
+    result = cached_score(score_cache, scoring_fields(profile1), scoring_fields(profile2),
+                          lambda: score_profiles(profile1, profile2))
+    return _response_envelope(body, result)
+
 @app.post("/api/submit")
 @app.post("/submit")
 async def handle_agent_message(request: Request):
@@ -19,215 +127,207 @@ async def handle_agent_message(request: Request):
     Handle incoming uAgent messages
     """
     try:
-        body = await request.json()
-        
-        # Extract payload from uAgent envelope
-        if 'payload' in body:
-            import base64
-            payload_str = base64.b64decode(body['payload']).decode('utf-8')
-            payload_data = json.loads(payload_str)
-            
-            # Process the matching request
-            if 'profile1' in payload_data and 'profile2' in payload_data:
-                profile1 = payload_data['profile1']
-                profile2 = payload_data['profile2']
-                
-                # Import the enhanced compatibility analyzer
-                from typing import List, Dict
-                
-                class CompatibilityAnalyzer:
-                    @staticmethod
-                    def analyze_interests(interests1: List[str], interests2: List[str]) -> Dict:
-                        interest_categories = {
-                            'outdoor': ['hiking', 'camping', 'climbing', 'running', 'cycling', 'surfing', 'skiing'],
-                            'creative': ['art', 'music', 'writing', 'photography', 'painting', 'drawing', 'crafts'],
-                            'intellectual': ['reading', 'chess', 'debate', 'learning', 'philosophy', 'science'],
-                            'social': ['dancing', 'parties', 'networking', 'volunteering', 'community'],
-                            'culinary': ['cooking', 'baking', 'wine', 'restaurants', 'food'],
-                            'fitness': ['gym', 'yoga', 'pilates', 'sports', 'martial arts', 'crossfit'],
-                            'tech': ['programming', 'gaming', 'gadgets', 'ai', 'blockchain', 'coding']
-                        }
-                        
-                        def categorize_interests(interests):
-                            categories = {}
-                            for interest in interests:
-                                for category, keywords in interest_categories.items():
-                                    if any(keyword in interest.lower() for keyword in keywords):
-                                        categories.setdefault(category, []).append(interest)
-                            return categories
-                        
-                        cats1 = categorize_interests(interests1)
-                        cats2 = categorize_interests(interests2)
-                        
-                        common_categories = set(cats1.keys()) & set(cats2.keys())
-                        total_categories = set(cats1.keys()) | set(cats2.keys())
-                        
-                        direct_overlap = len(set(interests1) & set(interests2))
-                        semantic_overlap = len(common_categories)
-                        
-                        return {
-                            'direct_matches': direct_overlap,
-                            'semantic_matches': semantic_overlap,
-                            'total_interests': len(set(interests1) | set(interests2)),
-                            'common_categories': list(common_categories),
-                            'compatibility_score': (direct_overlap * 2 + semantic_overlap) / len(total_categories) if total_categories else 0
-                        }
-                    
-                    @staticmethod
-                    def analyze_age_compatibility(age1: int, age2: int) -> Dict:
-                        age_diff = abs(age1 - age2)
-                        
-                        if age_diff <= 2:
-                            compatibility = 1.0
-                            reason = "Very close in age - excellent life stage alignment"
-                        elif age_diff <= 5:
-                            compatibility = 0.8
-                            reason = "Good age compatibility - similar life experiences"
-                        elif age_diff <= 10:
-                            compatibility = 0.6 - (age_diff - 5) * 0.08
-                            reason = "Moderate age gap - some life stage differences"
-                        else:
-                            compatibility = max(0.2, 0.4 - (age_diff - 10) * 0.02)
-                            reason = "Significant age gap - may have different priorities"
-                        
-                        return {
-                            'age_difference': age_diff,
-                            'compatibility_score': compatibility,
-                            'reason': reason,
-                            'life_stage_match': compatibility > 0.7
-                        }
-                    
-                    @staticmethod
-                    def analyze_location(location1: str, location2: str) -> Dict:
-                        loc1_clean = location1.lower().strip()
-                        loc2_clean = location2.lower().strip()
-                        
-                        if loc1_clean == loc2_clean:
-                            return {
-                                'match_type': 'exact',
-                                'compatibility_score': 1.0,
-                                'reason': 'Same location - easy to meet'
-                            }
-                        
-                        major_cities = ['new york', 'los angeles', 'chicago', 'houston', 'phoenix', 'philadelphia']
-                        for city in major_cities:
-                            if city in loc1_clean and city in loc2_clean:
-                                return {
-                                    'match_type': 'same_city',
-                                    'compatibility_score': 0.8,
-                                    'reason': f'Same metropolitan area ({city}) - manageable distance'
-                                }
-                        
-                        states = ['california', 'texas', 'florida', 'new york', 'illinois']
-                        for state in states:
-                            if state in loc1_clean and state in loc2_clean:
-                                return {
-                                    'match_type': 'same_state',
-                                    'compatibility_score': 0.4,
-                                    'reason': f'Same state ({state}) - possible for long-distance'
-                                }
-                        
-                        return {
-                            'match_type': 'different',
-                            'compatibility_score': 0.1,
-                            'reason': 'Different regions - long-distance challenges'
-                        }
-                
-                def generate_recommendations(profile1: Dict, profile2: Dict, compatibility_factors: Dict) -> List[str]:
-                    recommendations = []
-                    
-                    if compatibility_factors['interests']['direct_matches'] > 0:
-                        common_interests = list(set(profile1.get('interests', [])) & set(profile2.get('interests', [])))
-                        recommendations.append(f"Plan activities around shared interests: {', '.join(common_interests[:3])}")
-                    
-                    age_factor = compatibility_factors['age']
-                    if age_factor['life_stage_match']:
-                        recommendations.append("Your similar life stages create great potential for shared goals")
-                    else:
-                        recommendations.append("Embrace the different perspectives your age difference brings")
-                    
-                    location_factor = compatibility_factors['location']
-                    if location_factor['match_type'] == 'exact':
-                        recommendations.append("Being in the same area makes meeting up easy - suggest local date spots")
-                    elif location_factor['match_type'] == 'same_city':
-                        recommendations.append("Explore different neighborhoods together to bridge your local differences")
-                    
-                    return recommendations
-                
-                # Enhanced compatibility analysis using uAgent intelligence
-                analyzer = CompatibilityAnalyzer()
-                
-                age_analysis = analyzer.analyze_age_compatibility(
-                    profile1.get('age', 25), 
-                    profile2.get('age', 25)
-                )
-                
-                interest_analysis = analyzer.analyze_interests(
-                    profile1.get('interests', []), 
-                    profile2.get('interests', [])
-                )
-                
-                location_analysis = analyzer.analyze_location(
-                    profile1.get('location', ''), 
-                    profile2.get('location', '')
-                )
-                
-                # Calculate weighted final score
-                age_weight = 0.25
-                interest_weight = 0.50
-                location_weight = 0.25
-                
-                final_score = (
-                    age_analysis['compatibility_score'] * age_weight * 100 +
-                    interest_analysis['compatibility_score'] * interest_weight * 100 +
-                    location_analysis['compatibility_score'] * location_weight * 100
-                )
-                
-                final_score = max(0, min(100, final_score))
-                
-                compatibility_factors = {
-                    'age': age_analysis,
-                    'interests': interest_analysis,
-                    'location': location_analysis,
-                    'overall_score': final_score
-                }
-                
-                explanation = f"""Compatibility Analysis:
-• Age: {age_analysis['reason']} (Score: {age_analysis['compatibility_score']*100:.0f}/100)
-• Interests: {interest_analysis['direct_matches']} direct matches, {interest_analysis['semantic_matches']} category overlaps (Score: {interest_analysis['compatibility_score']*100:.0f}/100)
-• Location: {location_analysis['reason']} (Score: {location_analysis['compatibility_score']*100:.0f}/100)"""
-                
-                recommendations = generate_recommendations(profile1, profile2, compatibility_factors)
-                
-                # Create enhanced response envelope
-                response_payload = {
-                    "score": final_score,
-                    "explanation": explanation,
-                    "compatibility_factors": compatibility_factors,
-                    "recommendations": recommendations
-                }
-                
-                response_envelope = {
-                    "version": 1,
-                    "sender": "agent1qlovefi...",  # Your agent address
-                    "target": body.get('sender', ''),
-                    "session": body.get('session', ''),
-                    "schema_digest": "matching_response_schema",
-                    "protocol_digest": None,
-                    "payload": base64.b64encode(json.dumps(response_payload).encode()).decode(),
-                    "expires": body.get('expires', 0),
-                    "nonce": body.get('nonce', 0),
-                    "signature": None
-                }
-                
-                return JSONResponse(content=response_envelope, status_code=200)
+        raw = await request.body()
+        with metrics.timed("parse"):
+            body = get_codec().decode_envelope(raw)
+        response_envelope = score_envelope(body)
+        if response_envelope is not None:
+            return Response(content=response_envelope, status_code=200, media_type="application/json")
         
         return JSONResponse(content={"status": "received"}, status_code=200)
         
+    except EnvelopeError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
     except Exception as e:
         print(f"Error processing request: {e}")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose iterator may still be reading the request body.
+
+    The stock class listens for disconnects on ASGI servers older than spec
+    2.4, and that listener would swallow body messages. Here a disconnect
+    surfaces through request.stream() instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+# Longest NDJSON line /api/score-stream buffers before rejecting it
+MAX_STREAM_LINE_BYTES = 1 << 20
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[bytes]]:
+    """Complete lines of each received chunk; an overlong line is replaced by None"""
+    buffer = b""
+    skipping = False
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b"\n")
+        buffer = lines.pop()
+        if skipping and lines:
+            # The rest of the overlong line ends here
+            lines[0], skipping = None, False
+        elif skipping:
+            buffer = b""
+        if len(buffer) > MAX_STREAM_LINE_BYTES:
+            buffer, skipping = b"", True
+        if lines:
+            yield [None if line is not None and len(line) > MAX_STREAM_LINE_BYTES else line for line in lines]
+    if skipping:
+        yield [None]
+    elif buffer.strip():
+        yield [None if len(buffer) > MAX_STREAM_LINE_BYTES else buffer]
+
+def _score_line(line: Optional[bytes], details: bool) -> Optional[Dict]:
+    if line is None:
+        return {"error": f"line longer than {MAX_STREAM_LINE_BYTES} bytes"}
+    if not line.strip():
+        return None
+    try:
+        item = get_codec().loads(line)
+        profile1, profile2 = item['profile1'], item['profile2']
+        result = score_profiles(profile1, profile2) if details else {
+            "score": analyze_profiles(profile1, profile2)['overall_score']
+        }
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    if 'id' in item:
+        result['id'] = item['id']
+    return result
+
+@app.post("/api/score-stream")
+@app.post("/score-stream")
+async def score_stream(request: Request, details: bool = False):
+    """
+    Score NDJSON profile pairs ({"profile1": {...}, "profile2": {...}, "id": ...} per line)
+    as the body arrives, streaming one NDJSON result per pair back in order.
+
+    Lines are scored per received chunk and never collected, so memory stays
+    bounded by the chunk size whatever the batch size. Each result carries its
+    1-based "line" number and the item's "id" if given; bad lines get an
+    "error" entry and the stream continues.
+    """
+    codec = get_codec()
+
+    async def stream():
+        line_number = 0
+        async for lines in _ndjson_lines(request.stream()):
+            out = []
+            for line in lines:
+                line_number += 1
+                result = _score_line(line, details)
+                if result is not None:
+                    result['line'] = line_number
+                    out.append(codec.dumps(result))
+            if out:
+                yield b"\n".join(out) + b"\n"
+    return DuplexStreamingResponse(stream(), media_type="application/x-ndjson")
+
+# Registered candidate profiles and their interest encodings, keyed by candidate id. This is
+# process memory: it only works behind a single long-running server (uvicorn), not on a
+# serverless deploy such as Vercel, where each invocation may land in a fresh instance.
+candidate_pool: Dict[str, tuple[Dict, EncodedInterests]] = {}
+
+async def _json_object(request: Request) -> Optional[Dict]:
+    """The request body as a JSON object, or None if it is not one"""
+    try:
+        body = get_codec().loads(await request.body())
+    except Exception:
+        return None
+    return body if isinstance(body, dict) else None
+
+# Candidates scored between partial results on the streaming top-matches route
+TOP_MATCHES_REPORT_EVERY = 1000
+
+@app.post("/api/pool")
+@app.post("/pool")
+async def register_candidates(request: Request):
+    """
+    Register candidates: {"candidates": [{"id": "...", "profile": {...}}, ...]}
+
+    Single-instance only: the pool lives in this process's memory.
+    """
+    body = await _json_object(request)
+    if body is None:
+        return JSONResponse(content={"error": "body must be a JSON object"}, status_code=400)
+    candidates = body.get('candidates', [])
+    # Checked up front so a bad entry registers nothing
+    if not isinstance(candidates, list) or not all(
+        isinstance(c, dict) and 'id' in c and isinstance(c.get('profile'), dict) for c in candidates
+    ):
+        return JSONResponse(content={"error": "each candidate needs an 'id' and a 'profile' object"}, status_code=400)
+    for candidate in candidates:
+        profile = candidate['profile']
+        candidate_pool[str(candidate['id'])] = (profile, register_interests(profile.get('interests', [])))
+    return {"registered": len(candidates), "pool_size": len(candidate_pool)}
+
+def _scored_candidates(profile: Dict, candidates: List, exclude_id: str):
+    encoded = encode_interests(profile.get('interests', []), {})
+    for candidate_id, (candidate, candidate_encoded) in candidates:
+        if candidate_id == exclude_id:
+            continue
+        factors = analyze_profiles(profile, candidate, encoded, candidate_encoded)
+        yield factors['overall_score'], candidate_id, {
+            'age': factors['age']['compatibility_score'],
+            'interests': factors['interests']['compatibility_score'],
+            'location': factors['location']['compatibility_score'],
+        }
+
+def _top_matches_snapshot(results: List, scanned: int, total: int, done: bool) -> Dict:
+    return {
+        "matches": [
+            {"candidate_id": candidate_id, "score": score, "factors": factors}
+            for score, candidate_id, factors in results
+        ],
+        "scanned": scanned,
+        "total": total,
+        "partial": not done
+    }
+
+@app.post("/api/top-matches")
+@app.post("/top-matches")
+async def top_matches(request: Request):
+    """
+    Rank the candidate pool against one profile: {"profile": {...}, "k": 10, "stream": false, "exclude_id": ""}
+
+    Selection uses a bounded heap over a lazy score stream. With "stream": true
+    the running top k is sent as NDJSON after every TOP_MATCHES_REPORT_EVERY
+    candidates, ending with a line where "partial" is false.
+    """
+    # Only this route ranks, so the heap helpers load on its first call
+    from top_k import iter_top_k
+
+    body = await _json_object(request)
+    if body is None:
+        return JSONResponse(content={"error": "body must be a JSON object"}, status_code=400)
+    k = body.get('k', 10)
+    if not isinstance(k, int) or isinstance(k, bool) or k < 0:
+        return JSONResponse(content={"error": "'k' must be a non-negative integer"}, status_code=400)
+    # Snapshot so concurrent registrations don't disturb the iteration
+    candidates = list(candidate_pool.items())
+    scored = _scored_candidates(body.get('profile', {}), candidates, str(body.get('exclude_id', '')))
+
+    if body.get('stream'):
+        def stream():
+            for results, scanned, done in iter_top_k(scored, k, TOP_MATCHES_REPORT_EVERY):
+                yield json.dumps(_top_matches_snapshot(results, scanned, len(candidates), done)) + "\n"
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    def rank():
+        for results, scanned, done in iter_top_k(scored, k, report_every=0):
+            pass
+        return _top_matches_snapshot(results, scanned, len(candidates), done)
+
+    # Scoring the pool is CPU-bound; a worker thread keeps the event loop serving other requests
+    return JSONResponse(content=await run_in_threadpool(rank), status_code=200)
+
+@app.get("/metrics")
+@app.get("/api/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint; stage timings and fallback counters are recorded with LOVEFI_METRICS=1"""
+    return Response(content=metrics.get_metrics().render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 @app.get("/api")
 async def health_check():
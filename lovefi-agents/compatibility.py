@@ -0,0 +1,343 @@
+import os
+import sys
+from threading import Lock
+from typing import List, Dict, Iterable, NamedTuple, Optional
+
+# The scoring engine is shared with the agents in ../lovefi
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lovefi'))
+
+from scoring_engine import Factor, get_plan, register_factor
+import metrics
+from places import get_place_resolver
+from scoring_table import DEFAULT_PATH as SCORING_TABLE_PATH, load_scoring_table, table_fingerprint
+
+# Interest categories for semantic matching
+INTEREST_CATEGORIES = {
+    'outdoor': ['hiking', 'camping', 'climbing', 'running', 'cycling', 'surfing', 'skiing'],
+    'creative': ['art', 'music', 'writing', 'photography', 'painting', 'drawing', 'crafts'],
+    'intellectual': ['reading', 'chess', 'debate', 'learning', 'philosophy', 'science'],
+    'social': ['dancing', 'parties', 'networking', 'volunteering', 'community'],
+    'culinary': ['cooking', 'baking', 'wine', 'restaurants', 'food'],
+    'fitness': ['gym', 'yoga', 'pilates', 'sports', 'martial arts', 'crossfit'],
+    'tech': ['programming', 'gaming', 'gadgets', 'ai', 'blockchain', 'coding']
+}
+CATEGORY_NAMES = list(INTEREST_CATEGORIES)
+
+# analyze_location's match type, score and reason by the most specific place two locations share.
+# The hierarchy is finer than the scores: neighborhoods and metros score as the same city, and
+# sharing only a country scores as different regions.
+LOCATION_LEVELS = {
+    'neighborhood': ('same_city', 0.8, 'Same metropolitan area ({}) - manageable distance'),
+    'city': ('same_city', 0.8, 'Same metropolitan area ({}) - manageable distance'),
+    'metro': ('same_city', 0.8, 'Same metropolitan area ({}) - manageable distance'),
+    'state': ('same_state', 0.4, 'Same state ({}) - possible for long-distance'),
+}
+
+# Category masks precomputed by scoring_table.py; None if missing or built from other constants
+scoring_table = load_scoring_table(
+    os.environ.get("LOVEFI_SCORING_TABLE", SCORING_TABLE_PATH),
+    table_fingerprint(INTEREST_CATEGORIES)
+)
+
+class EncodedInterests(NamedTuple):
+    """Interest list as bitmasks: one bit per distinct interest, one per category.
+
+    Interests that got no bit because the vocabulary was full are kept as
+    strings in `overflow`; overlaps count both.
+    """
+    interest_mask: int
+    category_mask: int
+    overflow: frozenset = frozenset()
+
+# Registered interests that get their own bit; past this, new ones are compared as strings
+INTEREST_VOCABULARY_MAX = int(os.environ.get("LOVEFI_INTEREST_VOCAB_MAX", "10000"))
+
+class InterestVocabulary:
+    """
+    Interns the interests of registered profiles, computing each one's category
+    mask once. Registered interests take the even bits of the interest mask.
+    Profiles scored ad hoc are encoded against a scope, a dict shared by the
+    profiles compared in one call, that hands out odd bits to interests the
+    vocabulary lacks. Request traffic therefore never grows the vocabulary.
+
+    Once the vocabulary holds `maxsize` interests, interests it lacks get no
+    bit, registered or not: `intern` and `lookup` return a bit of 0 and the
+    encoding keeps them in `overflow`, so they still match exactly.
+    """
+
+    def __init__(self, maxsize: int = INTEREST_VOCABULARY_MAX):
+        # interest -> (interest bit, category mask)
+        self._entries: Dict[str, tuple] = {}
+        self._lock = Lock()
+        self.maxsize = maxsize
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def category_mask(interest: str) -> int:
+        lowered = interest.lower()
+        mask = 0
+        for bit, keywords in enumerate(INTEREST_CATEGORIES.values()):
+            if any(keyword in lowered for keyword in keywords):
+                mask |= 1 << bit
+        return mask
+
+    @classmethod
+    def lookup_category_mask(cls, interest: str) -> int:
+        """Category mask from the precomputed table, computed only for interests it lacks"""
+        if scoring_table is not None:
+            mask = scoring_table.category_mask(interest.lower())
+            if mask is not None:
+                return mask
+        return cls.category_mask(interest)
+
+    def intern(self, interest: str) -> tuple:
+        entry = self._entries.get(interest)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(interest)
+                if entry is None:
+                    if self.full:
+                        metrics.inc("lovefi_fallback_total", path="interest_vocabulary_full")
+                        return 0, self.lookup_category_mask(interest)
+                    entry = (1 << 2 * len(self._entries), self.lookup_category_mask(interest))
+                    self._entries[interest] = entry
+        return entry
+
+    @property
+    def full(self) -> bool:
+        return len(self._entries) >= self.maxsize
+
+    def lookup(self, interest: str, scope: Dict[str, tuple]) -> tuple:
+        entry = self._entries.get(interest)
+        if entry is None:
+            entry = scope.get(interest)
+            if entry is None:
+                # Registered profiles hold such interests in `overflow` once the vocabulary is full
+                bit = 0 if self.full else 1 << 2 * len(scope) + 1
+                entry = scope[interest] = (bit, self.lookup_category_mask(interest))
+        return entry
+
+    def encode(self, interests: Iterable[str], scope: Optional[Dict[str, tuple]] = None) -> EncodedInterests:
+        """Interns new interests without a scope; with one, leaves the vocabulary as it is"""
+        interest_mask = category_mask = 0
+        overflow = set()
+        for interest in interests:
+            bit, categories = self.intern(interest) if scope is None else self.lookup(interest, scope)
+            if bit:
+                interest_mask |= bit
+            else:
+                overflow.add(interest)
+            category_mask |= categories
+        return EncodedInterests(interest_mask, category_mask, frozenset(overflow))
+
+interest_vocabulary = InterestVocabulary()
+
+def register_interests(interests: Iterable[str]) -> EncodedInterests:
+    """Encode a registered profile once, adding its new interests to the shared vocabulary"""
+    return interest_vocabulary.encode(interests)
+
+def encode_interests(interests: Iterable[str], scope: Dict[str, tuple]) -> EncodedInterests:
+    """Encode a profile without growing the vocabulary; profiles compared with each other share `scope`"""
+    return interest_vocabulary.encode(interests, scope)
+
+class CompatibilityAnalyzer:
+    """Advanced compatibility analysis using uAgent's native intelligence"""
+    
+    @staticmethod
+    def analyze_interests(interests1: List[str], interests2: List[str]) -> Dict:
+        """Analyze interest compatibility with semantic grouping"""
+        scope: Dict[str, tuple] = {}
+        return CompatibilityAnalyzer.analyze_encoded_interests(encode_interests(interests1, scope),
+                                                               encode_interests(interests2, scope))
+    
+    @staticmethod
+    def analyze_encoded_interests(encoded1: EncodedInterests, encoded2: EncodedInterests) -> Dict:
+        """Interest compatibility from precomputed masks; overlaps are popcounts"""
+        common_categories = encoded1.category_mask & encoded2.category_mask
+        total_categories = encoded1.category_mask | encoded2.category_mask
+        
+        direct_overlap = ((encoded1.interest_mask & encoded2.interest_mask).bit_count()
+                          + len(encoded1.overflow & encoded2.overflow))
+        semantic_overlap = common_categories.bit_count()
+        
+        return {
+            'direct_matches': direct_overlap,
+            'semantic_matches': semantic_overlap,
+            'total_interests': ((encoded1.interest_mask | encoded2.interest_mask).bit_count()
+                                + len(encoded1.overflow | encoded2.overflow)),
+            'common_categories': [name for bit, name in enumerate(CATEGORY_NAMES) if common_categories >> bit & 1],
+            'compatibility_score': (direct_overlap * 2 + semantic_overlap) / total_categories.bit_count() if total_categories else 0
+        }
+    
+    @staticmethod
+    def analyze_age_compatibility(age1: int, age2: int) -> Dict:
+        """Advanced age compatibility analysis"""
+        age_diff = abs(age1 - age2)
+        
+        # Optimal age ranges based on psychological research
+        if age_diff <= 2:
+            compatibility = 1.0
+            reason = "Very close in age - excellent life stage alignment"
+        elif age_diff <= 5:
+            compatibility = 0.8
+            reason = "Good age compatibility - similar life experiences"
+        elif age_diff <= 10:
+            compatibility = 0.6 - (age_diff - 5) * 0.08
+            reason = "Moderate age gap - some life stage differences"
+        else:
+            compatibility = max(0.2, 0.4 - (age_diff - 10) * 0.02)
+            reason = "Significant age gap - may have different priorities"
+        
+        return {
+            'age_difference': age_diff,
+            'compatibility_score': compatibility,
+            'reason': reason,
+            'life_stage_match': compatibility > 0.7
+        }
+    
+    @staticmethod
+    def analyze_location(location1: str, location2: str) -> Dict:
+        """Enhanced location compatibility analysis"""
+        loc1_clean = location1.lower().strip()
+        loc2_clean = location2.lower().strip()
+        
+        if loc1_clean == loc2_clean:
+            return {
+                'match_type': 'exact',
+                'compatibility_score': 1.0,
+                'reason': 'Same location - easy to meet'
+            }
+        
+        # Both locations resolve once (cached) to places; compare the most specific level they share
+        resolver = get_place_resolver()
+        place1, place2 = resolver.resolve(location1), resolver.resolve(location2)
+        if place1 is None or place2 is None:
+            metrics.inc("lovefi_fallback_total", path="unresolved_place")
+        shared = resolver.common_level(place1, place2)
+        if shared is not None and shared[0] in LOCATION_LEVELS:
+            level, place = shared
+            match_type, score, reason = LOCATION_LEVELS[level]
+            return {
+                'match_type': match_type,
+                'compatibility_score': score,
+                'reason': reason.format(place.name.lower())
+            }
+        
+        return {
+            'match_type': 'different',
+            'compatibility_score': 0.1,
+            'reason': 'Different regions - long-distance challenges'
+        }
+
+def generate_recommendations(profile1: Dict, profile2: Dict, compatibility_factors: Dict) -> List[str]:
+    """Generate personalized recommendations using uAgent intelligence"""
+    recommendations = []
+    
+    # Interest-based recommendations
+    if compatibility_factors['interests']['direct_matches'] > 0:
+        common_interests = list(set(profile1.get('interests', [])) & set(profile2.get('interests', [])))
+        recommendations.append(f"Plan activities around shared interests: {', '.join(common_interests[:3])}")
+    
+    # Age-based recommendations
+    age_factor = compatibility_factors['age']
+    if age_factor['life_stage_match']:
+        recommendations.append("Your similar life stages create great potential for shared goals")
+    else:
+        recommendations.append("Embrace the different perspectives your age difference brings")
+    
+    # Location-based recommendations
+    location_factor = compatibility_factors['location']
+    if location_factor['match_type'] == 'exact':
+        recommendations.append("Being in the same area makes meeting up easy - suggest local date spots")
+    elif location_factor['match_type'] == 'same_city':
+        recommendations.append("Explore different neighborhoods together to bridge your local differences")
+    
+    return recommendations
+
+class MatcherSide(NamedTuple):
+    """One profile as the compatibility factors read it"""
+    age: int
+    interests: EncodedInterests
+    location: str
+
+# The CompatibilityAnalyzer methods as scoring_engine factors; weights are in
+# the engine's "compatibility" profile (50/25/25 by default)
+
+@register_factor
+class AgeLifeStage(Factor):
+    name = "age_life_stage"
+
+    def score(self, side1: MatcherSide, side2: MatcherSide):
+        analysis = CompatibilityAnalyzer.analyze_age_compatibility(side1.age, side2.age)
+        return analysis['compatibility_score'], analysis
+
+@register_factor
+class InterestCategories(Factor):
+    name = "interest_categories"
+
+    def score(self, side1: MatcherSide, side2: MatcherSide):
+        analysis = CompatibilityAnalyzer.analyze_encoded_interests(side1.interests, side2.interests)
+        return analysis['compatibility_score'], analysis
+
+@register_factor
+class Place(Factor):
+    name = "place"
+
+    def score(self, side1: MatcherSide, side2: MatcherSide):
+        analysis = CompatibilityAnalyzer.analyze_location(side1.location, side2.location)
+        return analysis['compatibility_score'], analysis
+
+# Key of each factor's analysis in the compatibility_factors payload
+FACTOR_KEYS = {'age_life_stage': 'age', 'interest_categories': 'interests', 'place': 'location'}
+
+def matcher_side(profile: Dict, encoded: Optional[EncodedInterests] = None,
+                 scope: Optional[Dict[str, tuple]] = None) -> MatcherSide:
+    return MatcherSide(
+        profile.get('age', 25),
+        encoded if encoded is not None else encode_interests(profile.get('interests', []), {} if scope is None else scope),
+        profile.get('location', '')
+    )
+
+def analyze_profiles(profile1: Dict, profile2: Dict, encoded1: Optional[EncodedInterests] = None,
+                     encoded2: Optional[EncodedInterests] = None) -> Dict:
+    """Run every analyzer on a profile pair and combine them into the weighted score"""
+    scope: Dict[str, tuple] = {}
+    final_score, results = get_plan("compatibility").score(matcher_side(profile1, encoded1, scope),
+                                                           matcher_side(profile2, encoded2, scope))
+    factors = {FACTOR_KEYS.get(factor.name, factor.name): analysis for factor, _, analysis in results}
+    factors['overall_score'] = final_score
+    return factors
+
+def explain(compatibility_factors: Dict) -> str:
+    """Human-readable summary of the compatibility factors"""
+    age_analysis = compatibility_factors['age']
+    interest_analysis = compatibility_factors['interests']
+    location_analysis = compatibility_factors['location']
+    return f"""Compatibility Analysis:
+• Age: {age_analysis['reason']} (Score: {age_analysis['compatibility_score']*100:.0f}/100)
+• Interests: {interest_analysis['direct_matches']} direct matches, {interest_analysis['semantic_matches']} category overlaps (Score: {interest_analysis['compatibility_score']*100:.0f}/100)
+• Location: {location_analysis['reason']} (Score: {location_analysis['compatibility_score']*100:.0f}/100)"""
+
+def scoring_fields(profile: Dict) -> Dict:
+    """The parts of a profile score_profiles depends on, normalized as it reads them.
+
+    Interests only matter as a set and locations are compared lowercased and
+    stripped, so profiles differing only in those respects score the same.
+    """
+    return {
+        'age': profile.get('age', 25),
+        'interests': sorted(set(profile.get('interests', []))),
+        'location': profile.get('location', '').lower().strip(),
+    }
+
+def score_profiles(profile1: Dict, profile2: Dict) -> Dict:
+    """Full matching response payload: score, explanation, factors and recommendations"""
+    compatibility_factors = analyze_profiles(profile1, profile2)
+    return {
+        "score": compatibility_factors['overall_score'],
+        "explanation": explain(compatibility_factors),
+        "compatibility_factors": compatibility_factors,
+        "recommendations": generate_recommendations(profile1, profile2, compatibility_factors)
+    }
@@ -0,0 +1,176 @@
+import binascii
+import json
+import os
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Any, Dict, Optional, Union
+
+# Optional fast JSON libraries, imported only when their codec is created so a
+# cold start loads just the one in use; the stdlib codec needs neither
+def _installed(module: str) -> bool:
+    return find_spec(module) is not None
+
+class EnvelopeError(ValueError):
+    """The request is not a well-formed uAgent envelope"""
+
+# Envelope fields and the JSON types each may hold; unknown fields are passed through unchecked
+ENVELOPE_FIELDS = {
+    'version': (int,),
+    'sender': (str,),
+    'target': (str,),
+    'session': (str,),
+    'schema_digest': (str,),
+    'protocol_digest': (str, type(None)),
+    'payload': (str,),
+    'expires': (int, type(None)),
+    'nonce': (int, type(None)),
+    'signature': (str, type(None)),
+}
+
+def _type_names(types: tuple) -> str:
+    return " or ".join('null' if t is type(None) else t.__name__ for t in types)
+
+class JSONCodec:
+    """Envelope codec on the stdlib json module.
+
+    Payloads are base64-encoded JSON inside a JSON envelope. Every codec goes
+    straight between bytes and base64 with binascii, and builds the reply
+    envelope as bytes, so no intermediate str copies of the payload are made.
+    """
+
+    name = "json"
+    # json.dumps builds a new encoder per call when given options; reuse one
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj).encode()
+
+    def decode_envelope(self, data: Union[bytes, str]) -> Dict:
+        """Parse and validate an envelope against ENVELOPE_FIELDS"""
+        try:
+            envelope = self.loads(data)
+        except ValueError as e:
+            raise EnvelopeError(f"envelope is not valid JSON: {e}") from None
+        if not isinstance(envelope, dict):
+            raise EnvelopeError("envelope must be a JSON object")
+        for name, value in envelope.items():
+            types = ENVELOPE_FIELDS.get(name)
+            if types is not None and not isinstance(value, types):
+                raise EnvelopeError(f"envelope field {name!r} must be {_type_names(types)}")
+        return envelope
+
+    def decode_payload(self, payload: str) -> Any:
+        try:
+            raw = binascii.a2b_base64(payload)
+        except (binascii.Error, ValueError):
+            raise EnvelopeError("payload is not valid base64") from None
+        try:
+            return self.loads(raw)
+        except ValueError as e:
+            raise EnvelopeError(f"payload is not valid JSON: {e}") from None
+
+    def encode_envelope(self, envelope: Dict, payload: Any) -> bytes:
+        """Serialize `envelope` with `payload` added as base64-encoded JSON"""
+        head = self.dumps(envelope)
+        encoded = binascii.b2a_base64(self.dumps(payload), newline=False)
+        # Base64 needs no JSON escaping, so the field is spliced in as bytes
+        separator = b',"payload":"' if len(head) > 2 else b'"payload":"'
+        return b"".join((head[:-1], separator, encoded, b'"}'))
+
+class OrjsonCodec(JSONCodec):
+    """orjson parses bytes directly and serializes straight to bytes"""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+        self.dumps = orjson.dumps
+
+@lru_cache(maxsize=None)
+def _msgspec_envelope():
+    """ENVELOPE_FIELDS as a msgspec schema, compiled into the decoder once"""
+    import msgspec
+    from msgspec import UNSET, UnsetType
+
+    class Envelope(msgspec.Struct):
+        version: Union[int, UnsetType] = UNSET
+        sender: Union[str, UnsetType] = UNSET
+        target: Union[str, UnsetType] = UNSET
+        session: Union[str, UnsetType] = UNSET
+        schema_digest: Union[str, UnsetType] = UNSET
+        protocol_digest: Union[str, None, UnsetType] = UNSET
+        payload: Union[str, UnsetType] = UNSET
+        expires: Union[int, None, UnsetType] = UNSET
+        nonce: Union[int, None, UnsetType] = UNSET
+        signature: Union[str, None, UnsetType] = UNSET
+
+    return Envelope
+
+class MsgspecCodec(JSONCodec):
+    """msgspec decodes the envelope, then checks it against the compiled schema.
+
+    A Struct would drop the fields it does not declare, so the envelope is
+    decoded as a dict (keeping them, like the other codecs) and converted to
+    the Struct only to validate it.
+    """
+
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._msgspec = msgspec
+        self._envelope = _msgspec_envelope()
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._msgspec.DecodeError as e:
+            raise ValueError(str(e)) from None
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def decode_envelope(self, data: Union[bytes, str]) -> Dict:
+        try:
+            envelope = self._decoder.decode(data)
+        except self._msgspec.DecodeError as e:
+            raise EnvelopeError(f"envelope is not valid JSON: {e}") from None
+        if not isinstance(envelope, dict):
+            raise EnvelopeError("envelope must be a JSON object")
+        try:
+            self._msgspec.convert(envelope, self._envelope)
+        except self._msgspec.ValidationError as e:
+            raise EnvelopeError(f"invalid envelope: {e}") from None
+        return envelope
+
+CODECS = {'json': JSONCodec, 'orjson': OrjsonCodec, 'msgspec': MsgspecCodec}
+
+def available_codecs() -> list:
+    """Names of the codecs whose library is installed, preferred first.
+
+    orjson and msgspec round-trip a single-pair envelope in about the same
+    time; orjson parses large batch payloads faster, so it goes first.
+    """
+    return [name for name in ('orjson', 'msgspec') if _installed(name)] + ['json']
+
+_codec: Optional[JSONCodec] = None
+
+def get_codec() -> JSONCodec:
+    """Process-wide codec: LOVEFI_CODEC if set, else the preferred available one"""
+    global _codec
+    if _codec is None:
+        name = os.environ.get("LOVEFI_CODEC") or available_codecs()[0]
+        if name not in available_codecs():
+            raise ValueError(f"Envelope codec {name!r} is unknown or its library is not installed")
+        _codec = CODECS[name]()
+    return _codec
+
+def set_codec(codec: Optional[JSONCodec]) -> None:
+    global _codec
+    _codec = codec
@@ -0,0 +1,221 @@
+"""
+Hierarchical place resolver: neighborhood -> city -> metro -> state -> country.
+
+Places come from places.json (or LOVEFI_PLACES). Each entry has an id, a
+kind, a name, optional aliases and the ids of its parents. A city can have
+both a metro and a state as parents, because metros cross state lines.
+
+Every name and alias goes into one Aho-Corasick automaton, so a location
+string is scanned once, in time linear in its length, and only whole words
+match. Aliases of two letters or fewer ("me", "in", "la") also read as
+ordinary words, so they only count as a whole comma-separated qualifier
+("Portland, ME") or as the whole location. A state or country named after a
+comma rules out every candidate it contradicts ("Paris, TX" is not the Paris
+in France). Among the rest, the candidate whose ancestors explain the most
+of the other matched names wins, then the more specific kind, then the
+longer name. Resolved lineages are cached, so scoring only compares place
+ids.
+"""
+
+import json
+import os
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+LEVELS = ("neighborhood", "city", "metro", "state", "country")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "places.json")
+# Aliases this short only match a whole qualifier segment; longer ones match anywhere
+SHORT_ALIAS = 2
+# Levels at which a qualifier after a comma can contradict a candidate
+QUALIFIER_LEVELS = (LEVELS.index("state"), LEVELS.index("country"))
+
+class Place(NamedTuple):
+    id: str
+    kind: str
+    name: str
+    parents: Tuple[str, ...] = ()
+    aliases: Tuple[str, ...] = ()
+
+class ResolvedPlace(NamedTuple):
+    """The place a location resolved to and its ancestor at each level (None where there is none)"""
+    place_id: str
+    lineage: Tuple[Optional[str], ...]
+
+def _words(text: str) -> List[str]:
+    return "".join(c if c.isalnum() else " " for c in text.lower()).split()
+
+def normalize_place(text: str) -> str:
+    """Lowercase words separated by single spaces, padded so patterns can require word boundaries"""
+    return " " + " ".join(_words(text)) + " "
+
+def segment_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) in normalize_place(text) of each non-empty comma-separated segment"""
+    spans, offset = [], 1
+    for segment in text.split(","):
+        words = " ".join(_words(segment))
+        if words:
+            spans.append((offset, offset + len(words)))
+            offset += len(words) + 1
+    return spans
+
+class PlaceAutomaton:
+    """Aho-Corasick automaton over characters; patterns map to lists of values"""
+
+    def __init__(self, patterns: Dict[str, List]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[List[Tuple[int, List]]] = [[]]
+        for pattern, values in patterns.items():
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._output.append([])
+                state = next_state
+            self._output[state].append((len(pattern), values))
+
+        # Breadth-first failure links; each state also reports its fallbacks' outputs
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[int, int, List]]:
+        """(start, end, values) for every pattern occurrence, overlapping ones included"""
+        matches = []
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, values in output[state]:
+                matches.append((end - length, end, values))
+        return matches
+
+class PlaceResolver:
+    """Resolves free-text locations to places from a hierarchy"""
+
+    def __init__(self, places: List[Place], cache_size: int = 4096):
+        self.places = {place.id: place for place in places}
+        for place in places:
+            if place.kind not in LEVELS:
+                raise ValueError(f"Place {place.id} has unknown kind {place.kind!r}")
+            for parent in place.parents:
+                if parent not in self.places:
+                    raise ValueError(f"Place {place.id} has unknown parent {parent!r}")
+        self._lineages = {place_id: self._lineage(place_id) for place_id in self.places}
+        self._ancestors = {
+            place_id: frozenset(ancestor for ancestor in lineage if ancestor is not None)
+            for place_id, lineage in self._lineages.items()
+        }
+        self._specificity = {place_id: -LEVELS.index(place.kind) for place_id, place in self.places.items()}
+        self._automaton = PlaceAutomaton(self._patterns(places))
+        self.resolve = lru_cache(maxsize=cache_size)(self._resolve)
+
+    @classmethod
+    def from_file(cls, path: str) -> "PlaceResolver":
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)['places']
+        return cls([
+            Place(entry['id'], entry['kind'], entry['name'], tuple(entry.get('parents', ())), tuple(entry.get('aliases', ())))
+            for entry in entries
+        ])
+
+    @staticmethod
+    def _patterns(places: List[Place]) -> Dict[str, List[str]]:
+        """Normalized name or alias -> ids of the places it can mean"""
+        patterns: Dict[str, List[str]] = {}
+        for place in places:
+            for name in (place.name, *place.aliases):
+                ids = patterns.setdefault(normalize_place(name), [])
+                if place.id not in ids:
+                    ids.append(place.id)
+        return patterns
+
+    def _lineage(self, place_id: str) -> Tuple[Optional[str], ...]:
+        lineage: List[Optional[str]] = [None] * len(LEVELS)
+        pending = [place_id]
+        while pending:
+            current = self.places[pending.pop(0)]
+            level = LEVELS.index(current.kind)
+            if lineage[level] is None:
+                lineage[level] = current.id
+                pending.extend(current.parents)
+        return tuple(lineage)
+
+    def _contradicts(self, place_id: str, qualifier_id: str) -> bool:
+        """Whether the two places lie in different states or countries"""
+        lineage, qualifier = self._lineages[place_id], self._lineages[qualifier_id]
+        return any(
+            lineage[level] is not None and qualifier[level] is not None and lineage[level] != qualifier[level]
+            for level in QUALIFIER_LEVELS
+        )
+
+    def _resolve(self, location: str) -> Optional[ResolvedPlace]:
+        spans = segment_spans(location)
+        matches = []
+        for start, end, candidates in self._automaton.find(normalize_place(location)):
+            # The match without its padding spaces, and the segment it starts in
+            words = (start + 1, end - 1)
+            segment = next((index for index, (_, span_end) in enumerate(spans) if words[0] < span_end), 0)
+            if words[1] - words[0] <= SHORT_ALIAS and (words != spans[segment] or (segment == 0 and len(spans) > 1)):
+                continue
+            matches.append((start, end, candidates, segment))
+
+        qualifiers = [
+            [place_id for place_id in candidates if LEVELS.index(self.places[place_id].kind) in QUALIFIER_LEVELS]
+            for _, _, candidates, segment in matches if segment > 0
+        ]
+        qualifiers = [ids for ids in qualifiers if ids]
+        best, best_key = None, None
+        for index, (start, end, candidates, _) in enumerate(matches):
+            for place_id in candidates:
+                # A qualifier contradicts a candidate when every place it can mean does
+                if any(all(self._contradicts(place_id, qualifier) for qualifier in ids) for ids in qualifiers):
+                    continue
+                ancestors = self._ancestors[place_id]
+                # How many other matched names this candidate's ancestry accounts for
+                support = sum(
+                    1 for other, (_, _, other_candidates, _) in enumerate(matches)
+                    if other != index and any(candidate in ancestors for candidate in other_candidates)
+                )
+                # Then the more specific kind, then the longer (less ambiguous) name
+                key = (support, self._specificity[place_id], end - start, -start)
+                if best_key is None or key > best_key:
+                    best, best_key = place_id, key
+        return None if best is None else ResolvedPlace(best, self._lineages[best])
+
+    def common_level(self, place1: Optional[ResolvedPlace], place2: Optional[ResolvedPlace]) -> Optional[Tuple[str, Place]]:
+        """The most specific (level, place) both resolved places lie in, or None"""
+        if place1 is None or place2 is None:
+            return None
+        for level, id1, id2 in zip(LEVELS, place1.lineage, place2.lineage):
+            if id1 is not None and id1 == id2:
+                return level, self.places[id1]
+        return None
+
+_resolver: Optional[PlaceResolver] = None
+_resolver_lock = Lock()
+
+def get_place_resolver() -> PlaceResolver:
+    """Resolver for LOVEFI_PLACES or the bundled places.json, loaded on first use"""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = PlaceResolver.from_file(os.environ.get("LOVEFI_PLACES", DEFAULT_PATH))
+    return _resolver
+
+def set_place_resolver(resolver: Optional[PlaceResolver]) -> None:
+    global _resolver
+    _resolver = resolver
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Precomputed interest -> category mask table, memory-mapped at import.
+
+    python scoring_table.py    # rebuild scoring_table.bin after changing compatibility.py
+
+Layout (little-endian): 8-byte magic, u32 header length, JSON header
+(fingerprint, count, byteorder), u32 offsets[count + 1] into the key blob,
+u16 masks[count], then the sorted UTF-8 keys. Lookups binary-search the
+mapped file, so loading costs one open and mmap however many entries it
+holds. The arrays are read in place as native integers, so a file is only
+used on a little-endian machine, and only if its header says it is
+little-endian; otherwise the masks are computed as if there were no table.
+
+The sorted keys double as the vocabulary of known interests. Two things stay
+out of the file on purpose. InterestVocabulary's bits are handed out to the
+interests of candidates registered with this process, so they start empty
+and there is nothing to precompute. The place hierarchy (places.json) is
+loaded on the first location comparison, not at import, and building its
+resolver takes about 5 ms; a second binary format for its automaton would
+save less than that once per instance.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Optional
+
+MAGIC = b"LFSCORE1"
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_table.bin")
+
+# Interests precomputed besides the category keywords themselves
+COMMON_INTERESTS = [
+    "acting", "anime", "archery", "astronomy", "backpacking", "basketball", "board games", "bouldering",
+    "bowling", "boxing", "calligraphy", "ceramics", "coffee", "comedy", "concerts", "craft beer",
+    "crypto", "dance", "diy", "djing", "documentaries", "esports", "fashion", "film", "fishing",
+    "football", "gardening", "golf", "guitar", "history", "horse riding", "improv", "investing",
+    "journaling", "kayaking", "karaoke", "knitting", "languages", "meditation", "mountain biking",
+    "movies", "museums", "piano", "podcasts", "poetry", "pottery", "road trips", "rock climbing",
+    "sailing", "singing", "skateboarding", "snowboarding", "soccer", "startups", "stand-up comedy",
+    "swimming", "table tennis", "tennis", "theater", "travel", "trivia", "video games", "vinyl",
+    "web3", "wine tasting", "food blogging", "music production", "night hiking", "street photography",
+    "trail running", "volleyball", "weightlifting",
+]
+
+def table_fingerprint(interest_categories: Dict) -> str:
+    """Hash of the scoring constants, so a table built from older ones is ignored"""
+    source = json.dumps(interest_categories, sort_keys=True)
+    return hashlib.sha1(source.encode()).hexdigest()
+
+class ScoringTable:
+    """Read-only view of a built table"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a scoring table")
+        (header_len,) = struct.unpack_from("<I", mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(mm[start:start + header_len])
+        if self.header.get('byteorder') != "little" or sys.byteorder != "little":
+            raise ValueError(f"{path} is {self.header.get('byteorder', 'of unknown byte order')}, "
+                             f"this machine is {sys.byteorder}-endian")
+        self.count = count = self.header['count']
+        offsets_start = start + header_len
+        masks_start = offsets_start + 4 * (count + 1)
+        self._keys_start = masks_start + 2 * count
+        view = memoryview(mm)
+        self._offsets = view[offsets_start:masks_start].cast("I")
+        self._masks = view[masks_start:self._keys_start].cast("H")
+
+    @property
+    def fingerprint(self) -> str:
+        return self.header['fingerprint']
+
+    def _key(self, index: int) -> bytes:
+        return self._mm[self._keys_start + self._offsets[index]:self._keys_start + self._offsets[index + 1]]
+
+    def category_mask(self, interest: str) -> Optional[int]:
+        """Precomputed mask of a lowercased interest, or None if it is not in the table"""
+        key = interest.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == key:
+            return self._masks[lo]
+        return None
+
+def load_scoring_table(path: str, fingerprint: str) -> Optional[ScoringTable]:
+    """The table at `path` if it exists and was built from the current constants"""
+    try:
+        table = ScoringTable(path)
+    except (OSError, ValueError):
+        return None
+    return table if table.fingerprint == fingerprint else None
+
+def build_scoring_table(path: str, masks: Dict[str, int], fingerprint: str) -> None:
+    keys = sorted(key.encode("utf-8") for key in masks)
+    header = json.dumps({'fingerprint': fingerprint, 'count': len(keys), 'byteorder': "little"}).encode()
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(struct.pack(f"<{len(keys)}H", *(masks[key.decode("utf-8")] for key in keys)))
+        f.write(b"".join(keys))
+
+if __name__ == "__main__":
+    from compatibility import INTEREST_CATEGORIES, InterestVocabulary
+
+    interests = {keyword for keywords in INTEREST_CATEGORIES.values() for keyword in keywords}
+    interests.update(COMMON_INTERESTS)
+    masks = {interest: InterestVocabulary.category_mask(interest) for interest in interests}
+    build_scoring_table(DEFAULT_PATH, masks, table_fingerprint(INTEREST_CATEGORIES))
+    print(f"Wrote {len(masks)} interests to {DEFAULT_PATH}")
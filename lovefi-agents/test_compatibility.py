@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the bitmask interest analysis against the original set-based version,
+and golden scores for the 50/25/25 analysis (golden_scores.json)
+"""
+
+import json
+import random
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+from compatibility import (INTEREST_CATEGORIES, CompatibilityAnalyzer, InterestVocabulary, analyze_profiles, encode_interests,
+                           explain, register_interests)
+
+def reference_analyze_interests(interests1, interests2):
+    """The set/substring implementation the bitmask version replaced"""
+    def categorize_interests(interests):
+        categories = {}
+        for interest in interests:
+            for category, keywords in INTEREST_CATEGORIES.items():
+                if any(keyword in interest.lower() for keyword in keywords):
+                    categories.setdefault(category, []).append(interest)
+        return categories
+
+    cats1 = categorize_interests(interests1)
+    cats2 = categorize_interests(interests2)
+    common_categories = set(cats1.keys()) & set(cats2.keys())
+    total_categories = set(cats1.keys()) | set(cats2.keys())
+    direct_overlap = len(set(interests1) & set(interests2))
+    semantic_overlap = len(common_categories)
+    return {
+        'direct_matches': direct_overlap,
+        'semantic_matches': semantic_overlap,
+        'total_interests': len(set(interests1) | set(interests2)),
+        'common_categories': common_categories,
+        'compatibility_score': (direct_overlap * 2 + semantic_overlap) / len(total_categories) if total_categories else 0
+    }
+
+POOL = [
+    "hiking", "Hiking", "night hiking", "chess", "Music", "music production", "wine tasting", "yoga",
+    "AI", "rain", "golf", "coding", "Martial Arts", "reading", "food blogging", "", "parties",
+]
+
+def test_bitmask_analysis_matches_reference():
+    """Every field, and the score bit for bit, agrees with the set-based version"""
+    rng = random.Random(1)
+    for _ in range(2000):
+        interests1 = [rng.choice(POOL) for _ in range(rng.randint(0, 6))]
+        interests2 = [rng.choice(POOL) for _ in range(rng.randint(0, 6))]
+        expected = reference_analyze_interests(interests1, interests2)
+        actual = CompatibilityAnalyzer.analyze_interests(interests1, interests2)
+        assert set(actual.pop('common_categories')) == expected.pop('common_categories')
+        assert actual == expected
+
+def test_encoding_is_stable():
+    """Re-encoding the same interests yields the same masks"""
+    scope = {}
+    assert encode_interests(["hiking", "chess"], scope) == encode_interests(["chess", "hiking", "hiking"], scope)
+    assert encode_interests([], scope).category_mask == 0
+    assert register_interests(["hiking", "chess"]) == register_interests(["chess", "hiking", "hiking"])
+
+def test_request_profiles_do_not_grow_the_vocabulary():
+    vocabulary = InterestVocabulary(maxsize=3)
+    registered = vocabulary.encode(["hiking", "chess"])
+    scope = {}
+    query = vocabulary.encode(["chess", "knitting", "opera"], scope)
+    other = vocabulary.encode(["opera"], scope)
+    assert len(vocabulary) == 2 and sorted(scope) == ["knitting", "opera"]
+    # Shared interests share bits, and scope bits never collide with registered ones
+    assert (registered.interest_mask & query.interest_mask).bit_count() == 1
+    assert (query.interest_mask & other.interest_mask).bit_count() == 1
+    assert (registered.interest_mask & other.interest_mask) == 0
+    # A full vocabulary keeps new interests as strings instead of giving them a bit
+    vocabulary.encode(["camping"])
+    assert vocabulary.encode(["surfing"]) == (0, vocabulary.category_mask("surfing"), {"surfing"})
+    assert vocabulary.encode(["surfing"], {}).overflow == {"surfing"} and len(vocabulary) == 3
+
+def test_full_vocabulary_keeps_direct_matches():
+    """Interests past the cap still match exactly, so scores don't change"""
+    analyze_encoded_interests = CompatibilityAnalyzer.analyze_encoded_interests
+    first, second = ["hiking", "pottery", "chess"], ["pottery", "chess", "opera"]
+    roomy = InterestVocabulary()
+    expected = analyze_encoded_interests(roomy.encode(first), roomy.encode(second))
+    full = InterestVocabulary(maxsize=1)
+    full.encode(["hiking"])
+    actual = analyze_encoded_interests(full.encode(first), full.encode(second))
+    assert actual == expected and actual["direct_matches"] == 2
+    scoped = analyze_encoded_interests(full.encode(first), full.encode(second, {}))
+    assert scoped == expected
+
+def test_scoring_table_matches_computed_masks(tmp_path):
+    """The shipped table is current, agrees with keyword matching, and stale tables are ignored"""
+    import compatibility
+    from scoring_table import build_scoring_table, load_scoring_table, table_fingerprint
+
+    table = compatibility.scoring_table
+    assert table is not None
+    for index in range(table.count):
+        interest = table._key(index).decode()
+        assert table.category_mask(interest) == compatibility.InterestVocabulary.category_mask(interest)
+    assert table.category_mask("not an interest anyone has") is None
+
+    path = str(tmp_path / "table.bin")
+    build_scoring_table(path, {"chess": 4, "yoga": 32}, "old")
+    assert load_scoring_table(path, "new") is None
+    assert load_scoring_table(path, "old").category_mask("yoga") == 32
+    assert load_scoring_table(str(tmp_path / "missing.bin"), "old") is None
+
+def test_scoring_table_rejects_other_byte_orders(tmp_path, monkeypatch):
+    """Tables are read as native integers, so only little-endian tables on little-endian machines load"""
+    import scoring_table
+    from scoring_table import build_scoring_table, load_scoring_table
+
+    path = tmp_path / "table.bin"
+    build_scoring_table(str(path), {"chess": 4, "yoga": 32}, "v")
+    data = path.read_bytes()
+    assert load_scoring_table(str(path), "v").category_mask("chess") == 4
+    monkeypatch.setattr(scoring_table.sys, "byteorder", "big")
+    assert load_scoring_table(str(path), "v") is None
+    monkeypatch.undo()
+    # Same header length, so the arrays stay where they were
+    path.write_bytes(data.replace(b'"little"', b'"big"   '))
+    assert load_scoring_table(str(path), "v") is None
+    path.write_bytes(data.replace(b', "byteorder": "little"', b' ' * len(b', "byteorder": "little"')))
+    assert load_scoring_table(str(path), "v") is None
+
+def test_analyze_profiles_matches_golden():
+    """The scoring engine's "compatibility" plan reproduces the recorded analyses exactly"""
+    with open(os.path.join(os.path.dirname(__file__), "golden_scores.json")) as f:
+        cases = json.load(f)['cases']
+    for case in cases:
+        factors = analyze_profiles(case['profile1'], case['profile2'])
+        assert factors == case['factors']
+        assert explain(factors) == case['explanation']
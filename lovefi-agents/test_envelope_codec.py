@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the envelope codecs: every available codec must agree with the stdlib one
+"""
+
+import base64
+import json
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+from envelope_codec import CODECS, EnvelopeError, available_codecs
+
+PAYLOAD = {'profile1': {'age': 28, 'interests': ['hiking', 'café'], 'location': 'New York'}, 'profile2': {'age': 30.5}}
+
+@pytest.fixture(params=available_codecs())
+def codec(request):
+    return CODECS[request.param]()
+
+def test_round_trip_matches_stdlib(codec):
+    """Envelopes decode to the same values and replies are plain base64 JSON"""
+    raw = json.dumps({'sender': 'agent1q', 'nonce': 2, 'extra': [1],
+                      'payload': base64.b64encode(json.dumps(PAYLOAD).encode()).decode()}).encode()
+    envelope = codec.decode_envelope(raw)
+    assert (envelope['sender'], envelope['nonce']) == ('agent1q', 2)
+    assert codec.decode_payload(envelope['payload']) == PAYLOAD
+
+    reply = json.loads(codec.encode_envelope({'target': 'agent1q', 'signature': None}, PAYLOAD))
+    assert reply['target'] == 'agent1q' and reply['signature'] is None
+    assert json.loads(base64.b64decode(reply['payload'])) == PAYLOAD
+    assert json.loads(codec.encode_envelope({}, [1]))['payload'] == base64.b64encode(b"[1]").decode()
+
+def test_codecs_round_trip_the_same_envelope():
+    """Known and unknown fields survive decode and re-encode alike in every codec"""
+    envelope = {'version': 1, 'sender': 'agent1q', 'session': 's', 'nonce': None, 'extra': {'hops': [1, 2]},
+                'payload': base64.b64encode(json.dumps(PAYLOAD).encode()).decode()}
+    raw = json.dumps(envelope).encode()
+    for name in available_codecs():
+        codec = CODECS[name]()
+        decoded = codec.decode_envelope(raw)
+        assert decoded == envelope, name
+        head = {field: value for field, value in decoded.items() if field != 'payload'}
+        again = codec.decode_envelope(codec.encode_envelope(head, codec.decode_payload(decoded['payload'])))
+        assert {**again, 'payload': None} == {**envelope, 'payload': None}, name
+        assert codec.decode_payload(again['payload']) == PAYLOAD
+
+@pytest.mark.parametrize("raw", [b"[1, 2]", b"{not json", b'{"nonce": "1"}', b'{"payload": 5}', b'{"sender": null}'])
+def test_invalid_envelopes_are_rejected(codec, raw):
+    with pytest.raises(EnvelopeError):
+        codec.decode_envelope(raw)
+
+def test_invalid_payloads_are_rejected(codec):
+    with pytest.raises(EnvelopeError):
+        codec.decode_payload("é")
+    with pytest.raises(EnvelopeError):
+        codec.decode_payload(base64.b64encode(b"{oops").decode())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the hierarchical place resolver and the location analysis built on it
+"""
+
+import random
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+from compatibility import CompatibilityAnalyzer
+from places import Place, PlaceAutomaton, PlaceResolver, get_place_resolver, normalize_place, segment_spans
+
+def test_automaton_finds_every_occurrence():
+    """Same matches as checking every pattern at every position"""
+    rng = random.Random(19)
+    patterns = {"".join(rng.choice("abc") for _ in range(rng.randint(1, 4))): [i] for i in range(30)}
+    automaton = PlaceAutomaton(patterns)
+    for _ in range(50):
+        text = "".join(rng.choice("abcd") for _ in range(40))
+        expected = sorted(
+            (start, start + len(pattern), values[0])
+            for pattern, values in patterns.items()
+            for start in range(len(text) - len(pattern) + 1) if text.startswith(pattern, start)
+        )
+        assert sorted((start, end, values[0]) for start, end, values in automaton.find(text)) == expected
+
+def test_resolves_whole_words_and_disambiguates_by_context():
+    resolver = get_place_resolver()
+    assert resolver.resolve("Williamsburg, Brooklyn").place_id == "hood/williamsburg"
+    assert resolver.resolve("new york").place_id == "city/new-york"
+    assert resolver.resolve("Portland").place_id == "city/portland-or"
+    assert resolver.resolve("Portland, ME").place_id == "city/portland-me"
+    assert resolver.resolve("Arlington, Texas").lineage[2] == "metro/dallas"
+    assert resolver.resolve("Yorktown") is None and resolver.resolve("") is None
+    assert normalize_place("St. Louis,MO") == " st louis mo "
+
+def test_short_aliases_only_qualify_and_qualifiers_rule_out_candidates():
+    resolver = get_place_resolver()
+    # Two-letter state codes inside ordinary text are words, not places
+    assert resolver.resolve("Rio de Janeiro") is None
+    assert resolver.resolve("Hi from Boise") is None
+    assert resolver.resolve("LA").place_id == "city/los-angeles"
+    # A contradicting qualifier rejects the known same-named city instead of falling back to it
+    assert resolver.resolve("Paris, TX").place_id == "us-tx"
+    assert resolver.resolve("Springfield, MO").place_id == "us-mo"
+    assert resolver.resolve("Arlington, VA").place_id == "city/arlington-va"
+    assert segment_spans("Portland,  ME") == [(1, 9), (10, 12)]
+
+def test_analyze_location_compares_levels():
+    cases = [
+        ("Brooklyn", "brooklyn ", "exact", 1.0),
+        ("Williamsburg, Brooklyn", "Williamsburg, NYC", "same_city", 0.8),
+        ("Manhattan", "Queens, NY", "same_city", 0.8),
+        ("Hoboken, NJ", "Harlem", "same_city", 0.8),
+        ("Austin, Texas", "Houston", "same_state", 0.4),
+        ("Boston", "Seattle, WA", "different", 0.1),
+        ("Paris", "Chicago", "different", 0.1),
+        ("Atlantis", "Atlantis Bay", "different", 0.1),
+        ("Paris, France", "Paris, TX", "different", 0.1),
+        ("Springfield, MO", "Springfield, IL", "different", 0.1),
+        ("Rio de Janeiro", "Wilmington, Delaware", "different", 0.1),
+        ("Hi from Boise", "Honolulu", "different", 0.1),
+        ("Mexico City", "Ciudad de Mexico", "same_city", 0.8),
+    ]
+    for location1, location2, match_type, score in cases:
+        analysis = CompatibilityAnalyzer.analyze_location(location1, location2)
+        assert (analysis['match_type'], analysis['compatibility_score']) == (match_type, score), (location1, location2)
+
+def test_rejects_inconsistent_hierarchies():
+    with pytest.raises(ValueError):
+        PlaceResolver([Place("x", "city", "X", ("nowhere",))])
+    with pytest.raises(ValueError):
+        PlaceResolver([Place("x", "planet", "X")])
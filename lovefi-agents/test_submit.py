@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the /api/submit envelope handling in api/index.py
+"""
+
+import base64
+import json
+import sys
+import os
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'api'))
+from index import app
+from compatibility import score_profiles
+
+client = TestClient(app)
+
+PROFILE1 = {'age': 28, 'interests': ['hiking', 'reading', 'cooking'], 'location': 'New York'}
+PROFILE2 = {'age': 30, 'interests': ['hiking', 'music', 'photography'], 'location': 'Brooklyn, New York'}
+
+def envelope(payload):
+    return {'sender': 'agent1qclient', 'session': 's1', 'nonce': 3,
+            'payload': base64.b64encode(json.dumps(payload).encode()).decode()}
+
+def test_submit_scores_with_shared_engine():
+    """The reply envelope carries exactly what compatibility.score_profiles computes"""
+    response = client.post("/api/submit", json=envelope({'profile1': PROFILE1, 'profile2': PROFILE2}))
+    assert response.status_code == 200
+    body = response.json()
+    assert (body['target'], body['session'], body['nonce']) == ('agent1qclient', 's1', 3)
+    assert json.loads(base64.b64decode(body['payload'])) == score_profiles(PROFILE1, PROFILE2)
+
+def test_submit_without_pair_is_acknowledged():
+    assert client.post("/submit", json={'sender': 'x'}).json() == {'status': 'received'}
+    assert client.post("/submit", json=envelope({'profile1': PROFILE1})).json() == {'status': 'received'}
+
+def submit_batch(payload):
+    response = client.post("/api/submit", json=envelope(payload))
+    assert response.status_code == 200
+    return json.loads(base64.b64decode(response.json()['payload']))
+
+def test_batch_pairs_with_per_item_errors():
+    """Each pair is scored independently; a bad item reports an error in place"""
+    result = submit_batch({'pairs': [
+        {'profile1': PROFILE1, 'profile2': PROFILE2},
+        {'profile1': PROFILE1},
+        {'profile1': PROFILE2, 'profile2': PROFILE2},
+    ]})
+    assert (result['count'], result['errors']) == (3, 1)
+    first, bad, last = result['results']
+    assert first == {'index': 0, 'score': score_profiles(PROFILE1, PROFILE2)['score']}
+    assert bad['index'] == 1 and 'error' in bad
+    assert last['score'] == score_profiles(PROFILE2, PROFILE2)['score']
+
+def test_batch_index_pairs_over_shared_table():
+    """Index pairs reference a profile table, as a list or keyed by id"""
+    result = submit_batch({'profiles': [PROFILE1, PROFILE2], 'index_pairs': [[0, 1], [1, 1], [0, 2], [-1, 0]], 'details': True})
+    assert result['errors'] == 2
+    assert result['results'][0] == dict(score_profiles(PROFILE1, PROFILE2), index=0)
+    assert [('error' in r) for r in result['results']] == [False, False, True, True]
+
+    result = submit_batch({'profiles': {'a': PROFILE1, 'b': PROFILE2}, 'index_pairs': [['a', 'b'], ['b', 'c']]})
+    assert result['results'][0]['score'] == score_profiles(PROFILE1, PROFILE2)['score']
+    assert 'error' in result['results'][1]
+
+def test_score_stream_scores_lines_as_they_arrive(monkeypatch):
+    """Results stream back in order, with line numbers, ids and per-line errors"""
+    import index
+    monkeypatch.setattr(index, 'MAX_STREAM_LINE_BYTES', 250)
+    lines = [
+        json.dumps({'id': 'a', 'profile1': PROFILE1, 'profile2': PROFILE2}),
+        "",
+        "not json",
+        json.dumps({'profile1': PROFILE2, 'profile2': {'interests': ['x' * 400]}}),
+        json.dumps({'profile1': PROFILE2, 'profile2': PROFILE2}),
+    ]
+    body = ("\n".join(lines)).encode()
+
+    def chunks(size=37):
+        for start in range(0, len(body), size):
+            yield body[start:start + size]
+
+    response = client.post("/api/score-stream", content=chunks())
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [r['line'] for r in results] == [1, 3, 4, 5]
+    assert results[0] == {'id': 'a', 'line': 1, 'score': score_profiles(PROFILE1, PROFILE2)['score']}
+    assert 'error' in results[1] and 'longer than' in results[2]['error']
+    assert results[3]['score'] == score_profiles(PROFILE2, PROFILE2)['score']
+
+    detailed = client.post("/score-stream?details=true", content=lines[0]).text
+    assert json.loads(detailed) == dict(score_profiles(PROFILE1, PROFILE2), id='a', line=1)
+
+def test_malformed_envelope_is_a_client_error():
+    assert client.post("/api/submit", content=b'{"nonce": "x"}').status_code == 400
+    assert client.post("/api/submit", content=b'[]').status_code == 400
+
+def test_metrics_endpoint(monkeypatch):
+    """Prometheus text with the submit stages once metrics are on"""
+    import metrics
+    monkeypatch.setattr(metrics, "enabled", True)
+    client.post("/api/submit", json=envelope({'profile1': PROFILE1, 'profile2': {**PROFILE2, 'age': 41}}))
+    response = client.get("/api/metrics")
+    assert response.status_code == 200 and response.headers['content-type'].startswith("text/plain")
+    for stage in ("parse", "serialize", "factor.place"):
+        assert f'lovefi_stage_seconds_count{{stage="{stage}"}}' in response.text
+
+def test_pool_and_top_matches_reject_bad_input():
+    """A candidate without a profile or a negative k is a client error, and nothing is registered"""
+    registered = client.post("/api/pool", json={'candidates': [{'id': 'p1', 'profile': PROFILE1}]}).json()
+    response = client.post("/api/pool", json={'candidates': [{'id': 'p2', 'profile': PROFILE2}, {'id': 'p3'}]})
+    assert response.status_code == 400
+    assert client.post("/api/pool", json={'candidates': []}).json()['pool_size'] == registered['pool_size']
+    for route in ("/api/pool", "/api/top-matches"):
+        assert client.post(route, content=b'{"candidates": [').status_code == 400
+        assert client.post(route, content=b'[1, 2]').status_code == 400
+    for k in (-1, "3", 2.5):
+        assert client.post("/api/top-matches", json={'profile': PROFILE2, 'k': k}).status_code == 400
+    matches = client.post("/api/top-matches", json={'profile': PROFILE2, 'k': 1}).json()['matches']
+    assert len(matches) == 1
@@ -0,0 +1,368 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+import metrics
+from location_similarity import location_profile, profile_similarity
+# Scoring is defined by scoring_engine; QueryProfile and EARTH_RADIUS_KM are re-exported from here
+from scoring_engine import DEFAULT_MAX_AGE_DIFF, EARTH_RADIUS_KM, UNKNOWN_AGE_FRACTION, QueryProfile, get_plan
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    def _popcount(words: np.ndarray) -> np.ndarray:
+        bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1)
+        return bits.sum(axis=-1, dtype=np.int64)
+
+class Vocabulary:
+    """Interns strings to dense integer codes"""
+
+    def __init__(self, items: Iterable[str] = ()):
+        self._codes: Dict[str, int] = {}
+        for item in items:
+            self.intern(item)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def intern(self, item: str) -> int:
+        code = self._codes.get(item)
+        if code is None:
+            code = self._codes[item] = len(self._codes)
+        return code
+
+    def get(self, item: str, default: int = -1) -> int:
+        return self._codes.get(item, default)
+
+    def subset(self, items: Iterable[str]) -> "Vocabulary":
+        """A vocabulary holding only `items`, under the same codes; small enough to ship with a query"""
+        vocab = Vocabulary()
+        vocab._codes = {item: self._codes[item] for item in items if item in self._codes}
+        return vocab
+
+def _n_words(vocab: Vocabulary) -> int:
+    return max(1, (len(vocab) + 63) // 64)
+
+def _encode_bits(codes: Iterable[int], n_words: int) -> np.ndarray:
+    words = np.zeros(n_words, dtype=np.uint64)
+    for code in codes:
+        if 0 <= code < n_words * 64:
+            words[code >> 6] |= np.uint64(1) << np.uint64(code & 63)
+    return words
+
+class CandidateTable:
+    """Columnar candidate store for one-to-many scoring.
+
+    Unknown ages and coordinates are NaN. Interests are bitsets over a shared
+    vocabulary (`interest_bits`, one row of uint64 words per candidate) and
+    preferences are option codes padded with -1.
+    """
+
+    def __init__(self, ids: List, ages: np.ndarray, lats: np.ndarray, lons: np.ndarray, search_radii: np.ndarray,
+                 addresses: List[str], interest_bits: np.ndarray, interest_counts: np.ndarray,
+                 preference_codes: np.ndarray, preference_counts: np.ndarray,
+                 interest_vocab: Vocabulary, preference_vocab: Vocabulary):
+        self.ids = ids
+        self.ages = ages
+        self.lats = lats
+        self.lons = lons
+        self.search_radii = search_radii
+        self.addresses = addresses
+        self.interest_bits = interest_bits
+        self.interest_counts = interest_counts
+        self.preference_codes = preference_codes
+        self.preference_counts = preference_counts
+        self.interest_vocab = interest_vocab
+        self.preference_vocab = preference_vocab
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, rows) -> "CandidateTable":
+        """Subset of rows sharing this table's vocabularies; a slice gives views, not copies"""
+        if isinstance(rows, slice):
+            ids, addresses = self.ids[rows], self.addresses[rows]
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            ids = [self.ids[row] for row in rows]
+            addresses = [self.addresses[row] for row in rows]
+        return CandidateTable(
+            ids=ids,
+            ages=self.ages[rows],
+            lats=self.lats[rows],
+            lons=self.lons[rows],
+            search_radii=self.search_radii[rows],
+            addresses=addresses,
+            interest_bits=self.interest_bits[rows],
+            interest_counts=self.interest_counts[rows],
+            preference_codes=self.preference_codes[rows],
+            preference_counts=self.preference_counts[rows],
+            interest_vocab=self.interest_vocab,
+            preference_vocab=self.preference_vocab,
+        )
+
+    @classmethod
+    def from_profiles(cls, ids: Sequence, profiles: Sequence[QueryProfile],
+                      interest_vocab: Optional[Vocabulary] = None,
+                      preference_vocab: Optional[Vocabulary] = None) -> "CandidateTable":
+        interest_vocab = interest_vocab if interest_vocab is not None else Vocabulary()
+        preference_vocab = preference_vocab if preference_vocab is not None else Vocabulary()
+        interest_codes = [[interest_vocab.intern(i) for i in set(p.interests)] for p in profiles]
+        preference_codes = [[preference_vocab.intern(o) for o in p.preferences] for p in profiles]
+
+        n = len(profiles)
+        n_words = _n_words(interest_vocab)
+        bits = np.zeros((n, n_words), dtype=np.uint64)
+        for row, codes in enumerate(interest_codes):
+            bits[row] = _encode_bits(codes, n_words)
+        width = max((len(codes) for codes in preference_codes), default=0)
+        prefs = np.full((n, width), -1, dtype=np.int32)
+        for row, codes in enumerate(preference_codes):
+            prefs[row, :len(codes)] = codes
+
+        def column(values):
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+        return cls(
+            ids=list(ids),
+            ages=column(p.age for p in profiles),
+            lats=column(p.lat for p in profiles),
+            lons=column(p.lon for p in profiles),
+            search_radii=np.array([p.search_radius for p in profiles], dtype=np.float64),
+            addresses=[p.address.lower() for p in profiles],
+            interest_bits=bits,
+            interest_counts=np.array([len(p.interests) for p in profiles], dtype=np.int64),
+            preference_codes=prefs,
+            preference_counts=np.array([len(p.preferences) for p in profiles], dtype=np.int64),
+            interest_vocab=interest_vocab,
+            preference_vocab=preference_vocab,
+        )
+
+class CandidateTableBuilder:
+    """CandidateTable rows that grow one at a time.
+
+    Columns live in buffers with spare capacity that double when full, so
+    adding a candidate encodes only that candidate. Re-adding an id replaces
+    its row in place. `table()` is a snapshot whose arrays are views of the
+    filled rows; later additions do not change its length.
+
+    `version` counts additions and each row records the version that last
+    wrote it, so a copy of the table can catch up with `changed_since()`.
+    `generation` changes whenever the buffers are reallocated.
+    """
+
+    def __init__(self, interest_vocab: Optional[Vocabulary] = None, preference_vocab: Optional[Vocabulary] = None,
+                 capacity: int = 64):
+        self.interest_vocab = interest_vocab if interest_vocab is not None else Vocabulary()
+        self.preference_vocab = preference_vocab if preference_vocab is not None else Vocabulary()
+        self._ids: List = []
+        self._rows: Dict = {}
+        self._addresses: List[str] = []
+        capacity = max(capacity, 1)
+        self._ages, self._lats, self._lons, self._search_radii = (np.full(capacity, np.nan) for _ in range(4))
+        self._interest_bits = np.zeros((capacity, _n_words(self.interest_vocab)), dtype=np.uint64)
+        self._interest_counts = np.zeros(capacity, dtype=np.int64)
+        self._preference_codes = np.full((capacity, 0), -1, dtype=np.int32)
+        self._preference_counts = np.zeros(capacity, dtype=np.int64)
+        self._row_versions = np.zeros(capacity, dtype=np.int64)
+        self.version = 0
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def row(self, candidate_id) -> Optional[int]:
+        return self._rows.get(candidate_id)
+
+    def candidate_id(self, row: int):
+        return self._ids[row]
+
+    def address(self, row: int) -> str:
+        return self._addresses[row]
+
+    def changed_since(self, version: int) -> np.ndarray:
+        """Rows added or replaced after `version`, ascending"""
+        return np.flatnonzero(self._row_versions[:len(self._ids)] > version)
+
+    def buffers(self) -> Dict[str, np.ndarray]:
+        """The numeric columns at full capacity, rows past len() unused; valid until `generation` changes"""
+        return {
+            'ages': self._ages, 'lats': self._lats, 'lons': self._lons, 'search_radii': self._search_radii,
+            'interest_bits': self._interest_bits, 'interest_counts': self._interest_counts,
+            'preference_codes': self._preference_codes, 'preference_counts': self._preference_counts,
+        }
+
+    def _grow(self, rows: int, words: int, width: int) -> None:
+        """Reallocate with at least this many rows, interest words and preference slots, doubling each"""
+        capacity, have_words = self._interest_bits.shape
+        have_width = self._preference_codes.shape[1]
+        if rows <= capacity and words <= have_words and width <= have_width:
+            return
+        capacity = max(capacity, rows if rows <= capacity else max(rows, 2 * capacity))
+        words = have_words if words <= have_words else max(words, 2 * have_words)
+        width = have_width if width <= have_width else max(width, 2 * have_width)
+        n = len(self._ids)
+
+        def resized(array, fill, columns=None):
+            shape = (capacity,) if columns is None else (capacity, columns)
+            out = np.full(shape, fill, dtype=array.dtype)
+            if columns is None:
+                out[:n] = array[:n]
+            else:
+                out[:n, :array.shape[1]] = array[:n]
+            return out
+
+        self._ages, self._lats, self._lons, self._search_radii = (
+            resized(column, np.nan) for column in (self._ages, self._lats, self._lons, self._search_radii)
+        )
+        self._interest_bits = resized(self._interest_bits, 0, words)
+        self._interest_counts = resized(self._interest_counts, 0)
+        self._preference_codes = resized(self._preference_codes, -1, width)
+        self._preference_counts = resized(self._preference_counts, 0)
+        self._row_versions = resized(self._row_versions, 0)
+        self.generation += 1
+
+    def add(self, candidate_id, profile: QueryProfile) -> int:
+        """Append the candidate (or replace its row); returns the row"""
+        interest_codes = [self.interest_vocab.intern(i) for i in set(profile.interests)]
+        preference_codes = [self.preference_vocab.intern(o) for o in profile.preferences]
+        row = self._rows.get(candidate_id)
+        if row is None:
+            row = len(self._ids)
+        self._grow(row + 1, _n_words(self.interest_vocab), len(preference_codes))
+        if row == len(self._ids):
+            self._rows[candidate_id] = row
+            self._ids.append(candidate_id)
+            self._addresses.append(profile.address.lower())
+        else:
+            self._addresses[row] = profile.address.lower()
+        self._ages[row] = np.nan if profile.age is None else profile.age
+        self._lats[row] = np.nan if profile.lat is None else profile.lat
+        self._lons[row] = np.nan if profile.lon is None else profile.lon
+        self._search_radii[row] = profile.search_radius
+        self._interest_bits[row] = _encode_bits(interest_codes, self._interest_bits.shape[1])
+        self._interest_counts[row] = len(profile.interests)
+        self._preference_codes[row] = -1
+        self._preference_codes[row, :len(preference_codes)] = preference_codes
+        self._preference_counts[row] = len(profile.preferences)
+        self.version += 1
+        self._row_versions[row] = self.version
+        return row
+
+    def table(self) -> CandidateTable:
+        n = len(self._ids)
+        return CandidateTable(
+            ids=list(self._ids),
+            addresses=self._addresses[:n],
+            interest_vocab=self.interest_vocab,
+            preference_vocab=self.preference_vocab,
+            **{name: column[:n] for name, column in self.buffers().items()},
+        )
+
+class BatchScores:
+    """Per-factor points and total scores, one entry per candidate row"""
+
+    __slots__ = ("interest", "age", "location", "preference", "total", "distance_km")
+
+    def __init__(self, total: np.ndarray, results: List):
+        zeros = np.zeros(len(total))
+        points = {factor.name: factor_points for factor, factor_points, _ in results}
+        self.interest = points.get('interest_overlap', zeros)
+        self.age = points.get('age_gap', zeros)
+        self.location = points.get('distance', zeros)
+        self.preference = points.get('preference_agreement', zeros)
+        self.distance_km = next((info for factor, _, info in results if factor.name == 'distance'),
+                                np.full(len(total), np.nan))
+        self.total = total
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance, broadcasting over NumPy arrays"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+# Vectorized forms of the scoring_engine match factors: 0-1 fractions, one per table row
+
+def interest_fractions(query: QueryProfile, table: CandidateTable) -> np.ndarray:
+    """|common| / max(len1, len2, 1)"""
+    query_bits = _encode_bits((table.interest_vocab.get(i) for i in set(query.interests)), table.interest_bits.shape[1])
+    common = _popcount(table.interest_bits & query_bits)
+    max_interests = np.maximum(np.maximum(table.interest_counts, len(query.interests)), 1)
+    return common / max_interests
+
+def age_fractions(query: QueryProfile, table: CandidateTable, max_age_diff=DEFAULT_MAX_AGE_DIFF) -> np.ndarray:
+    n = len(table)
+    if query.age is None:
+        return np.full(n, UNKNOWN_AGE_FRACTION)
+    max_age_diff = np.broadcast_to(np.asarray(max_age_diff, dtype=np.float64), (n,))
+    age_diff = np.abs(table.ages - query.age)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scaled = np.maximum(0, 1 - age_diff / max_age_diff)
+    scaled = np.where(max_age_diff > 0, scaled, 1.0)
+    return np.where(np.isnan(table.ages), UNKNOWN_AGE_FRACTION, scaled)
+
+def location_fractions(query: QueryProfile, table: CandidateTable) -> tuple:
+    """Fractions and distances in km (NaN where the address fallback applied)"""
+    n = len(table)
+    location = np.zeros(n)
+    distance = np.full(n, np.nan)
+    if query.lat is not None and query.lon is not None:
+        distance = haversine_km(query.lat, query.lon, table.lats, table.lons)
+        max_radius = np.maximum(table.search_radii, query.search_radius)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            location = np.where(distance <= max_radius, 1 - distance / max_radius, 0.0)
+        # The scalar path divides by zero here and falls back to string similarity
+        fallback = np.isnan(distance) | ((max_radius == 0) & (distance <= 0))
+    else:
+        fallback = np.ones(n, dtype=bool)
+    if fallback.any():
+        metrics.inc("lovefi_fallback_total", int(fallback.sum()), path="address_similarity")
+        # Candidates mostly share a handful of cities, so each distinct address is compared once
+        query_location = location_profile(query.address)
+        similarities = {}
+        for row in np.flatnonzero(fallback):
+            address = table.addresses[row]
+            similarity = similarities.get(address)
+            if similarity is None:
+                similarity = similarities[address] = profile_similarity(query_location, location_profile(address))
+            location[row] = similarity
+        distance = np.where(fallback, np.nan, distance)
+    return location, distance
+
+def preference_fractions(query: QueryProfile, table: CandidateTable) -> np.ndarray:
+    """Positional matches over the shorter list"""
+    n = len(table)
+    query_codes = np.array([table.preference_vocab.get(o) for o in query.preferences], dtype=np.int32)
+    total = np.minimum(table.preference_counts, len(query_codes))
+    width = min(len(query_codes), table.preference_codes.shape[1])
+    if width:
+        positions = np.arange(width)
+        equal = (table.preference_codes[:, :width] == query_codes[:width]) & (positions < total[:, None])
+        matching = equal.sum(axis=1)
+    else:
+        matching = np.zeros(n, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total > 0, matching / total, 0.0)
+
+def score_candidates(query: QueryProfile, table: CandidateTable, max_age_diff=None, plan: str = "match") -> BatchScores:
+    """Score one profile against every row of `table` in a single vectorized pass.
+
+    Runs the compiled `plan` with each factor's vectorized form, so totals
+    equal the pairwise scores, including the address similarity fallback for rows where
+    either address could not be geocoded (those rows are the only ones scored
+    in Python). `max_age_diff` overrides the profile's and may be a scalar or
+    a per-candidate array, as in calculate_match_score_simple.
+    """
+    total, results = get_plan(plan).score_table(query, table, max_age_diff=max_age_diff)
+    return BatchScores(total, results)
+
+def rank_candidates(query: QueryProfile, table: CandidateTable, k: int = 10, max_age_diff=None) -> List[tuple]:
+    """Top-k (candidate id, total score) pairs, best first"""
+    totals = score_candidates(query, table, max_age_diff).total
+    k = min(k, len(totals))
+    if k <= 0:
+        return []
+    top = np.argpartition(-totals, k - 1)[:k]
+    top = top[np.argsort(-totals[top], kind="stable")]
+    return [(table.ids[row], float(totals[row])) for row in top]
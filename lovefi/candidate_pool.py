@@ -0,0 +1,153 @@
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from batch_scoring import CandidateTable, CandidateTableBuilder, QueryProfile, score_candidates
+from spatial_index import CandidateStore
+from top_k import TopK
+
+class CandidatePool:
+    """Registered candidates that a profile can be ranked against.
+
+    Registering a candidate appends (or replaces) one row of the columnar
+    table and moves one point in the spatial index, so the pool never
+    re-encodes the candidates it already has. Removal is rare and rebuilds
+    both.
+    """
+
+    def __init__(self, cell_km: float = 25.0):
+        self.cell_km = cell_km
+        self._profiles: Dict[Hashable, QueryProfile] = {}
+        self._builder = CandidateTableBuilder()
+        # Snapshot of the builder, taken on the first query after a change
+        self._table: Optional[CandidateTable] = None
+        self._store: Optional[CandidateStore] = None
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, candidate_id: Hashable) -> bool:
+        return candidate_id in self._profiles
+
+    @property
+    def builder(self) -> CandidateTableBuilder:
+        """The rows behind `table`; replaced (not changed in place) when a candidate is removed"""
+        return self._builder
+
+    def profile(self, candidate_id: Hashable) -> Optional[QueryProfile]:
+        return self._profiles.get(candidate_id)
+
+    def row(self, candidate_id: Hashable) -> Optional[int]:
+        """The candidate's table row, or None if it is not registered"""
+        return self._builder.row(candidate_id)
+
+    def register(self, candidate_id: Hashable, profile: QueryProfile) -> None:
+        self._profiles[candidate_id] = profile
+        row = self._builder.add(candidate_id, profile)
+        self._table = None
+        if self._store is not None:
+            if row in self._store:
+                self._store.remove(row)
+            if profile.lat is not None and profile.lon is not None:
+                self._store.add(row, profile.lat, profile.lon)
+
+    def remove(self, candidate_id: Hashable) -> None:
+        del self._profiles[candidate_id]
+        # Rows after the removed one shift up, so the table and index are rebuilt
+        builder = CandidateTableBuilder(self._builder.interest_vocab, self._builder.preference_vocab, len(self._profiles))
+        for other_id, profile in self._profiles.items():
+            builder.add(other_id, profile)
+        self._builder = builder
+        self._table = self._store = None
+
+    @property
+    def table(self) -> CandidateTable:
+        if self._table is None:
+            self._table = self._builder.table()
+        return self._table
+
+    @property
+    def store(self) -> CandidateStore:
+        if self._store is None:
+            self._store = CandidateStore.from_table(self.table, cell_km=self.cell_km)
+        return self._store
+
+    def iter_top_matches(self, query: QueryProfile, k: int = 10, chunk_size: int = 4096, within_radius: bool = False,
+                         exclude: Optional[Hashable] = None) -> Iterator[Tuple[List[Dict[str, Any]], int, int, bool]]:
+        """Stream the running top k as (matches, scanned, total, done) after each chunk.
+
+        Each chunk is scored in one vectorized pass; only rows that can still
+        enter the bounded heap are pushed, so memory stays O(chunk + k). With
+        `within_radius`, the spatial index first drops candidates outside the
+        searcher's search_radius. `exclude` skips the searcher's own entry.
+        """
+        table = self.table
+        rows = self.candidate_rows(query, within_radius)
+        exclude_row = self.row(exclude) if exclude is not None else None
+        top = TopK(k)
+        for chunk_rows, scanned, total in iter_chunks(len(table) if rows is None else rows, chunk_size):
+            chunk = table.take(chunk_rows)
+            if len(chunk):
+                scores = score_candidates(query, chunk)
+                for score, key, factors in chunk_top(chunk, scores, k, top.threshold(), row_position(chunk_rows, exclude_row)):
+                    top.push(score, key, factors)
+            top.scanned = scanned
+            yield top_matches(top), scanned, total, scanned >= total
+
+    def candidate_rows(self, query: QueryProfile, within_radius: bool) -> Optional[np.ndarray]:
+        """Table rows inside the searcher's radius (sorted), or None for every row"""
+        if within_radius and query.lat is not None and query.lon is not None:
+            return np.array(sorted(row for row, _ in self.store.query_radius(query.lat, query.lon, query.search_radius)), dtype=np.int64)
+        return None
+
+def iter_chunks(rows, chunk_size: int) -> Iterator[Tuple[Any, int, int]]:
+    """(chunk rows, scanned after it, total) over a row count or an array of rows; one empty chunk if none"""
+    total = rows if isinstance(rows, int) else len(rows)
+    for start in range(0, total, chunk_size) or [0]:
+        chunk_rows = slice(start, start + chunk_size) if isinstance(rows, int) else rows[start:start + chunk_size]
+        yield chunk_rows, min(start + chunk_size, total), total
+
+def row_position(chunk_rows, row: Optional[int]) -> Optional[int]:
+    """Position of table row `row` within a chunk from iter_chunks, or None if it is not there"""
+    if row is None:
+        return None
+    if isinstance(chunk_rows, slice):
+        return row - chunk_rows.start if chunk_rows.start <= row < chunk_rows.stop else None
+    # Chunks of a row array are sorted
+    position = int(np.searchsorted(chunk_rows, row))
+    return position if position < len(chunk_rows) and chunk_rows[position] == row else None
+
+def chunk_top(chunk: CandidateTable, scores, k: int, threshold: float = float("-inf"),
+              exclude_at: Optional[int] = None) -> List[Tuple[float, Hashable, Dict[str, Any]]]:
+    """(score, candidate id, factors) of the chunk rows that can still enter a top k, in row order.
+
+    Rows below the chunk's own k-th best or the caller's current `threshold`
+    are dropped before any per-row Python work; ties are all kept so the
+    heap decides them by arrival order. `exclude_at` is a position in the
+    chunk to skip (see row_position).
+    """
+    totals = scores.total
+    if exclude_at is not None and exclude_at < len(totals):
+        totals = totals.copy()
+        totals[exclude_at] = -np.inf
+    if k and len(totals) > k:
+        kth = np.partition(totals, len(totals) - k)[len(totals) - k]
+        rows = np.flatnonzero(totals >= max(kth, threshold))
+    else:
+        rows = np.arange(len(totals))
+    entries = []
+    for row in rows:
+        if totals[row] == -np.inf:
+            continue
+        distance = scores.distance_km[row]
+        entries.append((float(totals[row]), chunk.ids[row], {
+            'interest': float(scores.interest[row]),
+            'age': float(scores.age[row]),
+            'location': float(scores.location[row]),
+            'preference': float(scores.preference[row]),
+            'distance_km': None if np.isnan(distance) else float(distance),
+        }))
+    return entries
+
+def top_matches(top: TopK) -> List[Dict[str, Any]]:
+    return [dict(candidate_id=key, score=score, **factors) for score, key, factors in top.results()]
@@ -1,10 +1,21 @@
 from datetime import datetime, timedelta
 from uuid import uuid4
+import asyncio
+import os
 from typing import Any, List, Dict
 from uagents import Agent, Context, Model, Protocol
-import requests
-from math import radians, sin, cos, sqrt, asin
-import difflib
+
+# Cached geocoding shared by both agents
+from geocoding import close_async_geocoder, get_async_geocoder, get_coordinates, get_geocode_cache
+from llm_pipeline import PendingPrompt, build_llm_pipeline
+from match_extractor import extract_match_request
+import metrics
+from profile_registry import ProfileRecord, ProfileRegistry
+from prompt_cache import build_prompt_cache, normalize_prompt
+from scoring_engine import QueryProfile, describe, get_plan
+from session_store import ACTIVE, EXPIRED, build_session_store
+from score_cache import build_score_cache, profile_fingerprint
+from ttl_cache import MISSING
 
 # Import the necessary components of the chat protocol
 from uagents_core.contrib.protocols.chat import (
@@ -28,27 +39,6 @@ def calculate_age(birthday_str: str) -> int | None:
     except:
         return None
 
-def get_coordinates(address: str) -> tuple[float, float]:
-    try:
-        url = f"https://nominatim.openstreetmap.org/search?q={requests.utils.quote(address)}&format=json&limit=1"
-        response = requests.get(url, headers={'User-Agent': 'DatingMatchAgent/1.0'})
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                return float(data[0]['lat']), float(data[0]['lon'])
-    except:
-        pass
-    return None, None
-
-def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * asin(sqrt(a))
-    km = 6371 * c
-    return km
-
 # Define sub models
 class Location(Model):
     address: str
@@ -83,6 +73,60 @@ class MatchResponse(Model):
     score: float
     details: str
 
+# Models for ranking one profile against the registered candidate pool
+class MatchProfile(Model):
+    personal_info: PersonalInfo
+    gender: str
+    location: Location
+    personal_interests: List[str]
+    partner_preferences: List[Preference]
+
+class CandidateProfile(Model):
+    candidate_id: str
+    profile: MatchProfile
+
+class RegisterCandidatesRequest(Model):
+    candidates: List[CandidateProfile]
+
+class RegisterCandidatesResponse(Model):
+    registered: int
+    pool_size: int
+
+class TopMatchesRequest(Model):
+    profile: MatchProfile
+    k: int = 10
+    within_radius: bool = False
+    exclude_id: str = ""
+
+class TopMatch(Model):
+    candidate_id: str
+    score: float
+    interest: float
+    age: float
+    location: float
+    preference: float
+    distance_km: float | None = None
+
+class TopMatchesResponse(Model):
+    matches: List[TopMatch]
+    scanned: int
+    total: int
+    partial: bool
+
+# Models for scoring profiles registered ahead of time, by id
+class RegisterProfileRequest(Model):
+    profile_id: str
+    profile: MatchProfile
+
+class RegisterProfileResponse(Model):
+    profile_id: str
+    registered: bool
+    details: str
+
+class MatchByIdRequest(Model):
+    profile_id1: str
+    profile_id2: str
+
 # Initialize the agent
 agent = Agent(
     name="DatingMatchAgent",
@@ -98,8 +142,11 @@ struct_output_client_proto = Protocol(
     name="StructuredOutputClientProtocol", version="0.1.0"
 )
 
-# Replace with one of the provided LLM addresses
-AI_AGENT_ADDRESS = 'agent1q0h70caed8ax769shpemapzkyk65uscw4xwk6dc4t3emvp5jdcvqs9xs32y'
+# Replace with one of the provided LLM addresses; LOVEFI_LLM_AGENT_ADDRESS points at another one,
+# such as the offline stand-in in local_llm_agent.py
+AI_AGENT_ADDRESS = os.environ.get(
+    "LOVEFI_LLM_AGENT_ADDRESS", 'agent1q0h70caed8ax769shpemapzkyk65uscw4xwk6dc4t3emvp5jdcvqs9xs32y'
+)
 
 if not AI_AGENT_ADDRESS:
     raise ValueError("AI_AGENT_ADDRESS not set")
@@ -158,148 +205,107 @@ def calculate_match_score(
         personal_info2, gender2, location2_obj, personal_interests2, partner_preferences2
     )
 
+# Adapter from derived features to the scoring engine's "match" plan (40/20/20/20)
+def score_match_features(
+    age1: int | None, age2: int | None, personal_interests1: List[str], personal_interests2: List[str],
+    address1: str, address2: str, search_radius1: float, search_radius2: float,
+    coordinates1: tuple, coordinates2: tuple, selected_options1: List[str], selected_options2: List[str],
+    max_age_diff: int = None
+) -> tuple[float, str]:
+    plan = get_plan("match")
+    if max_age_diff is not None:
+        plan = plan.with_params("age_gap", max_age_diff=max_age_diff)
+    score, results = plan.score(
+        QueryProfile(age1, coordinates1, search_radius1, address1, personal_interests1, selected_options1),
+        QueryProfile(age2, coordinates2, search_radius2, address2, personal_interests2, selected_options2)
+    )
+    return score, describe(results)
+
 # Simple function for test cases with direct age parameters
 def calculate_match_score_simple(
     age1: int, age2: int, personal_interests1: List[str], personal_interests2: List[str], 
     location1: Location, location2: Location, partner_preferences1: List[Preference], 
     partner_preferences2: List[Preference], max_age_diff1: int, max_age_diff2: int
 ) -> tuple[float, str]:
-    score = 0.0
-    details = []
-
-    # Interest compatibility (40%)
-    common_interests = set(personal_interests1).intersection(set(personal_interests2))
-    max_interests = max(len(personal_interests1), len(personal_interests2), 1)
-    interest_score = (len(common_interests) / max_interests) * 40
-    score += interest_score
-    details.append(f"Interest compatibility: {interest_score:.1f}/40 (Common interests: {', '.join(common_interests) or 'None'})")
-
-    # Age compatibility (20%) - Use direct ages
-    if age1 is not None and age2 is not None:
-        age_diff = abs(age1 - age2)
-        max_age_diff = max(max_age_diff1, max_age_diff2)
-        age_score = max(0, (1 - age_diff / max_age_diff)) * 20 if max_age_diff > 0 else 20
-        age_detail = f"{age_diff} years"
-    else:
-        age_score = 10  # Neutral if unknown
-        age_detail = "Unknown"
-    score += age_score
-    details.append(f"Age compatibility: {age_score:.1f}/20 (Age difference: {age_detail})")
-
-    # Location compatibility (20%)
-    loc_score = 0.0
-    dist = None
-    try:
-        lat1, lon1 = get_coordinates(location1.address)
-        lat2, lon2 = get_coordinates(location2.address)
-        if lat1 is not None and lon1 is not None and lat2 is not None and lon2 is not None:
-            dist = haversine(lon1, lat1, lon2, lat2)
-            max_radius = max(location1.search_radius, location2.search_radius)
-            if dist <= max_radius:
-                loc_score = 20 * (1 - dist / max_radius)
-            else:
-                loc_score = 0
-        else:
-            # Fallback to string similarity
-            similarity = difflib.SequenceMatcher(None, location1.address.lower(), location2.address.lower()).ratio()
-            loc_score = similarity * 20
-    except Exception:
-        # Fallback
-        similarity = difflib.SequenceMatcher(None, location1.address.lower(), location2.address.lower()).ratio()
-        loc_score = similarity * 20
-    score += loc_score
-    dist_str = f"{dist:.1f} km" if dist is not None else "Unknown"
-    details.append(f"Location compatibility: {loc_score:.1f}/20 (Distance: {dist_str})")
-
-    # Preference compatibility (20%)
-    num_matching = 0
-    total = min(len(partner_preferences1), len(partner_preferences2))
-    if total > 0:
-        for p1, p2 in zip(partner_preferences1, partner_preferences2):
-            if p1.selected_option == p2.selected_option:
-                num_matching += 1
-        pref_score = (num_matching / total) * 20
-    else:
-        pref_score = 0
-    score += pref_score
-    details.append(f"Preference compatibility: {pref_score:.1f}/20 (Matching preferences: {num_matching}/{total})")
-
-    # Ensure score is between 0 and 100
-    score = min(max(score, 0), 100)
-    return score, "; ".join(details)
+    return score_match_features(
+        age1, age2, personal_interests1, personal_interests2,
+        location1.address, location2.address, location1.search_radius, location2.search_radius,
+        get_coordinates(location1.address), get_coordinates(location2.address),
+        [p.selected_option for p in partner_preferences1], [p.selected_option for p in partner_preferences2],
+        max_age_diff=max(max_age_diff1, max_age_diff2)
+    )
 
 # Internal function with original logic
 def calculate_match_score_internal(
+    personal_info1: PersonalInfo, gender1: str, location1: Location, personal_interests1: List[str], partner_preferences1: List[Preference],
+    personal_info2: PersonalInfo, gender2: str, location2: Location, personal_interests2: List[str], partner_preferences2: List[Preference],
+    coordinates: tuple = None
+) -> tuple[float, str]:
+    if coordinates is None:
+        coordinates = (get_coordinates(location1.address), get_coordinates(location2.address))
+    return score_match_features(
+        calculate_age(personal_info1.birthday), calculate_age(personal_info2.birthday),
+        personal_interests1, personal_interests2,
+        location1.address, location2.address, location1.search_radius, location2.search_radius,
+        coordinates[0], coordinates[1],
+        [p.selected_option for p in partner_preferences1], [p.selected_option for p in partner_preferences2]
+    )
+
+# Non-blocking variant for the agent handlers: both addresses are geocoded concurrently
+async def calculate_match_score_internal_async(
     personal_info1: PersonalInfo, gender1: str, location1: Location, personal_interests1: List[str], partner_preferences1: List[Preference],
     personal_info2: PersonalInfo, gender2: str, location2: Location, personal_interests2: List[str], partner_preferences2: List[Preference]
 ) -> tuple[float, str]:
-    score = 0.0
-    details = []
-
-    # Calculate ages
-    age1 = calculate_age(personal_info1.birthday)
-    age2 = calculate_age(personal_info2.birthday)
-
-    # Interest compatibility (40%)
-    common_interests = set(personal_interests1).intersection(set(personal_interests2))
-    max_interests = max(len(personal_interests1), len(personal_interests2), 1)
-    interest_score = (len(common_interests) / max_interests) * 40
-    score += interest_score
-    details.append(f"Interest compatibility: {interest_score:.1f}/40 (Common interests: {', '.join(common_interests) or 'None'})")
-
-    # Age compatibility (20%)
-    if age1 is not None and age2 is not None:
-        age_diff = abs(age1 - age2)
-        max_age_diff = 10  # Default, can be extended if added to preferences
-        age_score = max(0, (1 - age_diff / max_age_diff)) * 20 if max_age_diff > 0 else 20
-        age_detail = f"{age_diff} years"
-    else:
-        age_score = 10  # Neutral if unknown
-        age_detail = "Unknown"
-    score += age_score
-    details.append(f"Age compatibility: {age_score:.1f}/20 (Age difference: {age_detail})")
-
-    # Location compatibility (20%)
-    loc_score = 0.0
-    dist = None
-    try:
-        lat1, lon1 = get_coordinates(location1.address)
-        lat2, lon2 = get_coordinates(location2.address)
-        if lat1 is not None and lon1 is not None and lat2 is not None and lon2 is not None:
-            dist = haversine(lon1, lat1, lon2, lat2)
-            max_radius = max(location1.search_radius, location2.search_radius)
-            if dist <= max_radius:
-                loc_score = 20 * (1 - dist / max_radius)
-            else:
-                loc_score = 0
-        else:
-            # Fallback to string similarity
-            similarity = difflib.SequenceMatcher(None, location1.address.lower(), location2.address.lower()).ratio()
-            loc_score = similarity * 20
-    except Exception:
-        # Fallback
-        similarity = difflib.SequenceMatcher(None, location1.address.lower(), location2.address.lower()).ratio()
-        loc_score = similarity * 20
-    score += loc_score
-    dist_str = f"{dist:.1f} km" if dist is not None else "Unknown"
-    details.append(f"Location compatibility: {loc_score:.1f}/20 (Distance: {dist_str})")
-
-    # Preference compatibility (20%)
-    num_matching = 0
-    total = min(len(partner_preferences1), len(partner_preferences2))
-    if total > 0:
-        for p1, p2 in zip(partner_preferences1, partner_preferences2):
-            if p1.selected_option == p2.selected_option:
-                num_matching += 1
-        pref_score = (num_matching / total) * 20
-    else:
-        pref_score = 0
-    score += pref_score
-    details.append(f"Preference compatibility: {pref_score:.1f}/20 (Matching preferences: {num_matching}/{total})")
+    coordinates = await get_async_geocoder().geocode_many(location1.address, location2.address)
+    return calculate_match_score_internal(
+        personal_info1, gender1, location1, personal_interests1, partner_preferences1,
+        personal_info2, gender2, location2, personal_interests2, partner_preferences2,
+        coordinates=coordinates
+    )
 
-    # Ensure score is between 0 and 100
-    score = min(max(score, 0), 100)
-    return score, "; ".join(details)
+# Pair scores memoized by the content of both profiles, shared by the match handlers
+match_score_cache = build_score_cache()
+
+# Stage timings and cache counters (LOVEFI_METRICS=1), logged every LOVEFI_METRICS_LOG_PERIOD seconds
+METRICS_LOG_PERIOD = float(os.environ.get("LOVEFI_METRICS_LOG_PERIOD", "60"))
+if match_score_cache is not None:
+    metrics.get_metrics().add_collector("score_cache", metrics.stats_collector("lovefi_score_cache", match_score_cache.stats))
+metrics.get_metrics().add_collector("geocode_cache", metrics.stats_collector("lovefi_geocode_cache", lambda: get_geocode_cache().stats()))
+
+async def send_timed(ctx: Context, destination: str, message: Model):
+    with metrics.timed("send"):
+        await ctx.send(destination, message)
+
+def match_side_fields(personal_info: PersonalInfo, gender: str, location: Location,
+                      personal_interests: List[str], partner_preferences: List[Preference]) -> Dict:
+    # Only what score_match_features reads; names and gender do not affect the score
+    return {
+        'age': calculate_age(personal_info.birthday),
+        'interests': sorted(personal_interests),
+        'address': location.address.lower(),
+        'search_radius': location.search_radius,
+        'preferences': [p.selected_option for p in partner_preferences],
+    }
+
+async def calculate_match_score_cached(side1: tuple, side2: tuple) -> tuple[float, str]:
+    """calculate_match_score_internal_async for two (personal_info, gender, location, interests, preferences) sides"""
+    if match_score_cache is None:
+        return await calculate_match_score_internal_async(*side1, *side2)
+    coordinates = await get_async_geocoder().geocode_many(side1[2].address, side2[2].address)
+    # The coordinates are part of the key, so a score computed with the address fallback while
+    # geocoding failed is never served once the address resolves
+    fingerprint1 = profile_fingerprint(dict(match_side_fields(*side1), coordinates=coordinates[0]))
+    fingerprint2 = profile_fingerprint(dict(match_side_fields(*side2), coordinates=coordinates[1]))
+    result = match_score_cache.get(fingerprint1, fingerprint2)
+    if result is MISSING:
+        # Score in fingerprint order so (A, B) and (B, A) get the same result even
+        # where the address fallback is not symmetric
+        if fingerprint2 < fingerprint1:
+            side1, side2 = side2, side1
+            coordinates = coordinates[::-1]
+        result = calculate_match_score_internal(*side1, *side2, coordinates=tuple(coordinates))
+        match_score_cache.set(fingerprint1, fingerprint2, result)
+    return result
 
 class StructuredOutputPrompt(Model):
     prompt: str
@@ -308,10 +314,38 @@ class StructuredOutputPrompt(Model):
 class StructuredOutputResponse(Model):
     output: dict[str, Any]
 
+async def send_prompt(ctx: Context, prompt: str, output_schema: Dict[str, Any]):
+    await send_timed(ctx, AI_AGENT_ADDRESS, StructuredOutputPrompt(prompt=prompt, output_schema=output_schema))
+
+async def prompt_failed(prompt: PendingPrompt):
+    try:
+        await prompt.context.send(
+            prompt.sender,
+            create_text_chat("Sorry, I couldn't process your match request. Please try again later."),
+        )
+    finally:
+        chat_sessions.answered(str(prompt.context.session))
+
+# Chat session -> sender; answers for sessions that ended or expired meanwhile are not scored
+chat_sessions = build_session_store()
+metrics.get_metrics().add_collector("sessions", metrics.stats_collector("lovefi_sessions", chat_sessions.stats))
+
+# Match requests already extracted from a chat prompt, so a resent prompt skips the LLM
+prompt_cache = build_prompt_cache()
+if prompt_cache is not None:
+    metrics.get_metrics().add_collector("prompt_cache", metrics.stats_collector("lovefi_prompt_cache", prompt_cache.stats))
+
+# Prompts the local extractor reads with at least this confidence skip the LLM; above 1 disables it
+EXTRACTOR_CONFIDENCE = float(os.environ.get("LOVEFI_EXTRACTOR_CONFIDENCE", "0.95"))
+
+# Chat prompts go to the LLM agent in batches; the MatchRequest schema is generated once.
+# (Model.model_json_schema() is the schema as a JSON string, which output_schema rejects.)
+llm_pipeline = build_llm_pipeline(MatchRequest.schema, send_prompt, on_failure=prompt_failed)
+
 @chat_proto.on_message(ChatMessage)
 async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
     ctx.logger.info(f"Got a message from {sender}: {msg.content}")
-    ctx.storage.set(str(ctx.session), sender)
+    chat_sessions.open(str(ctx.session), sender)
     await ctx.send(
         sender,
         ChatAcknowledgement(timestamp=datetime.utcnow(), acknowledged_msg_id=msg.msg_id),
@@ -321,19 +355,36 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         if isinstance(item, StartSessionContent):
             ctx.logger.info(f"Got a start session message from {sender}")
             continue
+        elif isinstance(item, EndSessionContent):
+            # Prompts sent earlier in this message still get their answers
+            chat_sessions.end(str(ctx.session))
         elif isinstance(item, TextContent):
             ctx.logger.info(f"Got a text message from {sender}: {item.text}")
-            ctx.storage.set(str(ctx.session), sender)
-            await ctx.send(
-                AI_AGENT_ADDRESS,
-                StructuredOutputPrompt(
-                    prompt=item.text,
-                    output_schema=MatchRequest.model_json_schema()
-                ),
-            )
+            request = prompt_cache.get(normalize_prompt(item.text), None) if prompt_cache is not None else None
+            if request is None:
+                request = extract_locally(item.text)
+            if request is not None:
+                await reply_with_match(ctx, sender, request)
+            else:
+                # Replies go out with this ctx, so they stay in the sender's chat session
+                chat_sessions.expect(str(ctx.session))
+                llm_pipeline.submit(ctx, sender, item.text)
         else:
             ctx.logger.info(f"Got unexpected content from {sender}")
 
+def extract_locally(text: str) -> MatchRequest | None:
+    """The match request in already-structured chat text, or None when the LLM should read it"""
+    with metrics.timed("extract"):
+        extraction = extract_match_request(text)
+        request = None
+        if extraction.confidence >= EXTRACTOR_CONFIDENCE:
+            try:
+                request = MatchRequest.parse_obj(extraction.request)
+            except Exception:
+                request = None
+    metrics.inc("lovefi_extractor_total", outcome="local" if request is not None else "llm")
+    return request
+
 @chat_proto.on_message(ChatAcknowledgement)
 async def handle_ack(ctx: Context, sender: str, msg: ChatAcknowledgement):
     ctx.logger.info(
@@ -344,14 +395,46 @@ async def handle_ack(ctx: Context, sender: str, msg: ChatAcknowledgement):
 async def handle_structured_output_response(
     ctx: Context, sender: str, msg: StructuredOutputResponse
 ):
-    session_sender = ctx.storage.get(str(ctx.session))
-    if session_sender is None:
+    answers = llm_pipeline.complete(str(ctx.session), msg.output)
+    if not answers:
         ctx.logger.error(
-            "Discarding message because no session sender found in storage"
+            "Discarding message because no prompt is pending in this session"
         )
         return
+    await asyncio.gather(*(reply_in_session(prompt, output) for prompt, output in answers))
+
+async def reply_in_session(prompt: PendingPrompt, output: Dict[str, Any] | None):
+    try:
+        await _reply_in_session(prompt, output)
+    finally:
+        chat_sessions.answered(str(prompt.context.session))
+
+async def _reply_in_session(prompt: PendingPrompt, output: Dict[str, Any] | None):
+    session = str(prompt.context.session)
+    state, session_sender = chat_sessions.lookup(session)
+    if state == EXPIRED:
+        # Other prompts of this session may still be waiting on the LLM; each gets its own reply
+        # before the session closes, so end() rather than close()
+        owed = chat_sessions.owed(session) - 1
+        prompt.context.logger.warning(
+            f"Dropping structured output for request {prompt.request_id}: chat session {session} expired "
+            f"before it arrived ({owed} more answer(s) still owed)"
+        )
+        chat_sessions.end(session)
+        await prompt.context.send(
+            session_sender,
+            create_text_chat(
+                "Sorry, your chat session expired before your match request was processed. Please send it again."
+            ),
+        )
+    elif state == ACTIVE:
+        await reply_to_prompt(prompt.context, session_sender, prompt.text, output)
+    else:
+        prompt.context.logger.warning(f"Dropping structured output for request {prompt.request_id}: chat session {session} has ended")
 
-    if "<UNKNOWN>" in str(msg.output):
+async def reply_to_prompt(ctx: Context, session_sender: str, text: str, output: Dict[str, Any] | None):
+    """Score the match the LLM extracted from the chat prompt `text` and reply to its sender"""
+    if output is None or "<UNKNOWN>" in str(output):
         await ctx.send(
             session_sender,
             create_text_chat(
@@ -361,7 +444,8 @@ async def handle_structured_output_response(
         return
 
     try:
-        prompt = MatchRequest.parse_obj(msg.output)
+        with metrics.timed("parse"):
+            prompt = MatchRequest.parse_obj(output)
     except Exception as err:
         ctx.logger.error(f"Error parsing structured output: {err}")
         await ctx.send(
@@ -372,10 +456,16 @@ async def handle_structured_output_response(
         )
         return
 
+    if prompt_cache is not None:
+        prompt_cache.set(normalize_prompt(text), prompt)
+    await reply_with_match(ctx, session_sender, prompt)
+
+async def reply_with_match(ctx: Context, session_sender: str, prompt: MatchRequest):
+    """Score a parsed (or cached) chat match request and send the result to `session_sender`"""
     try:
-        score, details = calculate_match_score_internal(
-            prompt.personal_info1, prompt.gender1, prompt.location1, prompt.personal_interests1, prompt.partner_preferences1,
-            prompt.personal_info2, prompt.gender2, prompt.location2, prompt.personal_interests2, prompt.partner_preferences2
+        score, details = await calculate_match_score_cached(
+            (prompt.personal_info1, prompt.gender1, prompt.location1, prompt.personal_interests1, prompt.partner_preferences1),
+            (prompt.personal_info2, prompt.gender2, prompt.location2, prompt.personal_interests2, prompt.partner_preferences2)
         )
     except Exception as err:
         ctx.logger.error(f"Error calculating match score: {err}")
@@ -391,19 +481,19 @@ async def handle_structured_output_response(
     name2 = f"{prompt.personal_info2.first_name} {prompt.personal_info2.last_name}"
     response_text = f"Match Score for {name1} and {name2}: {score:.1f}/100\nDetails: {details}"
     chat_message = create_text_chat(response_text)
-    await ctx.send(session_sender, chat_message)
+    await send_timed(ctx, session_sender, chat_message)
 
 # Protocol handler for direct match calculation requests
 @agent.on_message(MatchRequest, replies=MatchResponse)
 async def handle_match_calculation(ctx: Context, sender: str, msg: MatchRequest):
     ctx.logger.info(f"Received match calculation request from {sender}")
     try:
-        score, details = calculate_match_score_internal(
-            msg.personal_info1, msg.gender1, msg.location1, msg.personal_interests1, msg.partner_preferences1,
-            msg.personal_info2, msg.gender2, msg.location2, msg.personal_interests2, msg.partner_preferences2
+        score, details = await calculate_match_score_cached(
+            (msg.personal_info1, msg.gender1, msg.location1, msg.personal_interests1, msg.partner_preferences1),
+            (msg.personal_info2, msg.gender2, msg.location2, msg.personal_interests2, msg.partner_preferences2)
         )
         response = MatchResponse(score=score, details=details)
-        await ctx.send(sender, response)
+        await send_timed(ctx, sender, response)
     except Exception as err:
         ctx.logger.error(f"Error processing match request: {err}")
         error_response = MatchResponse(
@@ -412,18 +502,227 @@ async def handle_match_calculation(ctx: Context, sender: str, msg: MatchRequest)
         )
         await ctx.send(sender, error_response)
 
+# Candidates registered for top-k ranking, and how many are scored between partial replies
+_candidate_pool = None
+TOP_MATCHES_CHUNK = 50_000
+
+def get_candidate_pool():
+    # Built on first use so numpy stays out of agent startup; saved profiles join it then
+    global _candidate_pool
+    if _candidate_pool is None:
+        from candidate_pool import CandidatePool
+        _candidate_pool = CandidatePool()
+        for record in profile_registry:
+            _candidate_pool.register(record.profile_id, record.query_profile())
+    return _candidate_pool
+
+# Worker processes for ranking large pools (LOVEFI_SCORING_WORKERS); None keeps it in process.
+# Single-pair scores stay inline: they take microseconds, less than a round trip to a worker.
+_scoring_pool = None
+_scoring_pool_checked = False
+
+def get_scoring_pool():
+    global _scoring_pool, _scoring_pool_checked
+    if not _scoring_pool_checked:
+        from scoring_pool import build_scoring_pool
+        _scoring_pool, _scoring_pool_checked = build_scoring_pool(), True
+    return _scoring_pool
+
+def reset_scoring_pool(broken) -> None:
+    global _scoring_pool, _scoring_pool_checked
+    if _scoring_pool is broken:
+        broken.close()
+        _scoring_pool, _scoring_pool_checked = None, False
+
+async def profile_features(profiles: List[MatchProfile]) -> List[QueryProfile]:
+    coordinates = await get_async_geocoder().geocode_many(*(p.location.address for p in profiles))
+    return [
+        QueryProfile(
+            age=calculate_age(p.personal_info.birthday),
+            coordinates=coords,
+            search_radius=p.location.search_radius,
+            address=p.location.address,
+            interests=p.personal_interests,
+            preferences=[pref.selected_option for pref in p.partner_preferences],
+        )
+        for p, coords in zip(profiles, coordinates)
+    ]
+
+@agent.on_message(RegisterCandidatesRequest, replies=RegisterCandidatesResponse)
+async def handle_register_candidates(ctx: Context, sender: str, msg: RegisterCandidatesRequest):
+    features = await profile_features([c.profile for c in msg.candidates])
+    candidate_pool = get_candidate_pool()
+    for candidate, feature in zip(msg.candidates, features):
+        candidate_pool.register(candidate.candidate_id, feature)
+    ctx.logger.info(f"Registered {len(msg.candidates)} candidates from {sender}; pool size {len(candidate_pool)}")
+    await ctx.send(sender, RegisterCandidatesResponse(registered=len(msg.candidates), pool_size=len(candidate_pool)))
+
+# Streams the running top k as partial responses, then a final one with partial=False
+@agent.on_message(TopMatchesRequest, replies=TopMatchesResponse)
+async def handle_top_matches(ctx: Context, sender: str, msg: TopMatchesRequest):
+    ctx.logger.info(f"Received top-{msg.k} matches request from {sender}")
+    (query,) = await profile_features([msg.profile])
+    options = dict(k=msg.k, chunk_size=TOP_MATCHES_CHUNK, within_radius=msg.within_radius, exclude=msg.exclude_id or None)
+    scoring_pool = get_scoring_pool()
+    if scoring_pool is not None:
+        # Chunks are scored in the workers; the event loop only merges them
+        try:
+            async for matches, scanned, total, done in scoring_pool.iter_top_matches(get_candidate_pool(), query, **options):
+                await send_top_matches(ctx, sender, matches, scanned, total, done)
+            return
+        except Exception as err:
+            # A crashed worker breaks the whole executor; the next request starts a fresh pool
+            ctx.logger.error(f"Scoring pool failed ({type(err).__name__}: {err}); ranking in process")
+            metrics.inc("lovefi_fallback_total", path="scoring_pool")
+            reset_scoring_pool(scoring_pool)
+    for matches, scanned, total, done in get_candidate_pool().iter_top_matches(query, **options):
+        await send_top_matches(ctx, sender, matches, scanned, total, done)
+        # Let other handlers run between chunks of a large pool
+        await asyncio.sleep(0)
+
+async def send_top_matches(ctx: Context, sender: str, matches: List[Dict[str, Any]], scanned: int, total: int, done: bool):
+    with metrics.timed("serialize"):
+        response = TopMatchesResponse(
+            matches=[TopMatch(**match) for match in matches], scanned=scanned, total=total, partial=not done
+        )
+    await send_timed(ctx, sender, response)
+
+# Registered profiles keep their derived features (birth date, coordinates, interests) so
+# repeated matches skip geocoding and re-parsing
+profile_registry = ProfileRegistry(os.environ.get("LOVEFI_PROFILE_REGISTRY"))
+
+def score_records(record1: ProfileRecord, record2: ProfileRecord) -> tuple[float, str]:
+    score, results = get_plan("match").score(record1.query_profile(), record2.query_profile())
+    return score, describe(results)
+
+def record_fingerprint(record: ProfileRecord) -> str:
+    return profile_fingerprint({
+        'age': record.age,
+        'interests': sorted(record.interests),
+        'address': record.address.lower(),
+        'search_radius': record.search_radius,
+        'coordinates': record.coordinates,
+        'preferences': record.selected_options,
+    })
+
+def score_records_cached(record1: ProfileRecord, record2: ProfileRecord) -> tuple[float, str]:
+    if match_score_cache is None:
+        return score_records(record1, record2)
+    fingerprint1, fingerprint2 = record_fingerprint(record1), record_fingerprint(record2)
+    if fingerprint2 < fingerprint1:
+        record1, record2 = record2, record1
+    return match_score_cache.get_or_compute(fingerprint1, fingerprint2, lambda: score_records(record1, record2))
+
+def store_record(record: ProfileRecord) -> None:
+    """Register or replace a profile, keeping the score cache and candidate pool in step"""
+    previous = profile_registry.get(record.profile_id)
+    if previous is not None and match_score_cache is not None:
+        # Scores of the replaced version are never served for this id again
+        match_score_cache.invalidate(record_fingerprint(previous))
+    profile_registry.register(record)
+    if _candidate_pool is not None:
+        _candidate_pool.register(record.profile_id, record.query_profile())
+
+async def resolve_record(record: ProfileRecord) -> ProfileRecord:
+    """The record with its address geocoded, retrying one whose geocoding failed before"""
+    if record.resolved or not record.address:
+        return record
+    coordinates = await get_async_geocoder().geocode(record.address)
+    if coordinates[0] is None:
+        return record
+    resolved = record.with_coordinates(coordinates)
+    store_record(resolved)
+    return resolved
+
+@agent.on_message(RegisterProfileRequest, replies=RegisterProfileResponse)
+async def handle_register_profile(ctx: Context, sender: str, msg: RegisterProfileRequest):
+    profile = msg.profile
+    coordinates = await get_async_geocoder().geocode(profile.location.address)
+    record = ProfileRecord(
+        profile_id=msg.profile_id,
+        first_name=profile.personal_info.first_name,
+        last_name=profile.personal_info.last_name,
+        gender=profile.gender,
+        birthday=profile.personal_info.birthday,
+        coordinates=coordinates,
+        address=profile.location.address,
+        search_radius=profile.location.search_radius,
+        interests=profile.personal_interests,
+        selected_options=[pref.selected_option for pref in profile.partner_preferences],
+    )
+    store_record(record)
+    ctx.logger.info(f"Registered profile {msg.profile_id} from {sender}")
+    await ctx.send(sender, RegisterProfileResponse(
+        profile_id=msg.profile_id, registered=True,
+        details=f"Coordinates: {coordinates[0]}, {coordinates[1]}; age: {record.age}"
+    ))
+
+@agent.on_message(MatchByIdRequest, replies=MatchResponse)
+async def handle_match_by_id(ctx: Context, sender: str, msg: MatchByIdRequest):
+    ctx.logger.info(f"Received match by id request from {sender}")
+    missing = [pid for pid in (msg.profile_id1, msg.profile_id2) if pid not in profile_registry]
+    if missing:
+        await ctx.send(sender, MatchResponse(score=0.0, details=f"Unknown profile id(s): {', '.join(missing)}"))
+        return
+    record1, record2 = [await resolve_record(profile_registry.get(pid)) for pid in (msg.profile_id1, msg.profile_id2)]
+    score, details = score_records_cached(record1, record2)
+    await send_timed(ctx, sender, MatchResponse(score=score, details=details))
+
+# Persist registrations in batches rather than on every message
+@agent.on_interval(period=60.0)
+async def flush_profile_registry(ctx: Context):
+    if profile_registry.save():
+        ctx.logger.info(f"Saved {len(profile_registry)} registered profiles")
+
+def refresh_candidate_ages() -> int:
+    """Re-register pooled candidates whose age changed since they joined; returns how many"""
+    if _candidate_pool is None:
+        return 0
+    refreshed = 0
+    for record in profile_registry:
+        pooled = _candidate_pool.profile(record.profile_id)
+        if pooled is not None and pooled.age != record.age:
+            _candidate_pool.register(record.profile_id, record.query_profile())
+            refreshed += 1
+    return refreshed
+
+# Pool rows hold the age at registration; birthdays move it on
+@agent.on_interval(period=3600.0)
+async def refresh_pool_ages(ctx: Context):
+    refreshed = refresh_candidate_ages()
+    if refreshed:
+        ctx.logger.info(f"Updated the age of {refreshed} pooled candidates")
+
+@agent.on_interval(period=METRICS_LOG_PERIOD)
+async def log_metrics(ctx: Context):
+    if metrics.enabled:
+        ctx.logger.info(f"Metrics: {metrics.get_metrics().summary()}")
+
 # Include protocols in the agent
 agent.include(chat_proto)
 agent.include(struct_output_client_proto)
 
+@agent.on_interval(period=60.0)
+async def flush_chat_sessions(ctx: Context):
+    chat_sessions.purge()
+    chat_sessions.save()
+
+@agent.on_event("shutdown")
+async def shutdown(ctx: Context):
+    profile_registry.save()
+    chat_sessions.save()
+    await close_async_geocoder()
+    if _scoring_pool is not None:
+        _scoring_pool.close()
+
 @agent.on_event("startup")
 async def startup(ctx: Context):
     ctx.logger.info(f"DatingMatchAgent started. Address: {ctx.agent.address}")
-    ctx.logger.info("Agent accepts MatchRequest messages via protocol communication")
+    ctx.logger.info("Agent accepts MatchRequest, MatchByIdRequest, RegisterProfileRequest, RegisterCandidatesRequest and TopMatchesRequest messages via protocol communication")
 
 if __name__ == "__main__":
     print(f"DatingMatchAgent address: {agent.address}")
     print("Agent created successfully. Use this address in your tests.")
     print("Starting agent on http://localhost:8000...")
-    print("Agent handles protocol-based messages: MatchRequest")
+    print("Agent handles protocol-based messages: MatchRequest, RegisterCandidatesRequest, TopMatchesRequest")
     agent.run()
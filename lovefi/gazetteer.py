@@ -0,0 +1,283 @@
+import bisect
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from typing import Iterator, List, NamedTuple, Optional
+
+from geocoders import Geocoder
+from geocoding import normalize_address
+
+# Column positions in a GeoNames dump (allCountries.txt, cities15000.txt, ...)
+GEONAMES_COLUMNS = {
+    'name': 1,
+    'asciiname': 2,
+    'alternatenames': 3,
+    'latitude': 4,
+    'longitude': 5,
+    'feature_class': 6,
+    'country_code': 8,
+    'admin1_code': 10,
+    'population': 14,
+}
+
+# Header aliases accepted for hand-made CSV/TSV gazetteers
+HEADER_ALIASES = {
+    'name': 'name',
+    'asciiname': 'asciiname',
+    'alternatenames': 'alternatenames',
+    'alternate_names': 'alternatenames',
+    'lat': 'latitude',
+    'latitude': 'latitude',
+    'lon': 'longitude',
+    'lng': 'longitude',
+    'longitude': 'longitude',
+    'feature_class': 'feature_class',
+    'country': 'country_code',
+    'country_code': 'country_code',
+    'admin1': 'admin1_code',
+    'admin1_code': 'admin1_code',
+    'state': 'admin1_code',
+    'population': 'population',
+}
+
+# Country spellings accepted after a place name besides its ISO code
+COUNTRY_ALIASES = {'usa': 'us', 'uk': 'gb'}
+
+INDEX_MAGIC = b"LFGAZID1"
+
+class Place(NamedTuple):
+    name: str
+    lat: float
+    lon: float
+    country_code: str
+    admin1_code: str
+    feature_class: str
+    population: int
+
+class _MappedKeys:
+    """Sorted UTF-8 keys in a mapped index file, as a sequence of bytes for bisect"""
+
+    __slots__ = ("_mm", "_bounds", "_start")
+
+    def __init__(self, mm: mmap.mmap, bounds: memoryview, start: int):
+        self._mm, self._bounds, self._start = mm, bounds, start
+
+    def __len__(self) -> int:
+        return len(self._bounds) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return self._mm[self._start + self._bounds[index]:self._start + self._bounds[index + 1]]
+
+class GazetteerGeocoder(Geocoder):
+    """Offline geocoder over a GeoNames-style gazetteer file.
+
+    The gazetteer and a sorted index of its normalized place names both stay
+    memory-mapped, so startup and resident memory do not grow with the dump.
+    The index is built on first use into `index_path` (default: next to the
+    gazetteer, or the temp directory if that is read-only) and rebuilt when
+    the gazetteer changes. Layout, in native byte order (recorded in the
+    header): 8-byte magic, u32 header length, JSON header, u64
+    key_bounds[count + 1] into the key blob, u64 row_offsets[count] into the
+    gazetteer, then the sorted keys.
+
+    An address is resolved by scanning its tokens for the longest known
+    place name, using the sorted keys as a prefix index to stop extending a
+    phrase as soon as no name can start with it. A name only counts where it
+    ends its comma-separated component, or is followed there only by the
+    place's own country/admin1 codes or a postal code, so street names such
+    as "Main" or "Park" do not match. Those codes anywhere in the address
+    break ties between same-named places, then population does.
+    """
+
+    name = "gazetteer"
+
+    # Longest place name, in tokens, tried when scanning an address
+    MAX_NAME_TOKENS = 6
+
+    def __init__(self, path: str, include_alternate_names: bool = True, index_path: Optional[str] = None):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._delimiter, self._columns, self._start = self._detect_format()
+        self._include_alternate_names = include_alternate_names
+        self.index_path = index_path or f"{path}.idx"
+        self._index = self._open_index()
+        if self._index is None:
+            try:
+                self._write_index(self.index_path)
+            except OSError:
+                digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+                self.index_path = os.path.join(tempfile.gettempdir(), f"lovefi-gazetteer-{digest}.idx")
+                self._write_index(self.index_path)
+            self._index = self._open_index()
+        self._keys, self._offsets = self._index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _source_stamp(self) -> dict:
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'alternate_names': self._include_alternate_names,
+                'byteorder': sys.byteorder}
+
+    def _open_index(self) -> Optional[tuple]:
+        """(keys, row offsets) from the index file, or None if it is missing or stale"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if mm[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            return None
+        (header_len,) = struct.unpack_from("<I", mm, len(INDEX_MAGIC))
+        start = len(INDEX_MAGIC) + 4
+        header = json.loads(mm[start:start + header_len])
+        if header.get('source') != self._source_stamp():
+            return None
+        count = header['count']
+        bounds_start = start + header_len
+        offsets_start = bounds_start + 8 * (count + 1)
+        keys_start = offsets_start + 8 * count
+        view = memoryview(mm)
+        self._index_mm = mm
+        return _MappedKeys(mm, view[bounds_start:offsets_start].cast("Q"), keys_start), view[offsets_start:keys_start].cast("Q")
+
+    def _write_index(self, index_path: str) -> None:
+        entries = sorted(self._index_entries())
+        keys = [key.encode('utf-8') for key, _ in entries]
+        header = json.dumps({'source': self._source_stamp(), 'count': len(keys)}).encode()
+        bounds = [0]
+        for key in keys:
+            bounds.append(bounds[-1] + len(key))
+        # Written under a temporary name so a reader never maps a half-written index
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            f.write(struct.pack(f"={len(bounds)}Q", *bounds))
+            f.write(struct.pack(f"={len(entries)}Q", *(offset for _, offset in entries)))
+            f.write(b"".join(keys))
+        os.replace(tmp_path, index_path)
+
+    def _detect_format(self) -> tuple[str, dict, int]:
+        first = self._mm.readline().decode('utf-8').rstrip('\r\n')
+        if '\t' in first and first.split('\t', 1)[0].isdigit():
+            return '\t', GEONAMES_COLUMNS, 0
+        delimiter = '\t' if '\t' in first else ','
+        header = next(csv.reader([first], delimiter=delimiter))
+        columns = {}
+        for index, column in enumerate(header):
+            field = HEADER_ALIASES.get(column.strip().lower())
+            if field is not None:
+                columns.setdefault(field, index)
+        missing = {'name', 'latitude', 'longitude'} - columns.keys()
+        if missing:
+            raise ValueError(f"Gazetteer {self.path} is missing columns: {', '.join(sorted(missing))}")
+        return delimiter, columns, self._mm.tell()
+
+    def _split(self, line: bytes) -> List[str]:
+        text = line.decode('utf-8').rstrip('\r\n')
+        if self._delimiter == '\t':
+            return text.split('\t')
+        return next(csv.reader([text]))
+
+    def _field(self, fields: List[str], name: str) -> str:
+        index = self._columns.get(name)
+        return fields[index] if index is not None and index < len(fields) else ""
+
+    def _iter_rows(self, start: int) -> Iterator[tuple[int, List[str]]]:
+        self._mm.seek(start)
+        while True:
+            offset = self._mm.tell()
+            line = self._mm.readline()
+            if not line:
+                return
+            if line.strip():
+                yield offset, self._split(line)
+
+    def _index_entries(self) -> Iterator[tuple[str, int]]:
+        for offset, fields in self._iter_rows(self._start):
+            names = {self._field(fields, 'name'), self._field(fields, 'asciiname')}
+            if self._include_alternate_names:
+                names.update(self._field(fields, 'alternatenames').split(','))
+            for key in {normalize_address(name) for name in names}:
+                if key:
+                    yield key, offset
+
+    def _place_at(self, offset: int) -> Place:
+        end = self._mm.find(b'\n', offset)
+        fields = self._split(self._mm[offset:end if end != -1 else len(self._mm)])
+        population = self._field(fields, 'population')
+        return Place(
+            name=self._field(fields, 'name'),
+            lat=float(self._field(fields, 'latitude')),
+            lon=float(self._field(fields, 'longitude')),
+            country_code=self._field(fields, 'country_code').lower(),
+            admin1_code=self._field(fields, 'admin1_code').lower(),
+            feature_class=self._field(fields, 'feature_class') or 'P',
+            population=int(population) if population.isdigit() else 0,
+        )
+
+    def _has_prefix(self, prefix: str) -> bool:
+        key = prefix.encode('utf-8')
+        index = bisect.bisect_left(self._keys, key)
+        return index < len(self._keys) and self._keys[index].startswith(key)
+
+    def lookup(self, name: str) -> List[Place]:
+        """All places whose (normalized) name is exactly `name`"""
+        key = normalize_address(name).encode('utf-8')
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        return [self._place_at(offset) for offset in self._offsets[lo:hi]]
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> List[str]:
+        """Distinct place names starting with `prefix`, in sorted order"""
+        key = normalize_address(prefix).encode('utf-8')
+        names = []
+        index = bisect.bisect_left(self._keys, key)
+        while index < len(self._keys) and len(names) < limit:
+            name = self._keys[index]
+            if not name.startswith(key):
+                break
+            if not names or names[-1] != name.decode('utf-8'):
+                names.append(name.decode('utf-8'))
+            index += 1
+        return names
+
+    @staticmethod
+    def _qualifies(place: Place, token: str) -> bool:
+        """Whether `token` may follow the place's name: its country or admin1 code, or a postal code"""
+        return (COUNTRY_ALIASES.get(token, token) in (place.country_code, place.admin1_code)
+                or any(c.isdigit() for c in token))
+
+    def resolve(self, address: str) -> Optional[Place]:
+        components = [normalize_address(part).split() for part in address.split(",")]
+        token_set = {token for tokens in components for token in tokens}
+        best_rank, best = None, None
+        for tokens in components:
+            for start in range(len(tokens)):
+                for end in range(start + 1, min(len(tokens), start + self.MAX_NAME_TOKENS) + 1):
+                    phrase = " ".join(tokens[start:end])
+                    if not self._has_prefix(phrase):
+                        break
+                    for place in self.lookup(phrase):
+                        # "Main" in "12 Main St" or "Park" in "Park Avenue" is part of a street name
+                        if not all(self._qualifies(place, token) for token in tokens[end:]):
+                            continue
+                        qualifiers = (place.country_code in token_set) + (place.admin1_code in token_set)
+                        rank = (qualifiers, end - start, place.feature_class == 'P', place.population)
+                        if best_rank is None or rank > best_rank:
+                            best_rank, best = rank, place
+        return best
+
+    def geocode(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        place = self.resolve(address)
+        if place is None:
+            return None, None
+        return place.lat, place.lon
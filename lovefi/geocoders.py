@@ -0,0 +1,83 @@
+from typing import Optional
+
+# requests and aiohttp are imported on first use: agents that geocode offline never load them
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = 'DatingMatchAgent/1.0'
+
+# Seconds before a single Nominatim lookup is abandoned
+GEOCODE_TIMEOUT = 5.0
+
+class Geocoder:
+    """Geocoding backend interface.
+
+    `geocode` returns (lat, lon), or (None, None) when the backend has no
+    answer for the address. Transport failures raise so callers can tell
+    "unknown place" apart from "backend unavailable". Remote backends have
+    their answers cached by geocoding.GeocodeCache; local ones are consulted
+    directly.
+    """
+
+    name = "geocoder"
+    remote = False
+
+    def geocode(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        raise NotImplementedError
+
+    async def geocode_async(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        # Local backends answer in microseconds, so calling inline is fine
+        return self.geocode(address)
+
+    async def close(self) -> None:
+        pass
+
+class NominatimGeocoder(Geocoder):
+    """OpenStreetMap Nominatim over HTTP (public instance is limited to 1 req/s)"""
+
+    name = "nominatim"
+    remote = True
+
+    def __init__(self, url: str = NOMINATIM_URL, timeout: float = GEOCODE_TIMEOUT, max_connections: int = 8):
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    @staticmethod
+    def _parse(data) -> tuple[Optional[float], Optional[float]]:
+        if data:
+            return float(data[0]['lat']), float(data[0]['lon'])
+        return None, None
+
+    def geocode(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        import requests
+        response = requests.get(
+            self.url,
+            params={'q': address, 'format': 'json', 'limit': 1},
+            headers={'User-Agent': USER_AGENT},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return self._parse(response.json())
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        # Created lazily so it binds to the loop the agent actually runs on
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                headers={'User-Agent': USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+            )
+        return self._session
+
+    async def geocode_async(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        params = {'q': address, 'format': 'json', 'limit': '1'}
+        async with self._get_session().get(self.url, params=params) as response:
+            response.raise_for_status()
+            return self._parse(await response.json(content_type=None))
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,317 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+import metrics
+from geocoders import Geocoder, NominatimGeocoder
+from ttl_cache import MISSING, TTLCache
+
+# Resolved addresses barely move; unresolved ones may be typos that get fixed upstream
+POSITIVE_TTL = 30 * 24 * 3600
+NEGATIVE_TTL = 24 * 3600
+
+def cache_dir() -> str:
+    """Per-user cache directory ($XDG_CACHE_HOME/lovefi, else ~/.cache/lovefi); the package may be read-only"""
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "lovefi")
+
+def default_cache_path() -> str:
+    return os.environ.get("LOVEFI_GEOCODE_CACHE", os.path.join(cache_dir(), "geocode_cache.sqlite3"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_address(address: str) -> str:
+    """Canonical cache key: 'New York, NY' and 'new york ny' map to the same entry"""
+    if not address:
+        return ""
+    text = unicodedata.normalize("NFKC", address).lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+class GeocodeCache:
+    """Two-level geocode cache: an in-process LRU in front of a SQLite file.
+
+    Entries are keyed by `normalize_address`. Addresses that Nominatim could
+    not resolve are cached as (None, None) with a shorter TTL so we stop
+    asking for them on every match. Without a path, or if the file cannot be
+    opened (e.g. a read-only filesystem), only the memory tier is used.
+    """
+
+    # Prune expired and surplus rows from disk every this many writes
+    PRUNE_EVERY = 256
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        maxsize: int = 4096,
+        ttl: float = POSITIVE_TTL,
+        negative_ttl: float = NEGATIVE_TTL,
+        max_disk_entries: int = 1_000_000,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_disk_entries = max_disk_entries
+        # Disk rows carry wall-clock expiry, so the memory tier uses the same clock
+        self._memory = TTLCache(maxsize=maxsize, clock=time.time)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self._db = None
+        if path:
+            try:
+                self._db = self._open(path)
+            except (OSError, sqlite3.Error):
+                metrics.inc("lovefi_fallback_total", path="geocode_cache_disk")
+            else:
+                self._prune()
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "key TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS geocode_expires ON geocode (expires_at)")
+        except sqlite3.Error:
+            db.close()
+            raise
+        return db
+
+    def get(self, address: str) -> Any:
+        """Return cached (lat, lon), (None, None) for a known miss, or MISSING"""
+        key = normalize_address(address)
+        with self._lock:
+            coords = self._memory.get(key)
+            if coords is MISSING and self._db is not None:
+                row = self._db.execute(
+                    "SELECT lat, lon, expires_at FROM geocode WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                ).fetchone()
+                if row is not None:
+                    coords = (row[0], row[1])
+                    self._memory.set(key, coords, expires_at=row[2])
+                    self.disk_hits += 1
+            if coords is not MISSING and coords[0] is None:
+                self.negative_hits += 1
+            return coords
+
+    def set(self, address: str, lat: Optional[float], lon: Optional[float]) -> None:
+        key = normalize_address(address)
+        ttl = self.negative_ttl if lat is None or lon is None else self.ttl
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._memory.set(key, (lat, lon), expires_at=expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocode (key, lat, lon, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, lat, lon, expires_at),
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune()
+
+    def _prune(self) -> None:
+        self._db.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),))
+        # Past the size cap, drop the entries closest to expiry first
+        self._db.execute(
+            "DELETE FROM geocode WHERE key IN ("
+            "SELECT key FROM geocode ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM geocode")
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        memory = self._memory.stats()
+        misses = memory['misses'] - self.disk_hits
+        return {
+            'hits': memory['hits'] + self.disk_hits,
+            'memory_hits': memory['hits'],
+            'disk_hits': self.disk_hits,
+            'negative_hits': self.negative_hits,
+            'misses': misses,
+            'evictions': memory['evictions'],
+            'memory_size': memory['size'],
+        }
+
+_default_cache: Optional[GeocodeCache] = None
+
+def get_geocode_cache() -> GeocodeCache:
+    """Process-wide cache; LOVEFI_GEOCODE_CACHE overrides the SQLite path ('' keeps it in memory)"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GeocodeCache(path=default_cache_path())
+    return _default_cache
+
+def set_geocode_cache(cache: Optional[GeocodeCache]) -> None:
+    global _default_cache
+    _default_cache = cache
+
+_geocoders: Optional[List[Geocoder]] = None
+
+def build_geocoders() -> List[Geocoder]:
+    """Backends named in LOVEFI_GEOCODERS, in lookup order.
+
+    The default "gazetteer,nominatim" answers from the local file named by
+    LOVEFI_GAZETTEER when one is configured and only goes over the network
+    for addresses it does not know. Set LOVEFI_GEOCODERS=gazetteer to run
+    fully offline.
+    """
+    backends = []
+    for name in os.environ.get("LOVEFI_GEOCODERS", "gazetteer,nominatim").split(","):
+        name = name.strip()
+        if name == "gazetteer":
+            path = os.environ.get("LOVEFI_GAZETTEER")
+            if path:
+                from gazetteer import GazetteerGeocoder
+                backends.append(GazetteerGeocoder(path))
+        elif name == "nominatim":
+            backends.append(NominatimGeocoder())
+        elif name:
+            raise ValueError(f"Unknown geocoder backend: {name}")
+    return backends
+
+def get_geocoders() -> List[Geocoder]:
+    global _geocoders
+    if _geocoders is None:
+        _geocoders = build_geocoders()
+    return _geocoders
+
+def set_geocoders(backends: Optional[List[Geocoder]]) -> None:
+    global _geocoders
+    _geocoders = backends
+
+def _remember(cache: GeocodeCache, address: str, coords, remote_answered: bool) -> None:
+    # Only remote answers are cached: local backends are already fast, and a
+    # miss is only worth remembering if a remote backend actually said so
+    if remote_answered:
+        cache.set(address, *coords)
+
+def get_coordinates(address: str) -> tuple[float, float]:
+    if not normalize_address(address):
+        return None, None
+    with metrics.timed("geocode"):
+        return _get_coordinates(address)
+
+def _get_coordinates(address: str) -> tuple[float, float]:
+    cache = get_geocode_cache()
+    remote_answered = False
+    for backend in get_geocoders():
+        if backend.remote:
+            coords = cache.get(address)
+            if coords is not MISSING:
+                return coords
+        try:
+            coords = backend.geocode(address)
+        except Exception:
+            metrics.inc("lovefi_fallback_total", path="geocoder_error")
+            continue
+        remote_answered = remote_answered or backend.remote
+        if coords[0] is not None:
+            _remember(cache, address, coords, backend.remote)
+            return coords
+    _remember(cache, address, (None, None), remote_answered)
+    return None, None
+
+class AsyncGeocoder:
+    """Non-blocking front of the geocoder chain for the agent event loop.
+
+    Shares the GeocodeCache and backends with `get_coordinates`, lets remote
+    backends use their pooled async sessions and collapses concurrent
+    lookups of the same address into a single request.
+    """
+
+    def __init__(self, cache: Optional[GeocodeCache] = None, backends: Optional[List[Geocoder]] = None):
+        self._cache = cache
+        self._backends = backends
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def cache(self) -> GeocodeCache:
+        return self._cache if self._cache is not None else get_geocode_cache()
+
+    @property
+    def backends(self) -> List[Geocoder]:
+        return self._backends if self._backends is not None else get_geocoders()
+
+    async def _resolve(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        remote_answered = False
+        for backend in self.backends:
+            if backend.remote:
+                coords = self.cache.get(address)
+                if coords is not MISSING:
+                    return coords
+            try:
+                coords = await backend.geocode_async(address)
+            except Exception:
+                # Timeouts and transport errors fall through to the next backend
+                metrics.inc("lovefi_fallback_total", path="geocoder_error")
+                continue
+            remote_answered = remote_answered or backend.remote
+            if coords[0] is not None:
+                _remember(self.cache, address, coords, backend.remote)
+                return coords
+        _remember(self.cache, address, (None, None), remote_answered)
+        return None, None
+
+    async def geocode(self, address: str) -> tuple[Optional[float], Optional[float]]:
+        key = normalize_address(address)
+        if not key:
+            return None, None
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            with metrics.timed("geocode"):
+                coords = await self._resolve(address)
+            pending.set_result(coords)
+            return coords
+        finally:
+            del self._inflight[key]
+            if not pending.done():
+                pending.cancel()
+
+    async def geocode_many(self, *addresses: str) -> list:
+        """Resolve several addresses concurrently, preserving order"""
+        return list(await asyncio.gather(*(self.geocode(address) for address in addresses)))
+
+    async def close(self) -> None:
+        for backend in self.backends:
+            await backend.close()
+
+_async_geocoder: Optional[AsyncGeocoder] = None
+
+def get_async_geocoder() -> AsyncGeocoder:
+    global _async_geocoder
+    if _async_geocoder is None:
+        _async_geocoder = AsyncGeocoder()
+    return _async_geocoder
+
+async def close_async_geocoder() -> None:
+    global _async_geocoder
+    if _async_geocoder is not None:
+        await _async_geocoder.close()
+        _async_geocoder = None
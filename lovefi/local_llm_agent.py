@@ -0,0 +1,94 @@
+"""
+Offline stand-in for the structured-output LLM agent.
+
+Answers StructuredOutputPrompt messages with canned outputs after a fixed
+delay, so the chat path of dating_match_agent.py can be exercised without
+network access:
+
+    python local_llm_agent.py   # prints its address
+    LOVEFI_LLM_AGENT_ADDRESS=<that address> python dating_match_agent.py
+
+Outputs are looked up by prompt text (case and spacing ignored) in the JSON
+object at LOVEFI_LOCAL_LLM_RESPONSES; any other prompt gets the output in
+LOVEFI_LOCAL_LLM_DEFAULT (match_request.json by default). Batched prompts
+from llm_pipeline.py get one answer per message, under the message's id.
+LOVEFI_LOCAL_LLM_DELAY sets the simulated round trip in seconds.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional
+
+from uagents import Agent, Context, Model, Protocol
+
+from llm_pipeline import split_batch_prompt
+
+UNKNOWN_OUTPUT = {"error": "<UNKNOWN>"}
+DEFAULT_OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "match_request.json")
+
+def _prompt_key(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+class StandInLLM:
+    """Canned structured outputs keyed by prompt text"""
+
+    def __init__(self, responses: Optional[Dict[str, Dict[str, Any]]] = None, default: Optional[Dict[str, Any]] = None):
+        self.responses = {_prompt_key(prompt): output for prompt, output in (responses or {}).items()}
+        self.default = default
+
+    @classmethod
+    def from_env(cls) -> "StandInLLM":
+        responses = None
+        if os.environ.get("LOVEFI_LOCAL_LLM_RESPONSES"):
+            with open(os.environ["LOVEFI_LOCAL_LLM_RESPONSES"], encoding="utf-8") as f:
+                responses = json.load(f)
+        with open(os.environ.get("LOVEFI_LOCAL_LLM_DEFAULT", DEFAULT_OUTPUT_PATH), encoding="utf-8") as f:
+            default = json.load(f)
+        return cls(responses, default)
+
+    def answer_one(self, prompt: str) -> Dict[str, Any]:
+        output = self.responses.get(_prompt_key(prompt), self.default)
+        return UNKNOWN_OUTPUT if output is None else output
+
+    def answer(self, prompt: str, output_schema: Dict[str, Any]) -> Dict[str, Any]:
+        """The output for a prompt; batched prompts (a `results` schema) get one result per message"""
+        if 'results' in output_schema.get('properties', {}):
+            return {"results": [
+                {"id": request_id, "request": self.answer_one(text)}
+                for request_id, text in split_batch_prompt(prompt)
+            ]}
+        return self.answer_one(prompt)
+
+# Same models as the client side in dating_match_agent.py, so the digests match
+class StructuredOutputPrompt(Model):
+    prompt: str
+    output_schema: dict[str, Any]
+
+class StructuredOutputResponse(Model):
+    output: dict[str, Any]
+
+LOCAL_LLM_DELAY = float(os.environ.get("LOVEFI_LOCAL_LLM_DELAY", "0.5"))
+
+agent = Agent(
+    name="local_llm_agent",
+    seed="local_llm_agent_seed",
+    port=8002,
+    endpoint=["http://localhost:8002/submit"]
+)
+
+struct_output_proto = Protocol(name="StructuredOutputClientProtocol", version="0.1.0")
+stand_in = StandInLLM.from_env()
+
+@struct_output_proto.on_message(StructuredOutputPrompt, replies=StructuredOutputResponse)
+async def handle_prompt(ctx: Context, sender: str, msg: StructuredOutputPrompt):
+    ctx.logger.info(f"Got a prompt from {sender} ({len(msg.prompt)} chars)")
+    await asyncio.sleep(LOCAL_LLM_DELAY)
+    await ctx.send(sender, StructuredOutputResponse(output=stand_in.answer(msg.prompt, msg.output_schema)))
+
+agent.include(struct_output_proto)
+
+if __name__ == "__main__":
+    print(f"Local LLM stand-in address: {agent.address}")
+    print("Start dating_match_agent.py with LOVEFI_LLM_AGENT_ADDRESS set to it")
+    agent.run()
@@ -0,0 +1,62 @@
+"""
+Fuzzy location similarity for addresses that could not be geocoded.
+
+Each location is reduced to character and padded trigram multisets. The
+similarity is a weighted Dice coefficient over the two:
+
+    UNIGRAM_WEIGHT * dice(chars) + (1 - UNIGRAM_WEIGHT) * dice(trigrams)
+
+Trigrams reward shared substrings the way difflib's ratio does, while the
+character term supplies the background similarity that ratio gives any two
+strings with common letters. With the weight below the score tracks
+difflib.SequenceMatcher.ratio() with a mean absolute error of about 0.05 on
+city and street names with typos, but costs O(length) instead of O(length^2).
+
+Unrelated names are where it differs most: ratio also counts letters shared
+in order without a common trigram, so "austin"/"boston" is 0.5 there and
+0.3 here. On the addresses in golden_scores.json the two differ by 0.09 on
+average and at most 0.17.
+"""
+
+from collections import Counter
+from functools import lru_cache
+from typing import Optional
+
+# Fitted against difflib's ratio on city and street name pairs with typos and suffixes
+UNIGRAM_WEIGHT = 0.6
+
+class LocationProfile:
+    """Character and trigram counts of one normalized location"""
+
+    __slots__ = ("text", "chars", "trigrams", "n_chars", "n_trigrams")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.chars = Counter(text)
+        padded = f"  {text} "
+        self.trigrams = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+        self.n_chars = len(text)
+        self.n_trigrams = len(padded) - 2
+
+def normalize_location(text: str) -> str:
+    return " ".join(text.lower().split())
+
+@lru_cache(maxsize=4096)
+def location_profile(text: str) -> LocationProfile:
+    return LocationProfile(normalize_location(text))
+
+def _dice(common: int, size1: int, size2: int) -> float:
+    return 2 * common / (size1 + size2) if size1 + size2 else 1.0
+
+def profile_similarity(profile1: LocationProfile, profile2: LocationProfile, trigram_overlap: Optional[int] = None) -> float:
+    if profile1.text == profile2.text:
+        return 1.0
+    if trigram_overlap is None:
+        trigram_overlap = sum((profile1.trigrams & profile2.trigrams).values())
+    chars = _dice(sum((profile1.chars & profile2.chars).values()), profile1.n_chars, profile2.n_chars)
+    trigrams = _dice(trigram_overlap, profile1.n_trigrams, profile2.n_trigrams)
+    return UNIGRAM_WEIGHT * chars + (1 - UNIGRAM_WEIGHT) * trigrams
+
+def location_similarity(location1: str, location2: str) -> float:
+    """Similarity in [0, 1] of two free-text locations, case and whitespace insensitive"""
+    return profile_similarity(location_profile(location1), location_profile(location2))
@@ -0,0 +1,165 @@
+"""
+Rule-based MatchRequest extraction for chat input that is already structured.
+
+Much chat input looks like
+
+    Alice Smith, 28, female, in Brooklyn, New York, likes hiking, chess and jazz
+    vs Bob, born 1994-03-02, male, Austin, within 30 km, prefers dogs
+
+Two people are split on " vs ", " versus ", "|", ";" or a line break. Each
+person is a comma-separated list of fields, recognized in any order after
+the name:
+
+- age: "28", "28 years old", "age 28", "28yo"; birthday: "born 1994-03-02"
+- gender: female/woman/f, male/man/m, non-binary/nb
+- interests: "likes ...", "into ...", "enjoys ...", "interests: ...";
+  the fields after it stay interests until another field type appears
+  (or one that reads like a statement or has digits)
+- search radius: "within 30 km", "25 miles"
+- partner preference: "prefers ..." / "wants ..."
+- location: "in ...", "from ...", "lives in ...", or the first field that
+  is nothing else; the field right after it continues it ("Austin, Texas")
+
+A name may be introduced ("I am Alice", "my name is Bob"); the introduction
+is dropped.
+
+`extract_match_request` returns the request as the dict the LLM would have
+produced, together with a confidence in [0, 1]. Confidence is the weighted
+share of the fields found for each person (name, age, location, interests),
+scaled down by the share of fields that matched no rule. The agent
+only forwards a prompt to the LLM when confidence is below its threshold.
+"""
+
+import re
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Weight of each field in a person's confidence (an age also sets the birthday); missing
+# any of them drops the request below 0.95. Gender is read when given but does not
+# affect the score, so it does not count.
+FIELD_WEIGHTS = {'name': 0.3, 'birthday': 0.3, 'location': 0.2, 'interests': 0.2}
+DEFAULT_SEARCH_RADIUS = 10
+KM_PER_MILE = 1.609344
+
+GENDERS = {
+    'female': 'female', 'woman': 'female', 'f': 'female',
+    'male': 'male', 'man': 'male', 'm': 'male',
+    'non-binary': 'non-binary', 'nonbinary': 'non-binary', 'nb': 'non-binary', 'enby': 'non-binary',
+}
+
+_PEOPLE_SEPARATOR = re.compile(r"\s+(?:vs\.?|versus)\s+|\s*[|;\n]\s*", re.IGNORECASE)
+_AGE = re.compile(r"^(?:age[d]?\s*:?\s*)?(\d{1,3})\s*(?:yo|y/o|years?(?:\s+old)?|yrs?(?:\s+old)?)?$", re.IGNORECASE)
+_BIRTHDAY = re.compile(r"^(?:born\s+(?:on\s+)?|birthday\s*:?\s*|b\.\s*)?(\d{4}-\d{2}-\d{2})$", re.IGNORECASE)
+_INTERESTS = re.compile(r"^(?:likes|loves|enjoys|into|interests?\s*:?|hobbies\s*:?)\s+(.+)$", re.IGNORECASE)
+_RADIUS = re.compile(r"^(?:within\s+|radius\s*:?\s*)?(\d+(?:\.\d+)?)\s*(km|kms|kilometers?|kilometres?|mi|miles?)(?:\s+radius)?$", re.IGNORECASE)
+_PREFERENCE = re.compile(r"^(?:prefers|wants|looking for)\s+(.+)$", re.IGNORECASE)
+_LOCATION = re.compile(r"^(?:lives\s+in|living\s+in|based\s+in|in|from|at)\s+(.+)$", re.IGNORECASE)
+_NAME_INTRO = re.compile(r"^(?:i\s+am|i'm|im|my\s+name\s+is|this\s+is|meet|(?:he|she)\s+is|he's|she's)\s+", re.IGNORECASE)
+_NAME = re.compile(r"^[^\W\d_][\w'.-]*(?:\s+[^\W\d_][\w'.-]*){0,2}$")
+# A field continuing an interest list; statements ("has two kids") and measurements ("5'6") are not interests
+_INTEREST_ITEM = re.compile(r"^(?!(?:has|have|had|is|was|works|worked|does|can|will)\b)[^\d]+$", re.IGNORECASE)
+_AND = re.compile(r"\s+(?:and|&)\s+|\s*&\s*", re.IGNORECASE)
+
+class Extraction(NamedTuple):
+    request: Optional[Dict[str, Any]]
+    confidence: float
+    missing: List[str]
+
+def birthday_for_age(age: int, today: Optional[date] = None) -> str:
+    """A birthday that makes someone exactly `age` today (Feb 29 becomes Feb 28)"""
+    today = today or date.today()
+    try:
+        return today.replace(year=today.year - age).isoformat()
+    except ValueError:
+        return today.replace(year=today.year - age, day=28).isoformat()
+
+def _split_items(text: str) -> List[str]:
+    return [item.strip() for item in _AND.split(text) if item.strip()]
+
+def _is_other_field(field: str) -> bool:
+    return field.lower() in GENDERS or any(
+        pattern.match(field) for pattern in (_LOCATION, _INTERESTS, _PREFERENCE, _RADIUS, _BIRTHDAY)
+    )
+
+def extract_person(text: str) -> Dict[str, Any]:
+    """Fields of one person, plus 'recognized' and 'unrecognized' field counts"""
+    fields = [field.strip() for field in text.split(",")]
+    fields = [field for field in fields if field]
+    person: Dict[str, Any] = {'interests': [], 'preferences': [], 'recognized': 0, 'unrecognized': 0}
+    name = _NAME_INTRO.sub("", fields[0]) if fields else ""
+    if name and _NAME.match(name) and not _is_other_field(name):
+        fields.pop(0)
+        person['name'] = name
+        person['recognized'] += 1
+    # What an unrecognized field continues: the interest list or the location
+    continuing = None
+    for field in fields:
+        match = _AGE.match(field)
+        if match and 'birthday' not in person and 14 <= int(match.group(1)) <= 120:
+            person['birthday'] = birthday_for_age(int(match.group(1)))
+            continuing = None
+        elif (match := _BIRTHDAY.match(field)) and 'birthday' not in person:
+            person['birthday'] = match.group(1)
+            continuing = None
+        elif field.lower() in GENDERS and 'gender' not in person:
+            person['gender'] = GENDERS[field.lower()]
+            continuing = None
+        elif match := _RADIUS.match(field):
+            radius = float(match.group(1))
+            person['search_radius'] = round(radius * KM_PER_MILE if match.group(2).lower().startswith('mi') else radius)
+            continuing = None
+        elif match := _PREFERENCE.match(field):
+            person['preferences'].append(match.group(1).strip())
+            continuing = None
+        elif match := _INTERESTS.match(field):
+            person['interests'].extend(_split_items(match.group(1)))
+            continuing = 'interests'
+        elif (match := _LOCATION.match(field)) and 'location' not in person:
+            person['location'] = match.group(1).strip()
+            continuing = 'location'
+        elif continuing == 'interests' and _INTEREST_ITEM.match(field):
+            person['interests'].extend(_split_items(field))
+        elif continuing == 'location' and not any(c.isdigit() for c in field):
+            person['location'] += f", {field}"
+            continuing = None
+        elif 'location' not in person and not any(c.isdigit() for c in field):
+            person['location'] = field
+            continuing = 'location'
+        else:
+            person['unrecognized'] += 1
+            continue
+        person['recognized'] += 1
+    return person
+
+def _person_confidence(person: Dict[str, Any]) -> float:
+    return sum(weight for field, weight in FIELD_WEIGHTS.items() if person.get(field))
+
+def _request_side(person: Dict[str, Any], suffix: str) -> Dict[str, Any]:
+    first_name, _, last_name = person.get('name', '').partition(' ')
+    return {
+        f'personal_info{suffix}': {'first_name': first_name, 'last_name': last_name, 'birthday': person.get('birthday', '')},
+        f'gender{suffix}': person.get('gender', ''),
+        f'location{suffix}': {
+            'address': person.get('location', ''),
+            'search_radius': person.get('search_radius', DEFAULT_SEARCH_RADIUS),
+        },
+        f'personal_interests{suffix}': person['interests'],
+        f'partner_preferences{suffix}': [
+            {'category': 'Preference', 'question': 'What are you looking for?', 'options': [preference],
+             'selected_index': 0, 'selected_option': preference}
+            for preference in person['preferences']
+        ],
+    }
+
+def extract_match_request(text: str) -> Extraction:
+    """The MatchRequest fields found in `text` and how confident the extraction is"""
+    people = [part for part in _PEOPLE_SEPARATOR.split(text.strip()) if part.strip()]
+    if len(people) != 2:
+        return Extraction(None, 0.0, ['two people'])
+    persons = [extract_person(part) for part in people]
+    missing = [f"{field}{i}" for i, person in enumerate(persons, 1) for field in FIELD_WEIGHTS if not person.get(field)]
+    recognized = sum(person['recognized'] for person in persons)
+    unrecognized = sum(person['unrecognized'] for person in persons)
+    confidence = sum(map(_person_confidence, persons)) / 2 * recognized / max(recognized + unrecognized, 1)
+    request = {**_request_side(persons[0], '1'), **_request_side(persons[1], '2')}
+    return Extraction(request, round(confidence, 4), missing)
@@ -0,0 +1,181 @@
+"""
+Process-local stage timers and counters for the agents and the FastAPI app.
+
+Off unless LOVEFI_METRICS=1: `timed` then hands back a shared no-op context
+manager and `inc`/`observe` return after one flag check, so instrumented
+hot paths cost a global lookup. When on, stages are recorded as latency
+histograms and rendered in the Prometheus text format (`render`), or as a
+one-line `summary` for logs.
+
+    with timed("parse"):
+        request = MatchRequest.parse_obj(payload)
+    inc("lovefi_fallback_total", path="address_similarity")
+
+Components that already keep statistics (TTL caches, geocode cache) are
+exported through `add_collector` instead of counting twice.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+enabled = os.environ.get("LOVEFI_METRICS", "").lower() in ("1", "true", "yes", "on")
+
+# Upper bounds in seconds: factor scoring sits in the microseconds, LLM round trips in seconds
+STAGE_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_METRIC = "lovefi_stage_seconds"
+
+# (metric name, labels, value) samples; the name says whether it is a counter (_total) or a gauge
+Sample = Tuple[str, Dict[str, str], float]
+
+class StageStats:
+    """Latency histogram of one stage"""
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self, bucket_count: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (bucket_count + 1)
+
+class Metrics:
+    def __init__(self, buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.buckets = buckets
+        self.stages: Dict[str, StageStats] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[Sample]]] = {}
+        self._lock = Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(len(self.buckets))
+            stats.count += 1
+            stats.total += seconds
+            if seconds > stats.max:
+                stats.max = seconds
+            stats.buckets[bisect_left(self.buckets, seconds)] += 1
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_collector(self, name: str, collect: Callable[[], Iterable[Sample]]) -> None:
+        """Call `collect` for extra samples at every render; a collector added under the same name replaces it"""
+        self._collectors[name] = collect
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            samples = [(name, dict(labels), value) for (name, labels), value in self.counters.items()]
+        for collect in list(self._collectors.values()):
+            samples.extend(collect())
+        return samples
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            stages = [(stage, stats.count, stats.total, list(stats.buckets)) for stage, stats in sorted(self.stages.items())]
+        if stages:
+            lines += [f"# HELP {STAGE_METRIC} Time spent in each request stage", f"# TYPE {STAGE_METRIC} histogram"]
+            for stage, count, total, buckets in stages:
+                cumulative = 0
+                for bound, bucket in zip((*self.buckets, "+Inf"), buckets):
+                    cumulative += bucket
+                    le = bound if isinstance(bound, str) else f"{bound:g}"
+                    lines.append(f'{STAGE_METRIC}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{STAGE_METRIC}_sum{{stage="{stage}"}} {total!r}')
+                lines.append(f'{STAGE_METRIC}_count{{stage="{stage}"}} {count}')
+        by_name: Dict[str, List[Sample]] = {}
+        for sample in self.samples():
+            by_name.setdefault(sample[0], []).append(sample)
+        for name in sorted(by_name):
+            lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+            for _, labels, value in by_name[name]:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Stages by total time, then counters, on one line for the logs"""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1].total)
+            parts = [
+                f"{stage} n={stats.count} avg={stats.total / stats.count * 1000:.2f}ms max={stats.max * 1000:.2f}ms"
+                for stage, stats in stages
+            ]
+        parts += [f"{name}{_format_labels(labels)}={value:g}" for name, labels, value in self.samples()]
+        return "; ".join(parts) if parts else "no samples"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_TIMER = _NoTimer()
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+def set_enabled(value: bool) -> None:
+    global enabled
+    enabled = value
+
+def timed(stage: str):
+    """Context manager recording the time spent inside it under `stage`"""
+    return _Timer(stage) if enabled else _NO_TIMER
+
+def observe(stage: str, seconds: float) -> None:
+    if enabled:
+        _metrics.observe(stage, seconds)
+
+def inc(name: str, amount: float = 1, **labels: str) -> None:
+    if enabled:
+        _metrics.inc(name, amount, **labels)
+
+def stats_collector(metric: str, stats: Callable[[], Optional[Dict[str, int]]], **labels: str) -> Callable[[], List[Sample]]:
+    """Collector exporting a stats() dict: `*size` entries as `<metric>_<key>` gauges, the
+    rest as `<metric>_events_total{event=<key>}` counters"""
+    def collect() -> List[Sample]:
+        samples = []
+        for key, value in (stats() or {}).items():
+            if key.endswith("size"):
+                samples.append((f"{metric}_{key}", dict(labels), value))
+            else:
+                samples.append((f"{metric}_events_total", dict(labels, event=key), value))
+        return samples
+    return collect
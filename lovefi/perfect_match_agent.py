@@ -1,11 +1,17 @@
 from datetime import datetime
+from time import perf_counter
 from uuid import uuid4
 from typing import Any, List, Dict
 from uagents import Agent, Context, Model, Protocol
-import requests
-from math import radians, sin, cos, sqrt, asin
-import difflib
 import asyncio
+import os
+
+# Cached geocoding shared by both agents
+from geocoding import close_async_geocoder, get_async_geocoder, get_coordinates, get_geocode_cache
+import metrics
+from session_store import ACTIVE, EXPIRED, build_session_store
+from scoring_engine import QueryProfile, describe, get_plan
+from ttl_cache import TTLCache
 
 # Import the necessary components of the chat protocol
 from uagents_core.contrib.protocols.chat import (
@@ -37,27 +43,6 @@ def calculate_age(birthday_str: str) -> int | None:
     except:
         return None
 
-def get_coordinates(address: str) -> tuple[float, float]:
-    try:
-        url = f"https://nominatim.openstreetmap.org/search?q={requests.utils.quote(address)}&format=json&limit=1"
-        response = requests.get(url, headers={'User-Agent': 'DatingMatchAgent/1.0'})
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                return float(data[0]['lat']), float(data[0]['lon'])
-    except:
-        pass
-    return None, None
-
-def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * asin(sqrt(a))
-    km = 6371 * c
-    return km
-
 # Prompt template for generating the match profile
 PROFILE_PROMPT_TEMPLATE = """
 Based on this user description: "{description}"
@@ -142,78 +127,46 @@ def create_text_chat(text: str, end_session: bool = False) -> ChatMessage:
         content=content,
     )
 
-# Function to calculate match score
+# Function to calculate match score: the scoring engine's "match" plan (40/20/20/20)
 def calculate_match_score(
+    personal_info1: PersonalInfo, gender1: str, location1: Location, personal_interests1: List[str], partner_preferences1: List[Preference],
+    personal_info2: PersonalInfo, gender2: str, location2: Location, personal_interests2: List[str], partner_preferences2: List[Preference],
+    coordinates: tuple = None
+) -> tuple[float, str]:
+    if coordinates is None:
+        try:
+            coordinates = (get_coordinates(location1.address), get_coordinates(location2.address))
+        except Exception:
+            # Scored on address similarity instead
+            coordinates = (None, None)
+    score, results = get_plan("match").score(
+        QueryProfile(calculate_age(personal_info1.birthday), coordinates[0], location1.search_radius,
+                     location1.address, personal_interests1, [p.selected_option for p in partner_preferences1]),
+        QueryProfile(calculate_age(personal_info2.birthday), coordinates[1], location2.search_radius,
+                     location2.address, personal_interests2, [p.selected_option for p in partner_preferences2])
+    )
+    return score, describe(results)
+
+# Non-blocking variant for the agent handlers: both addresses are geocoded concurrently
+async def calculate_match_score_async(
     personal_info1: PersonalInfo, gender1: str, location1: Location, personal_interests1: List[str], partner_preferences1: List[Preference],
     personal_info2: PersonalInfo, gender2: str, location2: Location, personal_interests2: List[str], partner_preferences2: List[Preference]
 ) -> tuple[float, str]:
-    score = 0.0
-    details = []
-
-    # Calculate ages
-    age1 = calculate_age(personal_info1.birthday)
-    age2 = calculate_age(personal_info2.birthday)
-
-    # Interest compatibility (40%)
-    common_interests = set(personal_interests1).intersection(set(personal_interests2))
-    max_interests = max(len(personal_interests1), len(personal_interests2), 1)
-    interest_score = (len(common_interests) / max_interests) * 40
-    score += interest_score
-    details.append(f"Interest compatibility: {interest_score:.1f}/40 (Common interests: {', '.join(common_interests) or 'None'})")
-
-    # Age compatibility (20%)
-    if age1 is not None and age2 is not None:
-        age_diff = abs(age1 - age2)
-        max_age_diff = 10  # Default, can be extended if added to preferences
-        age_score = max(0, (1 - age_diff / max_age_diff)) * 20 if max_age_diff > 0 else 20
-        age_detail = f"{age_diff} years"
-    else:
-        age_score = 10  # Neutral if unknown
-        age_detail = "Unknown"
-    score += age_score
-    details.append(f"Age compatibility: {age_score:.1f}/20 (Age difference: {age_detail})")
-
-    # Location compatibility (20%)
-    loc_score = 0.0
-    dist = None
-    try:
-        lat1, lon1 = get_coordinates(location1.address)
-        lat2, lon2 = get_coordinates(location2.address)
-        if lat1 is not None and lon1 is not None and lat2 is not None and lon2 is not None:
-            dist = haversine(lon1, lat1, lon2, lat2)
-            max_radius = max(location1.search_radius, location2.search_radius)
-            if dist <= max_radius:
-                loc_score = 20 * (1 - dist / max_radius)
-            else:
-                loc_score = 0
-        else:
-            # Fallback to string similarity
-            similarity = difflib.SequenceMatcher(None, location1.address.lower(), location2.address.lower()).ratio()
-            loc_score = similarity * 20
-    except Exception:
-        # Fallback
-        similarity = difflib.SequenceMatcher(None, location1.address.lower(), location2.address.lower()).ratio()
-        loc_score = similarity * 20
-    score += loc_score
-    dist_str = f"{dist:.1f} km" if dist is not None else "Unknown"
-    details.append(f"Location compatibility: {loc_score:.1f}/20 (Distance: {dist_str})")
-
-    # Preference compatibility (20%)
-    num_matching = 0
-    total = min(len(partner_preferences1), len(partner_preferences2))
-    if total > 0:
-        for p1, p2 in zip(partner_preferences1, partner_preferences2):
-            if p1.selected_option == p2.selected_option:
-                num_matching += 1
-        pref_score = (num_matching / total) * 20
-    else:
-        pref_score = 0
-    score += pref_score
-    details.append(f"Preference compatibility: {pref_score:.1f}/20 (Matching preferences: {num_matching}/{total})")
-
-    # Ensure score is between 0 and 100
-    score = min(max(score, 0), 100)
-    return score, "; ".join(details)
+    coordinates = await get_async_geocoder().geocode_many(location1.address, location2.address)
+    return calculate_match_score(
+        personal_info1, gender1, location1, personal_interests1, partner_preferences1,
+        personal_info2, gender2, location2, personal_interests2, partner_preferences2,
+        coordinates=coordinates
+    )
+
+# Stage timings (LOVEFI_METRICS=1), logged every LOVEFI_METRICS_LOG_PERIOD seconds
+METRICS_LOG_PERIOD = float(os.environ.get("LOVEFI_METRICS_LOG_PERIOD", "60"))
+metrics.get_metrics().add_collector("geocode_cache", metrics.stats_collector("lovefi_geocode_cache", lambda: get_geocode_cache().stats()))
+# When each session's prompt went to the LLM agent, for the "llm" round-trip stage
+llm_requests_started = TTLCache(maxsize=1024, ttl=600)
+# Chat session -> sender, so LLM answers reach the chat that asked
+chat_sessions = build_session_store()
+metrics.get_metrics().add_collector("sessions", metrics.stats_collector("lovefi_sessions", chat_sessions.stats))
 
 class StructuredOutputPrompt(Model):
     prompt: str
@@ -225,7 +178,7 @@ class StructuredOutputResponse(Model):
 @chat_proto.on_message(ChatMessage)
 async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
     ctx.logger.info(f"Got a message from {sender}: {msg.content}")
-    ctx.storage.set(str(ctx.session), sender)
+    chat_sessions.open(str(ctx.session), sender)
     await ctx.send(
         sender,
         ChatAcknowledgement(timestamp=datetime.utcnow(), acknowledged_msg_id=msg.msg_id),
@@ -235,9 +188,11 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
         if isinstance(item, StartSessionContent):
             ctx.logger.info(f"Got a start session message from {sender}")
             continue
+        elif isinstance(item, EndSessionContent):
+            # Prompts sent earlier in this message still get their answers
+            chat_sessions.end(str(ctx.session))
         elif isinstance(item, TextContent):
             ctx.logger.info(f"Got a text message from {sender}: {item.text}")
-            ctx.storage.set(str(ctx.session), sender)
             # Create a simplified schema without FieldInfo objects
             simplified_schema = {
                 "type": "object",
@@ -254,6 +209,9 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
                     "partner_preferences2": {"type": "array"}
                 }
             }
+            if metrics.enabled:
+                llm_requests_started.set(str(ctx.session), perf_counter())
+            chat_sessions.expect(str(ctx.session))
             await ctx.send(
                 AI_AGENT_ADDRESS,
                 StructuredOutputPrompt(
@@ -274,12 +232,30 @@ async def handle_ack(ctx: Context, sender: str, msg: ChatAcknowledgement):
 async def handle_structured_output_response(
     ctx: Context, sender: str, msg: StructuredOutputResponse
 ):
-    session_sender = ctx.storage.get(str(ctx.session))
-    if session_sender is None:
-        ctx.logger.error(
-            "Discarding message because no session sender found in storage"
+    try:
+        await reply_to_structured_output(ctx, msg)
+    finally:
+        chat_sessions.answered(str(ctx.session))
+
+async def reply_to_structured_output(ctx: Context, msg: StructuredOutputResponse):
+    started = llm_requests_started.get(str(ctx.session), None)
+    if started is not None:
+        llm_requests_started.pop(str(ctx.session))
+        metrics.observe("llm", perf_counter() - started)
+    state, session_sender = chat_sessions.lookup(str(ctx.session))
+    if state == EXPIRED:
+        ctx.logger.warning(f"Structured output arrived after chat session {ctx.session} expired")
+        chat_sessions.close(str(ctx.session))
+        await ctx.send(
+            session_sender,
+            create_text_chat(
+                "Sorry, your chat session expired before your match request was processed. Please send it again."
+            ),
         )
         return
+    if state != ACTIVE:
+        ctx.logger.error(f"Discarding structured output for unknown chat session {ctx.session}")
+        return
 
     if "<UNKNOWN>" in str(msg.output):
         await ctx.send(
@@ -291,7 +267,8 @@ async def handle_structured_output_response(
         return
 
     try:
-        prompt = MatchRequest.parse_obj(msg.output)
+        with metrics.timed("parse"):
+            prompt = MatchRequest.parse_obj(msg.output)
     except Exception as err:
         ctx.logger.error(f"Error parsing structured output: {err}")
         await ctx.send(
@@ -303,7 +280,7 @@ async def handle_structured_output_response(
         return
 
     try:
-        score, details = calculate_match_score(
+        score, details = await calculate_match_score_async(
             prompt.personal_info1, prompt.gender1, prompt.location1, prompt.personal_interests1, prompt.partner_preferences1,
             prompt.personal_info2, prompt.gender2, prompt.location2, prompt.personal_interests2, prompt.partner_preferences2
         )
@@ -328,7 +305,7 @@ async def handle_structured_output_response(
 async def handle_match_calculation(ctx: Context, sender: str, msg: MatchRequest):
     ctx.logger.info(f"Received match calculation request from {sender}")
     try:
-        score, details = calculate_match_score(
+        score, details = await calculate_match_score_async(
             msg.personal_info1, msg.gender1, msg.location1, msg.personal_interests1, msg.partner_preferences1,
             msg.personal_info2, msg.gender2, msg.location2, msg.personal_interests2, msg.partner_preferences2
         )
@@ -364,10 +341,25 @@ async def handle_match_generation(ctx: Context, sender: str, msg: SingleMatchReq
         )
         await ctx.send(sender, error_response)
 
+@agent.on_interval(period=METRICS_LOG_PERIOD)
+async def log_metrics(ctx: Context):
+    if metrics.enabled:
+        ctx.logger.info(f"Metrics: {metrics.get_metrics().summary()}")
+
 # Include protocols in the agent
 agent.include(chat_proto)
 agent.include(struct_output_client_proto)
 
+@agent.on_interval(period=60.0)
+async def flush_chat_sessions(ctx: Context):
+    chat_sessions.purge()
+    chat_sessions.save()
+
+@agent.on_event("shutdown")
+async def shutdown(ctx: Context):
+    chat_sessions.save()
+    await close_async_geocoder()
+
 @agent.on_event("startup")
 async def startup(ctx: Context):
     ctx.logger.info(f"DatingMatchAgent started. Address: {ctx.agent.address}")
@@ -0,0 +1,184 @@
+import json
+import os
+import sys
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from scoring_engine import QueryProfile
+
+def parse_birth_date(birthday: str) -> Optional[date]:
+    """The date part of an ISO birthday, or None if it is missing or malformed"""
+    try:
+        return datetime.fromisoformat(birthday).date()
+    except (TypeError, ValueError):
+        return None
+
+def age_on(birth_date: Optional[date], today: date) -> Optional[int]:
+    if birth_date is None:
+        return None
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+def _interned(values: Iterable[str]) -> tuple:
+    # Interests, options and cities repeat across profiles, so records share one copy of each string
+    return tuple(sys.intern(value) for value in values)
+
+class ProfileRecord:
+    """Scoring features of one registered profile, derived once and then read-only.
+
+    The birthday is parsed once; the age is computed from it whenever it is
+    read, so it never goes stale past a birthday. Strings are interned, and
+    the QueryProfile the scoring engine takes is built per call rather than
+    kept, so a large registry holds little beyond one tuple per field.
+    Coordinates are (None, None) while the address is unresolved; the agent
+    geocodes such records again and replaces them with `with_coordinates`.
+    """
+
+    __slots__ = (
+        "profile_id", "first_name", "last_name", "gender", "birthday", "birth_date",
+        "lat", "lon", "address", "search_radius", "interests", "selected_options",
+    )
+
+    def __init__(self, profile_id: str, first_name: str, last_name: str, gender: str, birthday: str,
+                 coordinates: tuple, address: str, search_radius: float, interests: List[str], selected_options: List[str]):
+        values = {
+            "profile_id": profile_id,
+            "first_name": first_name,
+            "last_name": last_name,
+            "gender": sys.intern(gender),
+            "birthday": birthday,
+            "birth_date": parse_birth_date(birthday),
+            "lat": coordinates[0],
+            "lon": coordinates[1],
+            "address": sys.intern(address),
+            "search_radius": search_radius,
+            "interests": _interned(interests),
+            "selected_options": _interned(selected_options),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self) -> str:
+        return f"ProfileRecord({self.profile_id!r}, age={self.age}, address={self.address!r})"
+
+    @property
+    def age(self) -> Optional[int]:
+        """Age today (UTC), like the agent's calculate_age"""
+        return age_on(self.birth_date, datetime.utcnow().date())
+
+    @property
+    def coordinates(self) -> tuple:
+        return self.lat, self.lon
+
+    @property
+    def resolved(self) -> bool:
+        """Whether the address was geocoded; unresolved records are retried later"""
+        return self.lat is not None
+
+    @property
+    def name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+    def query_profile(self) -> QueryProfile:
+        """Features in the form the scoring engine and candidate pool take, with the current age"""
+        return QueryProfile(self.age, (self.lat, self.lon), self.search_radius, self.address,
+                            self.interests, self.selected_options)
+
+    def with_coordinates(self, coordinates: tuple) -> "ProfileRecord":
+        return ProfileRecord.from_dict(dict(self.to_dict(), coordinates=list(coordinates)))
+
+    def to_dict(self) -> Dict:
+        return {
+            "profile_id": self.profile_id,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "gender": self.gender,
+            "birthday": self.birthday,
+            "coordinates": [self.lat, self.lon],
+            "address": self.address,
+            "search_radius": self.search_radius,
+            "interests": list(self.interests),
+            "selected_options": list(self.selected_options),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ProfileRecord":
+        # Files written before ages were computed on read also hold an "age"; it is ignored
+        return cls(
+            profile_id=data["profile_id"],
+            first_name=data["first_name"],
+            last_name=data["last_name"],
+            gender=data["gender"],
+            birthday=data["birthday"],
+            coordinates=tuple(data["coordinates"]),
+            address=data["address"],
+            search_radius=data["search_radius"],
+            interests=data["interests"],
+            selected_options=data["selected_options"],
+        )
+
+class ProfileRegistry:
+    """In-memory profile store with optional JSON persistence.
+
+    Changes are only written by `save()`, so callers can batch them (the
+    agent flushes on an interval and at shutdown). Geocoded coordinates are
+    persisted; ages are not, since records compute them from the birthday.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._records: Dict[str, ProfileRecord] = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, profile_id: str) -> bool:
+        return profile_id in self._records
+
+    def __iter__(self) -> Iterator[ProfileRecord]:
+        return iter(list(self._records.values()))
+
+    def get(self, profile_id: str) -> Optional[ProfileRecord]:
+        return self._records.get(profile_id)
+
+    def register(self, record: ProfileRecord) -> None:
+        with self._lock:
+            self._records[record.profile_id] = record
+            self.dirty = True
+
+    def remove(self, profile_id: str) -> Optional[ProfileRecord]:
+        with self._lock:
+            record = self._records.pop(profile_id, None)
+            self.dirty = self.dirty or record is not None
+            return record
+
+    def load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        records = {}
+        for item in data.get("profiles", []):
+            records[item["profile_id"]] = ProfileRecord.from_dict(item)
+        with self._lock:
+            self._records = records
+            self.dirty = False
+
+    def save(self) -> bool:
+        """Write the registry if it changed since the last save; returns whether it wrote"""
+        if not self.path or not self.dirty:
+            return False
+        with self._lock:
+            payload = {"profiles": [record.to_dict() for record in self._records.values()]}
+            self.dirty = False
+        # Write to a temporary file first so a crash never leaves a truncated registry
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+        return True
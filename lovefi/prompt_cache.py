@@ -0,0 +1,32 @@
+"""
+Parsed match requests keyed by normalized chat prompt text.
+
+Users resend the same request, retry after an error, or change only case or
+spacing. A cache hit skips the LLM round trip entirely. Only requests that
+parsed successfully are stored, so a prompt the LLM could not handle is
+sent to it again next time.
+"""
+
+import os
+import re
+import unicodedata
+from typing import Optional
+
+from ttl_cache import TTLCache
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_TRAILING_PUNCTUATION = frozenset(".!?")
+
+def normalize_prompt(text: str) -> str:
+    """Case-folded words and punctuation marks separated by single spaces, without closing punctuation"""
+    tokens = _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+    while tokens and tokens[-1] in _TRAILING_PUNCTUATION:
+        tokens.pop()
+    return " ".join(tokens)
+
+def build_prompt_cache() -> Optional[TTLCache]:
+    """Cache configured by LOVEFI_PROMPT_CACHE_SIZE (0 disables it) and LOVEFI_PROMPT_CACHE_TTL in seconds"""
+    maxsize = int(os.environ.get("LOVEFI_PROMPT_CACHE_SIZE", "1000"))
+    if maxsize <= 0:
+        return None
+    return TTLCache(maxsize=maxsize, ttl=float(os.environ.get("LOVEFI_PROMPT_CACHE_TTL", "3600")))
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+from ttl_cache import MISSING, TTLCache
+
+def profile_fingerprint(fields: Any) -> str:
+    """Content hash of a profile's scoring-relevant fields.
+
+    Callers pass only what their scorer reads, normalized the way the scorer
+    treats it (e.g. interests sorted when only their set matters), so
+    irrelevant edits and cosmetic differences keep the same fingerprint.
+    """
+    data = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+class PairScoreCache:
+    """Memoized pair scores keyed by the unordered pair of profile fingerprints.
+
+    (A, B) and (B, A) share an entry, so it is only for symmetric scorers.
+    Size is bounded by LRU eviction, with an optional TTL. A profile whose
+    content changes gets a new fingerprint; `invalidate` additionally drops
+    every pair involving a fingerprint (for when derived data such as
+    coordinates changed underneath it). An index from fingerprint to its
+    cached pairs makes that proportional to the profile's pairs, and shrinks
+    as the cache evicts.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, clock=clock, on_evict=self._forget)
+        # fingerprint -> keys of the cached pairs it is part of
+        self._pairs: Dict[str, Set[tuple]] = {}
+
+    @staticmethod
+    def _key(fingerprint1: str, fingerprint2: str) -> tuple:
+        return (fingerprint1, fingerprint2) if fingerprint1 <= fingerprint2 else (fingerprint2, fingerprint1)
+
+    def _forget(self, key: tuple) -> None:
+        for fingerprint in key:
+            keys = self._pairs.get(fingerprint)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._pairs[fingerprint]
+
+    def get(self, fingerprint1: str, fingerprint2: str, default: Any = MISSING) -> Any:
+        return self._cache.get(self._key(fingerprint1, fingerprint2), default)
+
+    def set(self, fingerprint1: str, fingerprint2: str, value: Any) -> None:
+        key = self._key(fingerprint1, fingerprint2)
+        self._cache.set(key, value)
+        for fingerprint in key:
+            self._pairs.setdefault(fingerprint, set()).add(key)
+
+    def get_or_compute(self, fingerprint1: str, fingerprint2: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(fingerprint1, fingerprint2)
+        if value is MISSING:
+            value = compute()
+            self.set(fingerprint1, fingerprint2, value)
+        return value
+
+    def invalidate(self, fingerprint: str) -> None:
+        for key in self._pairs.pop(fingerprint, ()):
+            self._cache.pop(key)
+            self._forget(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._pairs.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+def cached_score(cache: Optional[PairScoreCache], fields1: Any, fields2: Any, compute: Callable[[], Any]) -> Any:
+    """compute() for a profile pair given their scoring fields, through `cache` unless it is None"""
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(profile_fingerprint(fields1), profile_fingerprint(fields2), compute)
+
+def build_score_cache() -> Optional[PairScoreCache]:
+    """Cache configured by LOVEFI_SCORE_CACHE_SIZE (0 disables it) and LOVEFI_SCORE_CACHE_TTL in seconds"""
+    maxsize = int(os.environ.get("LOVEFI_SCORE_CACHE_SIZE", "10000"))
+    if maxsize <= 0:
+        return None
+    ttl = os.environ.get("LOVEFI_SCORE_CACHE_TTL")
+    return PairScoreCache(maxsize=maxsize, ttl=float(ttl) if ttl else None)
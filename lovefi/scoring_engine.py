@@ -0,0 +1,335 @@
+"""
+One scoring engine behind every matcher.
+
+A weight profile lists the factors to evaluate and the weight of each. It is
+compiled once into a ScoringPlan, which scores a pair (or, when every factor
+has a vectorized form, one profile against a whole CandidateTable) as the sum
+of each factor's 0-1 fraction times its weight and the profile's scale,
+clamped to the profile's range.
+
+Factors register by name with `register_factor`. The 40/20/20/20 match
+factors are defined here, the 50/25/25 compatibility factors in
+lovefi-agents/compatibility.py. Profiles are DEFAULT_WEIGHT_PROFILES plus any
+from the JSON file named by LOVEFI_WEIGHT_PROFILES, e.g.
+
+    {"match": {"factors": {"interest_overlap": 50, "age_gap": {"weight": 20, "max_age_diff": 8},
+                           "distance": 30}}}
+"""
+
+import json
+import os
+from math import asin, cos, radians, sin, sqrt
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import metrics
+
+EARTH_RADIUS_KM = 6371
+DEFAULT_MAX_AGE_DIFF = 10
+# Share of the age weight given when either age is unknown
+UNKNOWN_AGE_FRACTION = 0.5
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
+    c = 2 * asin(sqrt(a))
+    return EARTH_RADIUS_KM * c
+
+def address_similarity(address1: str, address2: str) -> float:
+    # Only needed when an address could not be geocoded, so it is imported here
+    from location_similarity import location_similarity
+    return location_similarity(address1, address2)
+
+class QueryProfile:
+    """One side of a match, reduced to the features the match factors need"""
+
+    __slots__ = ("age", "lat", "lon", "search_radius", "address", "interests", "interest_set", "preferences")
+
+    def __init__(self, age: Optional[int], coordinates: Optional[tuple], search_radius: float, address: str,
+                 interests: Sequence[str], preferences: Sequence[str]):
+        self.age = age
+        self.lat, self.lon = coordinates if coordinates is not None else (None, None)
+        self.search_radius = search_radius
+        self.address = address
+        self.interests = list(interests)
+        self.interest_set = frozenset(self.interests)
+        # Selected option of each partner preference, in question order
+        self.preferences = list(preferences)
+
+class Factor:
+    """One scoring component.
+
+    `score` returns a 0-1 fraction for a pair of sides and any info worth
+    reporting; `describe` renders the weighted points and info as one line of
+    the match details. Factors that can score a query against every row of a
+    CandidateTable at once also implement `score_table`, returning an array
+    of fractions and per-row info. Parameters come from the weight profile
+    and are fixed when the plan is compiled; `weight` and `max_points` (the
+    points for a fraction of 1, preformatted as `max_label`) are set then too,
+    with the metrics stage names it is timed under.
+    """
+
+    name = ""
+    weight = 0.0
+    max_points = 0.0
+    max_label = "0"
+    stage = table_stage = "factor"
+
+    def score(self, side1: Any, side2: Any) -> Tuple[float, Any]:
+        raise NotImplementedError
+
+    def score_table(self, query: QueryProfile, table: Any, **options) -> Tuple[Any, Any]:
+        raise NotImplementedError(f"factor {self.name!r} has no vectorized form")
+
+    def describe(self, points: float, info: Any) -> str:
+        return f"{self.name}: {points:.1f}/{self.max_label}"
+
+FACTORS: Dict[str, type] = {}
+
+def register_factor(cls: type) -> type:
+    FACTORS[cls.name] = cls
+    return cls
+
+@register_factor
+class InterestOverlap(Factor):
+    """Shared interests over the longer interest list"""
+
+    name = "interest_overlap"
+
+    def score(self, side1: QueryProfile, side2: QueryProfile) -> Tuple[float, set]:
+        common_interests = set(side1.interest_set.intersection(side2.interest_set))
+        return len(common_interests) / max(len(side1.interests), len(side2.interests), 1), common_interests
+
+    def score_table(self, query, table, **options):
+        from batch_scoring import interest_fractions
+        return interest_fractions(query, table), None
+
+    def describe(self, points, info):
+        return f"Interest compatibility: {points:.1f}/{self.max_label} (Common interests: {', '.join(info) or 'None'})"
+
+@register_factor
+class AgeGap(Factor):
+    """Linear falloff to zero at max_age_diff years apart"""
+
+    name = "age_gap"
+
+    def __init__(self, max_age_diff: float = DEFAULT_MAX_AGE_DIFF):
+        self.max_age_diff = max_age_diff
+
+    def score(self, side1: QueryProfile, side2: QueryProfile) -> Tuple[float, Optional[int]]:
+        if side1.age is None or side2.age is None:
+            return UNKNOWN_AGE_FRACTION, None
+        age_diff = abs(side1.age - side2.age)
+        return (max(0, (1 - age_diff / self.max_age_diff)) if self.max_age_diff > 0 else 1), age_diff
+
+    def score_table(self, query, table, max_age_diff=None, **options):
+        from batch_scoring import age_fractions
+        return age_fractions(query, table, self.max_age_diff if max_age_diff is None else max_age_diff), None
+
+    def describe(self, points, info):
+        age_detail = f"{info} years" if info is not None else "Unknown"
+        return f"Age compatibility: {points:.1f}/{self.max_label} (Age difference: {age_detail})"
+
+@register_factor
+class Distance(Factor):
+    """Linear falloff inside the larger search radius; address similarity when either side is not geocoded"""
+
+    name = "distance"
+
+    def score(self, side1: QueryProfile, side2: QueryProfile) -> Tuple[float, Optional[float]]:
+        dist = None
+        try:
+            if side1.lat is not None and side1.lon is not None and side2.lat is not None and side2.lon is not None:
+                dist = haversine(side1.lon, side1.lat, side2.lon, side2.lat)
+                max_radius = max(side1.search_radius, side2.search_radius)
+                fraction = (1 - dist / max_radius) if dist <= max_radius else 0
+            else:
+                metrics.inc("lovefi_fallback_total", path="address_similarity")
+                fraction = address_similarity(side1.address, side2.address)
+        except Exception:
+            # e.g. both radii zero at the same point
+            metrics.inc("lovefi_fallback_total", path="address_similarity")
+            fraction = address_similarity(side1.address, side2.address)
+        return fraction, dist
+
+    def score_table(self, query, table, **options):
+        from batch_scoring import location_fractions
+        return location_fractions(query, table)
+
+    def describe(self, points, info):
+        dist_str = f"{info:.1f} km" if info is not None else "Unknown"
+        return f"Location compatibility: {points:.1f}/{self.max_label} (Distance: {dist_str})"
+
+@register_factor
+class PreferenceAgreement(Factor):
+    """Positional matches of selected options over the shorter preference list"""
+
+    name = "preference_agreement"
+
+    def score(self, side1: QueryProfile, side2: QueryProfile) -> Tuple[float, tuple]:
+        total = min(len(side1.preferences), len(side2.preferences))
+        if total == 0:
+            return 0, (0, 0)
+        num_matching = sum(option1 == option2 for option1, option2 in zip(side1.preferences, side2.preferences))
+        return num_matching / total, (num_matching, total)
+
+    def score_table(self, query, table, **options):
+        from batch_scoring import preference_fractions
+        return preference_fractions(query, table), None
+
+    def describe(self, points, info):
+        return f"Preference compatibility: {points:.1f}/{self.max_label} (Matching preferences: {info[0]}/{info[1]})"
+
+class ScoringPlan:
+    """A weight profile compiled for execution.
+
+    Factors are instantiated with their parameters and their score methods
+    bound once, so scoring a pair is a single loop over the steps. Points are
+    fraction * weight * scale, summed in profile order; results are
+    (factor, points, info) tuples in the same order.
+    """
+
+    def __init__(self, name: str, profile: Dict, factors: List[Factor]):
+        self.name = name
+        self.profile = profile
+        self.factors = factors
+        self.scale = profile.get('scale', 1)
+        self.low, self.high = profile.get('clamp', (0, 100))
+        self._steps: List[Tuple[Factor, Callable, float]] = [(factor, factor.score, factor.weight) for factor in factors]
+        self._variants: Dict[tuple, "ScoringPlan"] = {}
+
+    def score(self, side1: Any, side2: Any) -> Tuple[float, List[tuple]]:
+        if metrics.enabled:
+            return self._score_timed(side1, side2)
+        scale = self.scale
+        total = 0.0
+        results = []
+        for factor, score, weight in self._steps:
+            fraction, info = score(side1, side2)
+            points = fraction * weight * scale
+            total += points
+            results.append((factor, points, info))
+        return min(max(total, self.low), self.high), results
+
+    def _score_timed(self, side1: Any, side2: Any) -> Tuple[float, List[tuple]]:
+        # score() with each factor timed under "factor.<name>"; a separate loop keeps the untimed one lean
+        scale = self.scale
+        total = 0.0
+        results = []
+        for factor, score, weight in self._steps:
+            start = perf_counter()
+            fraction, info = score(side1, side2)
+            metrics.observe(factor.stage, perf_counter() - start)
+            points = fraction * weight * scale
+            total += points
+            results.append((factor, points, info))
+        return min(max(total, self.low), self.high), results
+
+    def score_table(self, query: QueryProfile, table: Any, **options) -> Tuple[Any, List[tuple]]:
+        """Totals for `query` against every row of a batch_scoring.CandidateTable.
+
+        Options are passed to each factor's score_table, e.g. a per-row
+        max_age_diff array for the age factor.
+        """
+        import numpy as np
+        scale = self.scale
+        total = np.zeros(len(table))
+        results = []
+        for factor, _, weight in self._steps:
+            with metrics.timed(factor.table_stage):
+                fractions, info = factor.score_table(query, table, **options)
+            points = fractions * weight * scale
+            total = total + points
+            results.append((factor, points, info))
+        return np.clip(total, self.low, self.high), results
+
+    def with_params(self, factor_name: str, **params) -> "ScoringPlan":
+        """This plan with some of one factor's parameters replaced, compiled once per distinct value"""
+        if factor_name not in self.profile['factors']:
+            return self
+        key = (factor_name, tuple(sorted(params.items())))
+        plan = self._variants.get(key)
+        if plan is None:
+            spec = self.profile['factors'][factor_name]
+            spec = dict(spec) if isinstance(spec, dict) else {'weight': spec}
+            spec.update(params)
+            if len(self._variants) >= MAX_PLAN_VARIANTS:
+                self._variants.clear()
+            plan = self._variants[key] = compile_plan(
+                dict(self.profile, factors=dict(self.profile['factors'], **{factor_name: spec})), self.name
+            )
+        return plan
+
+# Parameter variants kept per plan (e.g. one per max_age_diff callers use)
+MAX_PLAN_VARIANTS = 64
+
+def describe(results: List[tuple]) -> str:
+    """Match details: one line per factor, joined with '; '"""
+    return "; ".join(factor.describe(points, info) for factor, points, info in results)
+
+def compile_plan(profile: Dict, name: str = "") -> ScoringPlan:
+    """ScoringPlan of a profile {"factors": {name: weight or {"weight": w, **params}}, "scale": 1, "clamp": [0, 100]}"""
+    scale = profile.get('scale', 1)
+    factors = []
+    for factor_name, spec in profile['factors'].items():
+        params = dict(spec) if isinstance(spec, dict) else {'weight': spec}
+        weight = params.pop('weight')
+        factor_class = FACTORS.get(factor_name)
+        if factor_class is None:
+            raise ValueError(f"Unknown scoring factor {factor_name!r} in weight profile {name!r}")
+        if weight < 0:
+            raise ValueError(f"Weight of {factor_name!r} in weight profile {name!r} is negative")
+        try:
+            factor = factor_class(**params)
+        except TypeError as e:
+            raise ValueError(f"Bad parameters for {factor_name!r} in weight profile {name!r}: {e}") from None
+        factor.weight = weight
+        factor.max_points = weight * scale
+        factor.max_label = f"{factor.max_points:g}"
+        factor.stage, factor.table_stage = f"factor.{factor_name}", f"factor_table.{factor_name}"
+        factors.append(factor)
+    return ScoringPlan(name, profile, factors)
+
+DEFAULT_WEIGHT_PROFILES = {
+    # Agents and the vectorized batch scorer: points out of 40/20/20/20
+    'match': {
+        'factors': {
+            'interest_overlap': 40,
+            'age_gap': {'weight': 20, 'max_age_diff': DEFAULT_MAX_AGE_DIFF},
+            'distance': 20,
+            'preference_agreement': 20,
+        },
+    },
+    # lovefi-agents compatibility analysis: 50/25/25 shares of 100
+    'compatibility': {
+        'scale': 100,
+        'factors': {'age_life_stage': 0.25, 'interest_categories': 0.50, 'place': 0.25},
+    },
+}
+
+def load_weight_profiles(path: Optional[str]) -> Dict[str, Dict]:
+    """DEFAULT_WEIGHT_PROFILES, with the profiles in the JSON file at `path` added or replacing them"""
+    profiles = dict(DEFAULT_WEIGHT_PROFILES)
+    if path:
+        with open(path) as f:
+            profiles.update(json.load(f))
+    return profiles
+
+weight_profiles = load_weight_profiles(os.environ.get("LOVEFI_WEIGHT_PROFILES"))
+_plans: Dict[str, ScoringPlan] = {}
+
+def get_plan(name: str) -> ScoringPlan:
+    """Compiled plan of a weight profile, built on first use"""
+    plan = _plans.get(name)
+    if plan is None:
+        if name not in weight_profiles:
+            raise KeyError(f"Unknown weight profile {name!r}")
+        plan = _plans[name] = compile_plan(weight_profiles[name], name)
+    return plan
+
+def set_weight_profiles(profiles: Dict[str, Dict]) -> None:
+    global weight_profiles
+    weight_profiles = profiles
+    _plans.clear()
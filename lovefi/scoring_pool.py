@@ -0,0 +1,345 @@
+"""
+Worker processes for CPU-heavy scoring.
+
+The agent runs on one event loop, so ranking a large candidate pool uses one
+core and stalls every other handler meanwhile. ScoringPool spreads the chunks
+of a ranking over a ProcessPoolExecutor:
+
+- The candidate table lives in a multiprocessing.shared_memory block
+  (SharedTable) with the same spare capacity as the pool's buffers. When the
+  pool's version changes, only the rows added or replaced since are copied
+  in; a new block is written only when the buffers were reallocated, the
+  address area is full, or rows being read by a running ranking changed.
+  Tasks carry the block name, the row count, the query with the few
+  vocabulary codes it needs and a row range; each worker maps a block once
+  and keeps it, so candidate data is never pickled.
+- Workers are spawned without re-running the parent's __main__ (the agent
+  module builds an Agent, caches and a database connection on import); they
+  load only the scoring modules.
+- At most `max_pending` tasks are queued or running. Callers wait for a free
+  slot, or get PoolBusy after `timeout`, so bursts back up in the handlers
+  instead of an unbounded executor queue.
+
+Configured by LOVEFI_SCORING_WORKERS (0, the default, keeps scoring in
+process) and LOVEFI_SCORING_QUEUE (default twice the workers).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import pickle
+import struct
+import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import context as mp_context_module, spawn
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from batch_scoring import CandidateTable, CandidateTableBuilder, QueryProfile, Vocabulary, score_candidates
+from candidate_pool import CandidatePool, chunk_top, iter_chunks, row_position, top_matches
+from top_k import TopK
+
+# Numeric CandidateTable columns placed in shared memory
+SHARED_COLUMNS = ("ages", "lats", "lons", "search_radii", "interest_bits", "interest_counts",
+                  "preference_codes", "preference_counts")
+_ALIGN = 64
+# Smallest address area of a block; it is sized at twice the addresses it starts with
+MIN_ADDRESS_BYTES = 1 << 16
+
+class PoolBusy(RuntimeError):
+    """The scoring pool queue stayed full for longer than the caller would wait"""
+
+def _aligned(size: int) -> int:
+    return -(-size // _ALIGN) * _ALIGN
+
+class SharedTable:
+    """A CandidateTableBuilder's rows in one shared memory block.
+
+    Layout: u32 header length, pickled header (column dtypes, shapes and
+    offsets), then each column 64-byte aligned at the builder's capacity:
+    the numeric columns, address start and end offsets, and an area of UTF-8
+    address bytes. Candidate ids and vocabularies stay in the parent;
+    workers see row numbers instead.
+    """
+
+    def __init__(self, builder: CandidateTableBuilder):
+        buffers = builder.buffers()
+        capacity = len(buffers['ages'])
+        n = len(builder)
+        addresses = [builder.address(row).encode() for row in range(n)]
+        address_bytes = max(MIN_ADDRESS_BYTES, 2 * sum(map(len, addresses)))
+        layout = [(name, buffers[name].dtype, buffers[name].shape) for name in SHARED_COLUMNS]
+        layout += [("address_starts", np.dtype(np.int64), (capacity,)), ("address_ends", np.dtype(np.int64), (capacity,)),
+                   ("address_bytes", np.dtype(np.uint8), (address_bytes,))]
+        columns, offset = [], 0
+        for name, dtype, shape in layout:
+            columns.append((name, dtype.str, shape, offset))
+            offset += _aligned(int(np.prod(shape)) * dtype.itemsize)
+        header = pickle.dumps({'columns': columns}, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shm = SharedMemory(create=True, size=_aligned(4 + len(header)) + offset)
+        self.name = self.shm.name
+        self.shm.buf[:4] = struct.pack("<I", len(header))
+        self.shm.buf[4:4 + len(header)] = header
+        self._views = _column_views(self.shm)
+        for name in SHARED_COLUMNS:
+            self._views[name][:n] = buffers[name][:n]
+        self._address_used = 0
+        self._write_addresses(range(n), addresses)
+        self.builder = builder
+        self.generation = builder.generation
+        self.version = builder.version
+        self.rows = n
+        self.users = 0
+        self.retired = False
+
+    def _write_addresses(self, rows, addresses: List[bytes]) -> None:
+        area, starts, ends = self._views['address_bytes'], self._views['address_starts'], self._views['address_ends']
+        for row, address in zip(rows, addresses):
+            start = self._address_used
+            area[start:start + len(address)] = np.frombuffer(address, dtype=np.uint8)
+            starts[row], ends[row] = start, start + len(address)
+            self._address_used += len(address)
+
+    def sync(self, builder: CandidateTableBuilder) -> bool:
+        """Copy in the rows changed since this block was last synced; False if it needs a new block"""
+        if builder is not self.builder or builder.generation != self.generation:
+            return False
+        if builder.version == self.version:
+            return True
+        changed = builder.changed_since(self.version)
+        if self.users and len(changed) and changed[0] < self.rows:
+            # A running ranking may be reading a replaced row; appended rows are past what it reads
+            return False
+        addresses = [builder.address(row).encode() for row in changed]
+        if self._address_used + sum(map(len, addresses)) > len(self._views['address_bytes']):
+            return False
+        buffers = builder.buffers()
+        for name in SHARED_COLUMNS:
+            self._views[name][changed] = buffers[name][changed]
+        self._write_addresses(changed, addresses)
+        self.version, self.rows = builder.version, len(builder)
+        return True
+
+    def close(self) -> None:
+        # The views must go before the mapping can close
+        self._views = None
+        self.shm.close()
+        self.shm.unlink()
+
+def _column_views(shm: SharedMemory) -> Dict[str, np.ndarray]:
+    """Every column of a block written by SharedTable, at full capacity; arrays are views into the block"""
+    (header_len,) = struct.unpack_from("<I", shm.buf, 0)
+    header = pickle.loads(shm.buf[4:4 + header_len])
+    data_start = _aligned(4 + header_len)
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=data_start + offset)
+        for name, dtype, shape, offset in header['columns']
+    }
+
+class SharedAddresses:
+    """Addresses of some rows of a shared block, decoded on access (only rows without coordinates are read)"""
+
+    __slots__ = ("_area", "_starts", "_ends")
+
+    def __init__(self, area: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        self._area, self._starts, self._ends = area, starts, ends
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __getitem__(self, index: int) -> str:
+        return self._area[self._starts[index]:self._ends[index]].tobytes().decode()
+
+def attach_rows(views: Dict[str, np.ndarray], n_rows: int, rows: Any, interest_vocab: Vocabulary,
+                preference_vocab: Vocabulary) -> CandidateTable:
+    """CandidateTable of `rows` (a slice or a row array) of a block's first n_rows; ids are row numbers"""
+    if isinstance(rows, slice):
+        rows = slice(rows.start, min(rows.stop, n_rows))
+        ids = np.arange(rows.start, rows.stop)
+    else:
+        ids = rows = np.asarray(rows, dtype=np.int64)
+    return CandidateTable(
+        ids=ids,
+        addresses=SharedAddresses(views['address_bytes'], views['address_starts'][rows], views['address_ends'][rows]),
+        interest_vocab=interest_vocab, preference_vocab=preference_vocab,
+        **{name: views[name][rows] for name in SHARED_COLUMNS},
+    )
+
+# Worker side: blocks mapped by this process, most recent last
+_attached: "OrderedDict[str, Tuple[SharedMemory, Dict[str, np.ndarray]]]" = OrderedDict()
+MAX_ATTACHED = 2
+
+def _worker_views(name: str) -> Dict[str, np.ndarray]:
+    entry = _attached.get(name)
+    if entry is None:
+        shm = SharedMemory(name=name)
+        entry = _attached[name] = (shm, _column_views(shm))
+        while len(_attached) > MAX_ATTACHED:
+            old_shm, old_views = _attached.popitem(last=False)[1]
+            del old_views
+            try:
+                old_shm.close()
+            except BufferError:
+                # A view is still alive somewhere; the mapping goes with the process
+                pass
+    return entry[1]
+
+def rank_chunk(name: str, n_rows: int, query: QueryProfile, rows: Any, k: int, exclude_row: Optional[int],
+               interest_vocab: Vocabulary, preference_vocab: Vocabulary) -> List[tuple]:
+    """Worker task: chunk_top for `rows` of the shared table, keyed by row number"""
+    chunk = attach_rows(_worker_views(name), n_rows, rows, interest_vocab, preference_vocab)
+    if not len(chunk):
+        return []
+    entries = chunk_top(chunk, score_candidates(query, chunk), k, exclude_at=row_position(rows, exclude_row))
+    return [(score, int(row), factors) for score, row, factors in entries]
+
+def _init_worker() -> None:
+    """Worker initializer: load the scoring modules, and only those, before the first task arrives"""
+    import batch_scoring
+    import top_k
+
+# spawn starts each worker by re-running the parent's main module as __mp_main__, so that
+# functions defined there can be unpickled. Tasks here are module-level functions of this
+# module, so workers skip that step.
+_launch_lock = threading.Lock()
+_get_preparation_data = spawn.get_preparation_data
+
+def _preparation_without_main(name: str) -> Dict[str, Any]:
+    data = _get_preparation_data(name)
+    data.pop('init_main_from_name', None)
+    data.pop('init_main_from_path', None)
+    return data
+
+if sys.platform != "win32":
+    from multiprocessing import popen_spawn_posix
+
+    class _WorkerPopen(popen_spawn_posix.Popen):
+        def _launch(self, process_obj):
+            with _launch_lock:
+                spawn.get_preparation_data = _preparation_without_main
+                try:
+                    super()._launch(process_obj)
+                finally:
+                    spawn.get_preparation_data = _get_preparation_data
+
+    class _WorkerProcess(mp_context_module.SpawnProcess):
+        @staticmethod
+        def _Popen(process_obj):
+            return _WorkerPopen(process_obj)
+
+    class WorkerContext(mp_context_module.SpawnContext):
+        """spawn, without importing the parent's __main__ in the child"""
+        Process = _WorkerProcess
+
+    def worker_context() -> multiprocessing.context.BaseContext:
+        return WorkerContext()
+else:
+    def worker_context() -> multiprocessing.context.BaseContext:
+        return multiprocessing.get_context("spawn")
+
+class ScoringPool:
+    """ProcessPoolExecutor for scoring tasks with a bounded queue; use from one event loop"""
+
+    def __init__(self, workers: int, max_pending: Optional[int] = None,
+                 mp_context: Optional[multiprocessing.context.BaseContext] = None):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        # spawn: forking a process that runs an event loop and network threads is unsafe
+        self._executor = ProcessPoolExecutor(workers, mp_context=mp_context or worker_context(), initializer=_init_worker)
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._shared: Optional[SharedTable] = None
+
+    async def dispatch(self, fn: Callable, *args, timeout: Optional[float] = None) -> asyncio.Future:
+        """Start fn(*args) in a worker once a queue slot is free and return its future"""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise PoolBusy(f"scoring pool queue is full ({self.max_pending} tasks)") from None
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def submit(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        return await (await self.dispatch(fn, *args, timeout=timeout))
+
+    def _publish(self, builder: CandidateTableBuilder) -> SharedTable:
+        """The block for the builder's current version, synced in place when possible"""
+        old = self._shared
+        if old is None or not old.sync(builder):
+            self._shared = SharedTable(builder)
+            if old is not None:
+                old.retired = True
+                if not old.users:
+                    old.close()
+        return self._shared
+
+    async def iter_top_matches(self, candidates: CandidatePool, query: QueryProfile, k: int = 10,
+                               chunk_size: int = 4096, within_radius: bool = False, exclude: Optional[Hashable] = None,
+                               timeout: Optional[float] = None) -> AsyncIterator[Tuple[List[Dict[str, Any]], int, int, bool]]:
+        """CandidatePool.iter_top_matches with chunks scored in the workers.
+
+        Chunks are pushed into the heap in order, so results (ties included)
+        are the same as in process; a snapshot is yielded after each chunk.
+        """
+        # Rows of this builder are only appended or replaced in place, so row -> id holds for the
+        # whole ranking; remove() gives the pool a new builder
+        builder = candidates.builder
+        rows = candidates.candidate_rows(query, within_radius)
+        shared = self._publish(builder)
+        n_rows = shared.rows
+        exclude_row = candidates.row(exclude) if exclude is not None else None
+        # Only the query's own codes travel with each task
+        interest_vocab = builder.interest_vocab.subset(set(query.interests))
+        preference_vocab = builder.preference_vocab.subset(query.preferences)
+        shared.users += 1
+        top = TopK(k)
+        pending: deque = deque()
+
+        def collect(entries: List[tuple], scanned: int) -> None:
+            for score, row, factors in entries:
+                top.push(score, builder.candidate_id(row), factors)
+            top.scanned = scanned
+
+        try:
+            for chunk_rows, scanned, total in iter_chunks(n_rows if rows is None else rows, chunk_size):
+                future = await self.dispatch(rank_chunk, shared.name, n_rows, query, chunk_rows, k, exclude_row,
+                                             interest_vocab, preference_vocab, timeout=timeout)
+                pending.append((future, scanned))
+                while pending and pending[0][0].done():
+                    future, done_scanned = pending.popleft()
+                    collect(future.result(), done_scanned)
+                    yield top_matches(top), done_scanned, total, done_scanned >= total
+            while pending:
+                future, done_scanned = pending.popleft()
+                collect(await future, done_scanned)
+                yield top_matches(top), done_scanned, total, done_scanned >= total
+        finally:
+            for future, _ in pending:
+                future.cancel()
+            shared.users -= 1
+            if shared.retired and not shared.users:
+                shared.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+def build_scoring_pool() -> Optional[ScoringPool]:
+    """Pool configured by LOVEFI_SCORING_WORKERS and LOVEFI_SCORING_QUEUE, or None when disabled"""
+    workers = int(os.environ.get("LOVEFI_SCORING_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    queue = os.environ.get("LOVEFI_SCORING_QUEUE")
+    return ScoringPool(workers, int(queue) if queue else None)
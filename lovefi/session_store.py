@@ -0,0 +1,161 @@
+"""
+Chat session id -> sender address, for replying to the chat an LLM answer belongs to.
+
+This replaces one ctx.storage key per session. Those keys are never deleted,
+and uAgents rewrites its whole JSON storage file on every update. Here a
+session expires `ttl` seconds after its last message, and the store keeps at
+most `maxsize` sessions, dropping the least recently used first. Lookups
+and updates are dict operations.
+
+An expired session is remembered for one more `ttl`, so an answer arriving
+late can be told apart from one for a session never seen. `purge()` drops
+sessions past that point.
+
+A client may end a session in the same message that asks for something
+(text followed by end-session). `expect()` records an answer the session is
+still owed, and `end()` then defers closing the session until the last one
+is `answered()`.
+
+Persistence is optional and batched: `save()` writes the live sessions to a
+JSON file only if something changed. The agents call it on an interval and
+at shutdown.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+ACTIVE = "active"
+EXPIRED = "expired"
+UNKNOWN = "unknown"
+
+class SessionStore:
+    def __init__(self, path: Optional[str] = None, maxsize: int = 10000, ttl: float = 1800.0,
+                 clock: Callable[[], float] = time.time):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Wall-clock time, so persisted expiry times survive a restart
+        self._clock = clock
+        # session -> (expires_at, sender), least recently used first
+        self._sessions: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # session -> answers still owed; sessions ended while owed some close after the last
+        self._pending: Dict[str, int] = {}
+        self._ending: Set[str] = set()
+        self.dirty = False
+        self.evictions = 0
+        self.expirations = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def open(self, session: str, sender: str) -> None:
+        """Start `session` for `sender`, or extend it by another ttl"""
+        self._sessions[session] = (self._clock() + self.ttl, sender)
+        self._sessions.move_to_end(session)
+        self._ending.discard(session)
+        while len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        self.dirty = True
+
+    def lookup(self, session: str) -> Tuple[str, Optional[str]]:
+        """(ACTIVE, sender), (EXPIRED, sender) or (UNKNOWN, None); does not extend the session"""
+        entry = self._sessions.get(session)
+        if entry is None:
+            return UNKNOWN, None
+        expires_at, sender = entry
+        if expires_at <= self._clock():
+            return EXPIRED, sender
+        return ACTIVE, sender
+
+    def close(self, session: str) -> None:
+        self._pending.pop(session, None)
+        self._ending.discard(session)
+        if self._sessions.pop(session, None) is not None:
+            self.dirty = True
+
+    def owed(self, session: str) -> int:
+        """Answers `session` is still owed"""
+        return self._pending.get(session, 0)
+
+    def expect(self, session: str) -> None:
+        """Record an answer `session` is owed, such as a pending LLM reply"""
+        self._pending[session] = self._pending.get(session, 0) + 1
+
+    def answered(self, session: str) -> None:
+        """One owed answer was sent; closes the session if it was ended meanwhile"""
+        owed = self._pending.get(session, 0) - 1
+        if owed > 0:
+            self._pending[session] = owed
+            return
+        self._pending.pop(session, None)
+        if session in self._ending:
+            self.close(session)
+
+    def end(self, session: str) -> None:
+        """Close `session` now, or once every answer it is owed has been sent"""
+        if self._pending.get(session):
+            self._ending.add(session)
+        else:
+            self.close(session)
+
+    def purge(self) -> int:
+        """Forget sessions that expired more than ttl ago; returns how many"""
+        cutoff = self._clock() - self.ttl
+        stale = [session for session, (expires_at, _) in self._sessions.items() if expires_at <= cutoff]
+        for session in stale:
+            del self._sessions[session]
+        # Answers that never came (or sessions evicted while owed some) are not tracked forever
+        for session in {*self._pending, *self._ending} - self._sessions.keys():
+            self._pending.pop(session, None)
+            self._ending.discard(session)
+        self.expirations += len(stale)
+        self.dirty = self.dirty or bool(stale)
+        return len(stale)
+
+    def load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        now = self._clock()
+        entries = sorted(
+            (item["expires_at"], item["session"], item["sender"])
+            for item in data.get("sessions", []) if item["expires_at"] > now
+        )
+        self._sessions = OrderedDict((session, (expires_at, sender)) for expires_at, session, sender in entries[-self.maxsize:])
+        self.dirty = False
+
+    def save(self) -> bool:
+        """Write the live sessions if anything changed since the last save; returns whether it wrote"""
+        if not self.path or not self.dirty:
+            return False
+        now = self._clock()
+        payload = {"sessions": [
+            {"session": session, "sender": sender, "expires_at": expires_at}
+            for session, (expires_at, sender) in self._sessions.items() if expires_at > now
+        ]}
+        self.dirty = False
+        # Write to a temporary file first so a crash never leaves a truncated store
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {'evictions': self.evictions, 'expirations': self.expirations, 'size': len(self._sessions)}
+
+def build_session_store() -> SessionStore:
+    """Store configured by LOVEFI_SESSION_TTL (seconds, default 1800), LOVEFI_SESSION_MAX
+    (default 10000) and LOVEFI_SESSION_STORE (JSON file; unset keeps sessions in memory only)"""
+    return SessionStore(
+        os.environ.get("LOVEFI_SESSION_STORE"),
+        maxsize=int(os.environ.get("LOVEFI_SESSION_MAX", "10000")),
+        ttl=float(os.environ.get("LOVEFI_SESSION_TTL", "1800")),
+    )
@@ -0,0 +1,108 @@
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from batch_scoring import EARTH_RADIUS_KM, CandidateTable, haversine_km
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+class CandidateStore:
+    """Grid-bucketed spatial index over geocoded candidates.
+
+    The globe is cut into cells of `cell_km` degrees-equivalent in latitude
+    and longitude. A radius query visits only the cells overlapping the
+    query's bounding box (wrapping at the antimeridian, widening to full
+    rings near the poles) and then filters those points by exact haversine
+    distance, so far-away candidates are never looked at.
+    """
+
+    def __init__(self, cell_km: float = 25.0):
+        if cell_km <= 0:
+            raise ValueError("cell_km must be positive")
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self._lon_cells = math.ceil(360 / self.cell_deg)
+        self._lat_cells = math.ceil(180 / self.cell_deg)
+        self._cells: Dict[Tuple[int, int], List[Hashable]] = {}
+        self._points: Dict[Hashable, Tuple[float, float, Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._points
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        row = min(int((lat + 90) / self.cell_deg), self._lat_cells - 1)
+        col = int(((lon + 180) % 360) / self.cell_deg) % self._lon_cells
+        return row, col
+
+    def add(self, key: Hashable, lat: float, lon: float) -> None:
+        """Index a candidate; re-adding a key moves it"""
+        if key in self._points:
+            self.remove(key)
+        cell = self._cell(lat, lon)
+        self._points[key] = (lat, lon, cell)
+        self._cells.setdefault(cell, []).append(key)
+
+    def remove(self, key: Hashable) -> None:
+        _, _, cell = self._points.pop(key)
+        bucket = self._cells[cell]
+        bucket.remove(key)
+        if not bucket:
+            del self._cells[cell]
+
+    def _cells_near(self, lat: float, lon: float, radius_km: float) -> Iterable[Tuple[int, int]]:
+        dlat = radius_km / KM_PER_DEGREE
+        lat_lo, lat_hi = lat - dlat, lat + dlat
+        cos_lat = math.cos(math.radians(max(abs(lat_lo), abs(lat_hi))))
+        full_ring = lat_lo <= -90 or lat_hi >= 90 or cos_lat <= 0 or dlat / cos_lat >= 180
+        row_lo = self._cell(max(lat_lo, -90), 0)[0]
+        row_hi = self._cell(min(lat_hi, 90), 0)[0]
+        if full_ring:
+            cols = range(self._lon_cells)
+        else:
+            dlon = dlat / cos_lat
+            col_lo = math.floor((lon - dlon + 180) / self.cell_deg)
+            col_hi = math.floor((lon + dlon + 180) / self.cell_deg)
+            cols = [col % self._lon_cells for col in range(col_lo, col_hi + 1)]
+        n_cells = (row_hi - row_lo + 1) * len(cols)
+        if n_cells > len(self._cells):
+            # Sparse store and a huge radius: cheaper to walk occupied cells
+            col_set = set(cols)
+            return [cell for cell in self._cells if row_lo <= cell[0] <= row_hi and cell[1] in col_set]
+        return [(row, col) for row in range(row_lo, row_hi + 1) for col in cols]
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[Hashable, float]]:
+        """(key, distance_km) for every candidate within `radius_km`, nearest first"""
+        keys = []
+        for cell in self._cells_near(lat, lon, radius_km):
+            keys.extend(self._cells.get(cell, ()))
+        if not keys:
+            return []
+        lats = np.fromiter((self._points[key][0] for key in keys), dtype=np.float64, count=len(keys))
+        lons = np.fromiter((self._points[key][1] for key in keys), dtype=np.float64, count=len(keys))
+        distances = haversine_km(lat, lon, lats, lons)
+        inside = np.flatnonzero(distances <= radius_km)
+        inside = inside[np.argsort(distances[inside], kind="stable")]
+        return [(keys[i], float(distances[i])) for i in inside]
+
+    @classmethod
+    def from_table(cls, table: CandidateTable, cell_km: float = 25.0) -> "CandidateStore":
+        """Index a CandidateTable by row number; rows without coordinates are skipped"""
+        store = cls(cell_km=cell_km)
+        for row in np.flatnonzero(~(np.isnan(table.lats) | np.isnan(table.lons))):
+            store.add(int(row), float(table.lats[row]), float(table.lons[row]))
+        return store
+
+def candidates_within_radius(store: CandidateStore, table: CandidateTable, lat: Optional[float], lon: Optional[float],
+                             search_radius: float) -> CandidateTable:
+    """Rows of `table` inside the searcher's radius, for scoring with score_candidates.
+
+    A searcher that could not be geocoded has no radius to apply, so the
+    whole table is returned and location falls back to string similarity.
+    """
+    if lat is None or lon is None:
+        return table
+    rows = [row for row, _ in store.query_radius(lat, lon, search_radius)]
+    return table.take(rows)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the vectorized one-to-many scorer against the pairwise scorer
+"""
+
+import random
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+from batch_scoring import CandidateTable, QueryProfile, rank_candidates, score_candidates
+from dating_match_agent import (
+    Location, PersonalInfo, Preference, calculate_age, calculate_match_score_internal
+)
+
+INTERESTS = ["reading", "hiking", "cooking", "chess", "music", "travel", "yoga", "gaming"]
+CITIES = {
+    "New York": (40.71, -74.0),
+    "Brooklyn": (40.68, -73.94),
+    "Boston": (42.36, -71.06),
+    "Atlantis": (None, None),
+}
+OPTIONS = ["Homebody", "Nomad", "Night owl", "Early bird"]
+
+def random_profile(rng):
+    address = rng.choice(list(CITIES))
+    birthday = "" if rng.random() < 0.2 else f"{rng.randint(1970, 2004)}-0{rng.randint(1, 9)}-15"
+    preferences = [
+        Preference(category="c", question=f"q{i}", options=OPTIONS, selected_index=0, selected_option=rng.choice(OPTIONS))
+        for i in range(rng.randint(0, 3))
+    ]
+    return {
+        'personal_info': PersonalInfo(first_name="A", last_name="B", birthday=birthday),
+        'location': Location(address=address, search_radius=rng.choice([0, 5, 10, 500])),
+        'interests': rng.sample(INTERESTS, rng.randint(0, 5)),
+        'preferences': preferences,
+    }
+
+def to_query(profile):
+    return QueryProfile(
+        age=calculate_age(profile['personal_info'].birthday),
+        coordinates=CITIES[profile['location'].address],
+        search_radius=profile['location'].search_radius,
+        address=profile['location'].address,
+        interests=profile['interests'],
+        preferences=[p.selected_option for p in profile['preferences']],
+    )
+
+def test_batch_matches_pairwise_scores():
+    """Every vectorized score equals the scalar score for the same pair"""
+    rng = random.Random(7)
+    query = random_profile(rng)
+    candidates = [random_profile(rng) for _ in range(300)]
+    table = CandidateTable.from_profiles(range(len(candidates)), [to_query(c) for c in candidates])
+
+    scores = score_candidates(to_query(query), table)
+
+    for row, candidate in enumerate(candidates):
+        expected, _ = calculate_match_score_internal(
+            query['personal_info'], "f", query['location'], query['interests'], query['preferences'],
+            candidate['personal_info'], "m", candidate['location'], candidate['interests'], candidate['preferences'],
+            coordinates=(CITIES[query['location'].address], CITIES[candidate['location'].address]),
+        )
+        assert scores.total[row] == pytest.approx(expected, abs=1e-9)
+
+def test_rank_candidates_orders_best_first():
+    """Top-k returns the highest totals in descending order"""
+    rng = random.Random(11)
+    query = to_query(random_profile(rng))
+    profiles = [to_query(random_profile(rng)) for _ in range(50)]
+    table = CandidateTable.from_profiles([f"c{i}" for i in range(50)], profiles)
+
+    ranked = rank_candidates(query, table, k=5)
+    totals = sorted(score_candidates(query, table).total, reverse=True)
+    assert [score for _, score in ranked] == pytest.approx(totals[:5])
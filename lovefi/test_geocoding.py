@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the geocode cache in front of get_coordinates
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+import geocoding
+from geocoders import Geocoder
+from geocoding import GeocodeCache, normalize_address
+
+def test_normalize_address():
+    """Case, punctuation and spacing variants share one key"""
+    assert normalize_address("New York, NY") == normalize_address("new york  ny")
+    assert normalize_address("  ") == ""
+
+def test_cache_persists_to_disk(tmp_path):
+    """A fresh cache on the same file serves earlier lookups from disk"""
+    path = str(tmp_path / "geocode.sqlite3")
+    cache = GeocodeCache(path=path)
+    cache.set("New York, NY", 40.71, -74.0)
+    cache.close()
+
+    reopened = GeocodeCache(path=path)
+    assert reopened.get("new york ny") == (40.71, -74.0)
+    assert reopened.stats()['disk_hits'] == 1
+    assert reopened.get("New York NY") == (40.71, -74.0)
+    assert reopened.stats()['memory_hits'] == 1
+
+def test_cache_lives_in_the_user_cache_dir(tmp_path, monkeypatch):
+    """The default file goes under $XDG_CACHE_HOME, and an unwritable path keeps the cache in memory"""
+    monkeypatch.delenv("LOVEFI_GEOCODE_CACHE", raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    path = geocoding.default_cache_path()
+    assert path == str(tmp_path / "xdg" / "lovefi" / "geocode_cache.sqlite3")
+    GeocodeCache(path=path).close()
+    assert os.path.exists(path)
+    monkeypatch.setenv("LOVEFI_GEOCODE_CACHE", "")
+    assert geocoding.default_cache_path() == ""
+    (tmp_path / "file").write_text("")
+    cache = GeocodeCache(path=str(tmp_path / "file" / "geocode.sqlite3"))
+    cache.set("Boston", 42.36, -71.06)
+    assert cache.get("Boston") == (42.36, -71.06)
+
+def test_expired_entries_are_misses(tmp_path):
+    """Entries past their TTL are neither served from memory nor from disk"""
+    cache = GeocodeCache(path=str(tmp_path / "geocode.sqlite3"), ttl=-1)
+    cache.set("Boston", 42.36, -71.06)
+    assert cache.get("Boston") is geocoding.MISSING
+
+class FakeRemote(Geocoder):
+    """Stand-in for Nominatim that records every lookup"""
+
+    remote = True
+
+    def __init__(self, places, delay=0.0):
+        self.places = places
+        self.delay = delay
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        if address == "offline":
+            raise ConnectionError("no route")
+        return self.places.get(address.split(",")[0].lower(), (None, None))
+
+    async def geocode_async(self, address):
+        await asyncio.sleep(self.delay)
+        return self.geocode(address)
+
+def test_get_coordinates_caches_hits_and_misses():
+    """Resolved and unresolved addresses are each fetched once; transport errors are not cached"""
+    remote = FakeRemote({"london": (51.5, -0.12)})
+    geocoding.set_geocode_cache(GeocodeCache(path=None))
+    geocoding.set_geocoders([remote])
+    try:
+        assert geocoding.get_coordinates("London, UK") == (51.5, -0.12)
+        assert geocoding.get_coordinates("london uk") == (51.5, -0.12)
+        assert geocoding.get_coordinates("Atlantis") == (None, None)
+        assert geocoding.get_coordinates("atlantis") == (None, None)
+        assert geocoding.get_coordinates("offline") == (None, None)
+        assert geocoding.get_coordinates("offline") == (None, None)
+        assert remote.calls == ["London, UK", "Atlantis", "offline", "offline"]
+        stats = geocoding.get_geocode_cache().stats()
+        assert stats['hits'] == 2 and stats['negative_hits'] == 1
+    finally:
+        geocoding.set_geocode_cache(None)
+        geocoding.set_geocoders(None)
+
+def test_async_geocoder_resolves_concurrently():
+    """Both addresses are looked up at once and duplicate in-flight lookups share one request"""
+    remote = FakeRemote({"new york": (40.7, -74.0)}, delay=0.05)
+
+    async def run():
+        geocoder = geocoding.AsyncGeocoder(cache=GeocodeCache(path=None), backends=[remote])
+        start = asyncio.get_running_loop().time()
+        results = await geocoder.geocode_many("New York", "new york", "Nowhere")
+        elapsed = asyncio.get_running_loop().time() - start
+        await geocoder.close()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(run())
+    assert results == [(40.7, -74.0), (40.7, -74.0), (None, None)]
+    assert sorted(remote.calls) == ["New York", "Nowhere"]
+    assert elapsed < 0.1
+
+GEONAMES_ROWS = [
+    "5128581\tNew York City\tNew York City\tNYC,New York\t40.71427\t-74.00597\tP\tPPL\tUS\t\tNY\t\t\t\t8804190",
+    "2643743\tLondon\tLondon\tLondres\t51.50853\t-0.12574\tP\tPPLC\tGB\t\tENG\t\t\t\t8961989",
+    "6058560\tLondon\tLondon\t\t42.98339\t-81.23304\tP\tPPL\tCA\t\tON\t\t\t\t346765",
+    "4930956\tBoston\tBoston\t\t42.35843\t-71.05977\tP\tPPLA\tUS\t\tMA\t\t\t\t675647",
+    "4478334\tPark\tPark\t\t35.2\t-80.8\tP\tPPL\tUS\t\tNC\t\t\t\t900",
+    "5001000\tMain\tMain\t\t44.1\t-85.1\tP\tPPL\tUS\t\tMI\t\t\t\t300",
+]
+
+def test_gazetteer_resolves_offline(tmp_path):
+    """GeoNames rows resolve by name, alternate name and admin1/country qualifiers"""
+    from gazetteer import GazetteerGeocoder
+
+    path = tmp_path / "cities.txt"
+    path.write_text("\n".join(GEONAMES_ROWS) + "\n", encoding="utf-8")
+    gazetteer = GazetteerGeocoder(str(path))
+
+    assert gazetteer.geocode("NYC") == (40.71427, -74.00597)
+    assert gazetteer.geocode("New York, NY") == (40.71427, -74.00597)
+    assert gazetteer.geocode("London") == (51.50853, -0.12574)
+    assert gazetteer.geocode("1083 Western Rd, London, ON, Canada") == (42.98339, -81.23304)
+    assert gazetteer.geocode("Atlantis") == (None, None)
+    assert gazetteer.search_prefix("lon") == ["london", "londres"]
+    # Street names are not places; codes and postal codes may follow a name
+    assert gazetteer.geocode("12 Main St, Boston") == (42.35843, -71.05977)
+    assert gazetteer.geocode("Park Avenue New York NY USA") == (40.71427, -74.00597)
+    assert gazetteer.geocode("Boston MA 02108") == (42.35843, -71.05977)
+    assert gazetteer.geocode("Park Lane") == (None, None)
+    assert gazetteer.geocode("Park, NC") == (35.2, -80.8)
+
+def test_gazetteer_index_is_mapped_and_rebuilt_when_stale(tmp_path):
+    """The key index is written once next to the gazetteer, reused, and rebuilt after the file changes"""
+    from gazetteer import GazetteerGeocoder
+
+    path = tmp_path / "cities.txt"
+    path.write_text("\n".join(GEONAMES_ROWS[:3]) + "\n", encoding="utf-8")
+    first = GazetteerGeocoder(str(path))
+    index = tmp_path / "cities.txt.idx"
+    built = index.stat().st_mtime_ns
+    assert GazetteerGeocoder(str(path)).geocode("London, ON") == (42.98339, -81.23304)
+    assert index.stat().st_mtime_ns == built and len(first) == 6
+
+    path.write_text("\n".join(GEONAMES_ROWS) + "\n", encoding="utf-8")
+    assert GazetteerGeocoder(str(path)).geocode("Boston") == (42.35843, -71.05977)
+
+def test_local_backend_answers_before_remote(tmp_path):
+    """Known places never reach the remote backend; unknown ones fall through to it"""
+    from gazetteer import GazetteerGeocoder
+
+    path = tmp_path / "cities.csv"
+    path.write_text("name,lat,lon,country\nBoston,42.36,-71.06,US\n", encoding="utf-8")
+    remote = FakeRemote({"springfield": (39.8, -89.64)})
+    geocoding.set_geocode_cache(GeocodeCache(path=None))
+    geocoding.set_geocoders([GazetteerGeocoder(str(path)), remote])
+    try:
+        assert geocoding.get_coordinates("Boston, MA") == (42.36, -71.06)
+        assert geocoding.get_coordinates("Springfield") == (39.8, -89.64)
+        assert remote.calls == ["Springfield"]
+    finally:
+        geocoding.set_geocode_cache(None)
+        geocoding.set_geocoders(None)
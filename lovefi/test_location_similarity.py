@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the trigram location similarity
+"""
+
+import difflib
+import itertools
+import json
+import random
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+from location_similarity import location_similarity
+
+PLACES = ["New York", "Brooklyn, NY", "Boston", "Los Angeles", "San Francisco", "Atlantis", "Atlantis Bay",
+          "Chicago, IL", "Jersey City", "Newark", "Portland", "Portland, ME", "45 Park Ave, New York",
+          "Williamsburg, Brooklyn", "Astoria, Queens", "Cambridge, MA"]
+
+def typo(rng, place):
+    i = rng.randrange(len(place))
+    return rng.choice([place[:i] + place[i + 1:], place[:i] + rng.choice("aeiost") + place[i:], place + ", USA"])
+
+def test_similarity_tracks_difflib_ratio():
+    """Close to SequenceMatcher.ratio() on average, exact at the ends"""
+    rng = random.Random(18)
+    errors = []
+    for _ in range(500):
+        a = rng.choice(PLACES).lower()
+        b = rng.choice(PLACES).lower() if rng.random() < 0.5 else typo(rng, a)
+        errors.append(abs(location_similarity(a, b) - difflib.SequenceMatcher(None, a, b).ratio()))
+    assert sum(errors) / len(errors) < 0.07
+    assert location_similarity("New  York", "new york") == 1.0
+    assert location_similarity("", "") == 1.0 and location_similarity("abc", "xyz") == 0.0
+
+def test_similarity_on_golden_addresses():
+    """The addresses the golden cases fall back on stay within the documented distance of ratio()"""
+    with open(os.path.join(os.path.dirname(__file__), "golden_scores.json")) as f:
+        cases = json.load(f)['cases']
+    addresses = sorted({case[side]['address'].lower() for case in cases for side in ('profile1', 'profile2')})
+    errors = [abs(location_similarity(a, b) - difflib.SequenceMatcher(None, a, b).ratio())
+              for a, b in itertools.combinations(addresses, 2)]
+    assert sum(errors) / len(errors) < 0.1 and max(errors) < 0.18
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the rule-based match-request extractor that runs before the LLM
+"""
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+from dating_match_agent import EXTRACTOR_CONFIDENCE, MatchRequest, calculate_age, extract_locally
+from match_extractor import extract_match_request
+
+def test_structured_prompt_is_read_locally():
+    text = ("Alice Smith, 28, female, in Brooklyn, New York, likes hiking, chess and jazz\n"
+            "Bob, born 1994-03-02, m, Austin, within 30 mi, prefers dogs, enjoys tennis")
+    extraction = extract_match_request(text)
+    assert extraction.confidence == 1.0 and extraction.missing == []
+    request = MatchRequest.parse_obj(extraction.request)
+    assert (request.personal_info1.first_name, request.personal_info1.last_name) == ("Alice", "Smith")
+    assert calculate_age(request.personal_info1.birthday) == 28
+    assert request.location1.address == "Brooklyn, New York"
+    assert request.personal_interests1 == ["hiking", "chess", "jazz"]
+    assert (request.gender2, request.personal_info2.birthday, request.location2.search_radius) == ("male", "1994-03-02", 48)
+    assert [p.selected_option for p in request.partner_preferences2] == ["dogs"]
+    assert request.personal_interests2 == ["tennis"]
+
+def test_incomplete_or_free_text_goes_to_the_llm():
+    for text in [
+        "Alice, 28, NYC vs Bob, 31, Brooklyn",  # no interests
+        "I'm Alice, 28, from NYC and I love hiking. Bob is 31 and likes chess.",
+        "Alice, 28, NYC, likes hiking vs Bob, 31, Queens, likes art vs Carol, 30, Bronx, likes art",
+        "Kim, 26, female, Seoul, likes k-pop and dancing vs Lee, 28, male, Busan, likes dancing, has two kids",
+    ]:
+        assert extract_match_request(text).confidence < EXTRACTOR_CONFIDENCE, text
+        assert extract_locally(text) is None
+    assert extract_locally("Alice, 28, NYC, likes hiking and chess vs Bob, 31, male, Brooklyn, likes chess") is not None
+
+def test_unstated_gender_does_not_block_the_fast_path():
+    """Gender does not affect the score, so a prompt without it is still read locally"""
+    text = "Alice, 28, NYC, likes hiking and chess vs Bob, 31, Brooklyn, likes chess"
+    assert extract_match_request(text).confidence >= EXTRACTOR_CONFIDENCE
+    request = extract_locally(text)
+    assert request is not None and (request.gender1, request.personal_interests2) == ("", ["chess"])
+
+def test_introduced_name_drops_the_introduction():
+    for text in ["I am Alice, 28, NYC, likes hiking vs my name is Bob Stone, 31, Brooklyn, likes chess",
+                 "I'm Alice, 28, NYC, likes hiking vs Bob Stone, 31, Brooklyn, likes chess"]:
+        request = extract_locally(text)
+        assert request is not None, text
+        assert request.personal_info1.first_name == "Alice" and request.personal_info1.last_name == ""
+        assert (request.personal_info2.first_name, request.personal_info2.last_name) == ("Bob", "Stone")
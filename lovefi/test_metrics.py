@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the stage timers, counters and Prometheus rendering
+"""
+
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+import metrics
+from scoring_engine import QueryProfile, get_plan
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_metrics", registry)
+    monkeypatch.setattr(metrics, "enabled", True)
+    return registry
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    registry = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_metrics", registry)
+    monkeypatch.setattr(metrics, "enabled", False)
+    with metrics.timed("parse"):
+        metrics.inc("lovefi_fallback_total", path="address_similarity")
+    assert not registry.stages and not registry.counters
+
+def test_render_prometheus_text(registry):
+    """Cumulative histogram buckets per stage, counters and collected stats"""
+    registry.observe("parse", 0.0005)
+    registry.observe("parse", 2.0)
+    metrics.inc("lovefi_fallback_total", 3, path="address_similarity")
+    registry.add_collector("cache", metrics.stats_collector("lovefi_score_cache", lambda: {'hits': 5, 'size': 2}))
+    text = registry.render()
+    assert 'lovefi_stage_seconds_bucket{stage="parse",le="0.001"} 1' in text
+    assert 'lovefi_stage_seconds_bucket{stage="parse",le="+Inf"} 2' in text
+    assert 'lovefi_stage_seconds_count{stage="parse"} 2' in text
+    assert "# TYPE lovefi_fallback_total counter" in text
+    assert 'lovefi_fallback_total{path="address_similarity"} 3' in text
+    assert 'lovefi_score_cache_events_total{event="hits"} 5' in text
+    assert "# TYPE lovefi_score_cache_size gauge" in text and "lovefi_score_cache_size 2" in text
+    assert registry.summary().startswith("parse n=2 avg=1000.25ms")
+
+def test_plan_times_each_factor_and_counts_fallbacks(registry):
+    side1 = QueryProfile(30, None, 10, "New York", ["hiking"], [])
+    side2 = QueryProfile(31, (40.71, -74.0), 10, "new york", ["hiking"], [])
+    untimed = get_plan("match").score(side1, side2)
+    assert set(registry.stages) == {"factor.interest_overlap", "factor.age_gap", "factor.distance",
+                                    "factor.preference_agreement"}
+    assert registry.counters[("lovefi_fallback_total", (("path", "address_similarity"),))] == 1
+    metrics.set_enabled(False)
+    assert get_plan("match").score(side1, side2)[0] == untimed[0]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the profile registry and its persisted scoring features
+"""
+
+import json
+import sys
+import os
+from datetime import date, datetime
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+from profile_registry import ProfileRecord, ProfileRegistry, age_on, parse_birth_date
+
+def make_record(profile_id="alice", birthday="1995-01-01"):
+    return ProfileRecord(
+        profile_id=profile_id, first_name="Alice", last_name="Smith", gender="female",
+        birthday=birthday, coordinates=(40.71, -74.0), address="New York",
+        search_radius=10, interests=["hiking", "chess", "hiking"], selected_options=["Homebody"],
+    )
+
+def test_record_is_read_only():
+    """Derived features cannot drift after registration"""
+    record = make_record()
+    query = record.query_profile()
+    assert query.interest_set == frozenset({"hiking", "chess"}) and query.lat == 40.71
+    assert query.interests == ["hiking", "chess", "hiking"]
+    with pytest.raises(AttributeError):
+        record.lat = 0.0
+    moved = record.with_coordinates((51.5, -0.12))
+    assert moved.query_profile().lat == 51.5 and record.lat == 40.71 and moved.interests == record.interests
+
+def test_age_follows_the_calendar():
+    """The age is computed from the stored birth date when read, not frozen at registration"""
+    assert age_on(parse_birth_date("1995-06-15T08:30:00"), date(2025, 6, 14)) == 29
+    assert age_on(parse_birth_date("1995-06-15"), date(2025, 6, 15)) == 30
+    assert parse_birth_date("soon") is None and make_record(birthday="").age is None
+    record = make_record()
+    assert record.age == age_on(date(1995, 1, 1), datetime.utcnow().date()) == record.query_profile().age
+
+def test_pooled_candidates_follow_birthdays(monkeypatch, tmp_path):
+    """A candidate pooled under last year's age is re-registered with the current one"""
+    import dating_match_agent as agent
+    from candidate_pool import CandidatePool
+
+    monkeypatch.setattr(agent, "profile_registry", ProfileRegistry(str(tmp_path / "profiles.json")))
+    monkeypatch.setattr(agent, "_candidate_pool", CandidatePool())
+    record = make_record()
+    agent.store_record(record)
+    assert agent.refresh_candidate_ages() == 0
+    stale = record.query_profile()
+    stale.age -= 1
+    agent._candidate_pool.register(record.profile_id, stale)
+    assert agent.refresh_candidate_ages() == 1
+    assert agent._candidate_pool.profile(record.profile_id).age == record.age
+
+def test_records_share_interned_strings():
+    first = make_record("alice")
+    second = ProfileRecord.from_dict(json.loads(json.dumps(first.to_dict())))
+    assert all(a is b for a, b in zip(first.interests, second.interests))
+    assert first.address is second.address and first.selected_options[0] is second.selected_options[0]
+
+def test_registry_round_trips(tmp_path):
+    """Saved profiles reload with their coordinates and birthday; ages are not stored"""
+    path = str(tmp_path / "profiles.json")
+    registry = ProfileRegistry(path)
+    assert not registry.save()
+    registry.register(make_record())
+    registry.register(make_record("bob"))
+    assert registry.remove("bob") is not None
+    assert registry.save() and not registry.save()
+    with open(path) as f:
+        assert "age" not in json.load(f)["profiles"][0]
+
+    reloaded = ProfileRegistry(path)
+    assert len(reloaded) == 1 and "alice" in reloaded
+    record = reloaded.get("alice")
+    assert record.coordinates == (40.71, -74.0)
+    assert record.interests == ("hiking", "chess", "hiking")
+    assert record.birth_date == date(1995, 1, 1) and record.age == make_record().age
+    assert record.query_profile().preferences == ["Homebody"]
+
+def test_unresolved_coordinates_are_retried(monkeypatch, tmp_path):
+    """A transient geocoder failure at registration is not frozen into the record"""
+    import asyncio
+    import dating_match_agent as agent
+
+    class FlakyGeocoder:
+        coordinates = (None, None)
+
+        async def geocode(self, address):
+            return self.coordinates
+
+    geocoder = FlakyGeocoder()
+    monkeypatch.setattr(agent, "get_async_geocoder", lambda: geocoder)
+    monkeypatch.setattr(agent, "profile_registry", ProfileRegistry(str(tmp_path / "profiles.json")))
+    unresolved = ProfileRecord.from_dict(dict(make_record().to_dict(), coordinates=[None, None]))
+    agent.store_record(unresolved)
+    assert not unresolved.resolved
+    assert asyncio.run(agent.resolve_record(unresolved)) is unresolved
+    geocoder.coordinates = (40.71, -74.0)
+    resolved = asyncio.run(agent.resolve_record(unresolved))
+    assert resolved.lat == 40.71 and agent.profile_registry.get("alice") is resolved
+    assert agent.profile_registry.save()
+    assert ProfileRegistry(agent.profile_registry.path).get("alice").coordinates == (40.71, -74.0)
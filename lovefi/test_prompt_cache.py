@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Tests for skipping LLM extraction of chat prompts that were parsed before
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import os
+from datetime import datetime
+from uuid import uuid4
+
+sys.path.append(os.path.dirname(__file__))
+import dating_match_agent
+from llm_pipeline import StructuredOutputPipeline
+from local_llm_agent import DEFAULT_OUTPUT_PATH, StandInLLM
+from prompt_cache import normalize_prompt
+from ttl_cache import TTLCache
+
+class FakeContext:
+    def __init__(self, session):
+        self.session = session
+        self.logger = logging.getLogger("test")
+        self.sent = []
+
+    async def send(self, destination, message):
+        self.sent.append((destination, message))
+
+def test_normalize_prompt_ignores_case_spacing_and_closing_punctuation():
+    assert normalize_prompt("Alice,  28, NYC  vs Bob, 30!") == normalize_prompt("alice , 28 ,nyc vs bob , 30")
+    assert normalize_prompt("Ｐａｒｉｓ, likes chess.") == "paris , likes chess"
+    assert normalize_prompt("Alice 28") != normalize_prompt("Alice 29")
+
+def test_repeated_prompt_skips_the_llm(monkeypatch):
+    with open(DEFAULT_OUTPUT_PATH) as f:
+        stand_in = StandInLLM({"daniel and alex": json.load(f)})
+    llm_requests = []
+
+    async def send_prompt(ctx, prompt, output_schema):
+        llm_requests.append((ctx, dating_match_agent.StructuredOutputResponse(output=stand_in.answer(prompt, output_schema))))
+
+    pipeline = StructuredOutputPipeline(dating_match_agent.MatchRequest.schema, send_prompt, window=0.001)
+    monkeypatch.setattr(dating_match_agent, "llm_pipeline", pipeline)
+    monkeypatch.setattr(dating_match_agent, "prompt_cache", TTLCache(maxsize=10))
+
+    async def chat(session, text):
+        ctx = FakeContext(session)
+        message = dating_match_agent.ChatMessage(
+            timestamp=datetime.utcnow(), msg_id=uuid4(), content=[dating_match_agent.TextContent(type="text", text=text)]
+        )
+        await dating_match_agent.handle_message(ctx, f"user-{session}", message)
+        await asyncio.sleep(0.01)
+        return ctx
+
+    def replies(ctx):
+        return [message.content[0].text for _, message in ctx.sent if hasattr(message, "content")]
+
+    async def run():
+        first = await chat("s1", "Daniel and Alex")
+        llm_ctx, response = llm_requests[0]
+        await dating_match_agent.handle_structured_output_response(FakeContext(llm_ctx.session), "llm", response)
+        second = await chat("s2", "daniel  and alex.")
+        assert len(llm_requests) == 1
+        assert replies(second) == replies(first) and replies(first)[0].startswith("Match Score for Daniel")
+        # Unparsed prompts are not cached
+        await chat("s3", "hello")
+        await chat("s4", "hello")
+        assert len(llm_requests) == 3
+
+    asyncio.run(run())
+    assert dating_match_agent.prompt_cache.stats()['hits'] == 1
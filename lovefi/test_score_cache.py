@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the memoized pair-score cache
+"""
+
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+from score_cache import PairScoreCache, build_score_cache, cached_score, profile_fingerprint
+from ttl_cache import MISSING
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_fingerprint_depends_only_on_content():
+    """Key order is irrelevant; callers normalize the fields their scorer ignores"""
+    a = profile_fingerprint({'age': 30, 'interests': sorted(["chess", "hiking"]), 'location': "new york"})
+    b = profile_fingerprint({'location': "new york", 'interests': sorted(["hiking", "chess"]), 'age': 30})
+    assert a == b
+    assert a != profile_fingerprint({'age': 31, 'interests': ["chess", "hiking"], 'location': "new york"})
+
+def test_pairs_are_unordered():
+    """(A, B) and (B, A) share one entry, computed once"""
+    cache = PairScoreCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 72.5
+
+    assert cached_score(cache, {'id': 1}, {'id': 2}, compute) == 72.5
+    assert cached_score(cache, {'id': 2}, {'id': 1}, compute) == 72.5
+    assert len(calls) == 1 and len(cache) == 1
+    assert cache.stats()['hits'] == 1
+
+def test_size_and_ttl_are_bounded():
+    clock = FakeClock()
+    cache = PairScoreCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", "b", 1)
+    cache.set("a", "c", 2)
+    cache.get("b", "a")
+    cache.set("b", "c", 3)
+    assert len(cache) == 2
+    assert cache.get("a", "c") is MISSING and cache.get("a", "b") == 1
+    clock.now = 11
+    assert cache.get("a", "b") is MISSING
+
+def test_invalidate_drops_every_pair_of_a_profile():
+    cache = PairScoreCache()
+    cache.set("a", "b", 1)
+    cache.set("a", "c", 2)
+    cache.set("b", "c", 3)
+    cache.invalidate("a")
+    assert cache.get("a", "b") is MISSING and cache.get("c", "a") is MISSING
+    assert cache.get("b", "c") == 3
+    cache.set("a", "b", 4)
+    assert cache.get("b", "a") == 4
+
+def test_pair_index_shrinks_with_the_cache():
+    clock = FakeClock()
+    cache = PairScoreCache(maxsize=2, ttl=10, clock=clock)
+    for i in range(100):
+        cache.set(f"p{i}", f"q{i}", i)
+    assert len(cache._pairs) == 4
+    clock.now = 11
+    assert cache.get("p99", "q99") is MISSING and cache.get("p98", "q98") is MISSING
+    assert cache._pairs == {}
+    cache.set("a", "b", 1)
+    cache.invalidate("a")
+    assert cache._pairs == {} and len(cache) == 0
+
+def test_fallback_score_is_not_served_once_geocoding_recovers(monkeypatch):
+    import asyncio
+    import dating_match_agent as agent
+
+    class FlakyGeocoder:
+        def __init__(self):
+            self.coordinates = [None, None]
+
+        async def geocode_many(self, *addresses):
+            return [tuple(self.coordinates)] * len(addresses)
+
+    geocoder = FlakyGeocoder()
+    monkeypatch.setattr(agent, "get_async_geocoder", lambda: geocoder)
+    monkeypatch.setattr(agent, "match_score_cache", PairScoreCache())
+    info = agent.PersonalInfo(first_name="A", last_name="B", birthday="1995-01-01")
+    side1 = (info, "female", agent.Location(address="Somewhere Street 1", search_radius=10), ["chess"], [])
+    side2 = (info, "male", agent.Location(address="Elsewhere Avenue 2", search_radius=10), ["chess"], [])
+    degraded = asyncio.run(agent.calculate_match_score_cached(side1, side2))
+    geocoder.coordinates = [40.7, -74.0]
+    resolved = asyncio.run(agent.calculate_match_score_cached(side1, side2))
+    assert resolved != degraded and len(agent.match_score_cache) == 2
+    assert asyncio.run(agent.calculate_match_score_cached(side2, side1)) == resolved
+
+def test_build_score_cache_reads_environment(monkeypatch):
+    monkeypatch.setenv("LOVEFI_SCORE_CACHE_SIZE", "0")
+    assert build_score_cache() is None
+    assert cached_score(None, {}, {}, lambda: 5) == 5
+    monkeypatch.setenv("LOVEFI_SCORE_CACHE_SIZE", "3")
+    monkeypatch.setenv("LOVEFI_SCORE_CACHE_TTL", "60")
+    assert isinstance(build_score_cache(), PairScoreCache)
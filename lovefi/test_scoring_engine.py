@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Golden tests for the scoring engine: every 40/20/20/20 entry point reproduces
+the scores recorded from the scorers it replaced (golden_scores.json; cases on
+the address fallback were re-recorded when difflib gave way to trigrams)
+"""
+
+import json
+import random
+import re
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+import scoring_engine
+from batch_scoring import CandidateTable, score_candidates
+from dating_match_agent import (
+    Location, PersonalInfo, Preference, calculate_match_score_internal, score_match_features
+)
+from perfect_match_agent import calculate_match_score as perfect_match_score
+from perfect_match_agent import Location as PerfectLocation, PersonalInfo as PerfectInfo, Preference as PerfectPreference
+from scoring_engine import QueryProfile, compile_plan, describe, get_plan, load_weight_profiles
+
+with open(os.path.join(os.path.dirname(__file__), "golden_scores.json")) as f:
+    GOLDEN_CASES = json.load(f)['cases']
+
+def normalize(details):
+    # Common interests come from a set, so their order varies between runs
+    return re.sub(r"Common interests: ([^)]*)", lambda m: "Common interests: " + ", ".join(sorted(m[1].split(", "))), details)
+
+def query_profile(side):
+    return QueryProfile(side['age'], tuple(side['coordinates']), side['search_radius'], side['address'],
+                        side['interests'], side['preferences'])
+
+def test_pairwise_scores_match_golden():
+    """Scores are bit-for-bit identical, details identical up to set order"""
+    for case in GOLDEN_CASES:
+        a, b = case['profile1'], case['profile2']
+        score, details = score_match_features(
+            a['age'], b['age'], a['interests'], b['interests'], a['address'], b['address'],
+            a['search_radius'], b['search_radius'], tuple(a['coordinates']), tuple(b['coordinates']),
+            a['preferences'], b['preferences'], max_age_diff=case['max_age_diff']
+        )
+        assert score == case['score']
+        assert normalize(details) == normalize(case['details'])
+
+def test_vectorized_scores_match_golden():
+    """The plan's vectorized form gives the same totals as its pairwise form"""
+    for case in GOLDEN_CASES:
+        table = CandidateTable.from_profiles([0], [query_profile(case['profile2'])])
+        scores = score_candidates(query_profile(case['profile1']), table, max_age_diff=case['max_age_diff'])
+        assert scores.total[0] == pytest.approx(case['score'], abs=1e-9)
+
+def test_perfect_match_agent_uses_the_same_plan():
+    rng = random.Random(16)
+    for _ in range(50):
+        sides = []
+        for _ in range(2):
+            birthday = "" if rng.random() < 0.2 else f"{rng.randint(1970, 2004)}-0{rng.randint(1, 9)}-15"
+            options = [rng.choice(["Homebody", "Nomad"]) for _ in range(rng.randint(0, 3))]
+            sides.append((birthday, rng.choice(["New York", "Boston", "Atlantis"]), rng.choice([0, 10, 500]),
+                          rng.sample(["hiking", "chess", "music", "yoga"], rng.randint(0, 3)), options))
+        coordinates = tuple({"New York": (40.71, -74.0), "Boston": (42.36, -71.06)}.get(s[1], (None, None)) for s in sides)
+
+        def args(info, location, preference):
+            return [
+                value
+                for birthday, address, radius, interests, options in sides
+                for value in (info(first_name="A", last_name="B", birthday=birthday), "f",
+                              location(address=address, search_radius=radius), interests,
+                              [preference(category="c", question="q", options=options, selected_index=0, selected_option=o)
+                               for o in options])
+            ]
+
+        expected = calculate_match_score_internal(*args(PersonalInfo, Location, Preference), coordinates=coordinates)
+        actual = perfect_match_score(*args(PerfectInfo, PerfectLocation, PerfectPreference), coordinates=coordinates)
+        assert actual[0] == expected[0] and normalize(actual[1]) == normalize(expected[1])
+
+def test_weight_profiles_from_config(tmp_path, monkeypatch):
+    """A profile file adds or replaces profiles; zero weights still report, unknown factors fail"""
+    path = tmp_path / "weights.json"
+    path.write_text(json.dumps({'match': {'factors': {'interest_overlap': 100, 'age_gap': {'weight': 0, 'max_age_diff': 5}}}}))
+    monkeypatch.setattr(scoring_engine, "weight_profiles", load_weight_profiles(str(path)))
+    monkeypatch.setattr(scoring_engine, "_plans", {})
+
+    assert 'compatibility' in scoring_engine.weight_profiles
+    side1 = QueryProfile(30, (40.71, -74.0), 10, "New York", ["hiking", "chess"], [])
+    side2 = QueryProfile(33, (42.36, -71.06), 10, "Boston", ["hiking"], [])
+    score, results = get_plan("match").score(side1, side2)
+    assert score == 50.0
+    assert describe(results) == ("Interest compatibility: 50.0/100 (Common interests: hiking); "
+                                 "Age compatibility: 0.0/0 (Age difference: 3 years)")
+
+    with pytest.raises(ValueError):
+        compile_plan({'factors': {'charisma': 10}}, "bad")
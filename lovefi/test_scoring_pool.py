@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+Tests for ranking in worker processes over a shared-memory candidate table
+"""
+
+import asyncio
+import logging
+import random
+import subprocess
+import sys
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+import dating_match_agent
+from candidate_pool import CandidatePool
+from scoring_pool import PoolBusy, ScoringPool, build_scoring_pool
+from test_top_matches import random_features
+
+def test_workers_rank_like_the_event_loop():
+    """Same snapshots as CandidatePool.iter_top_matches, ties and exclusions included"""
+    rng = random.Random(17)
+    candidates = CandidatePool()
+    for i in range(500):
+        candidates.register(f"c{i}", random_features(rng))
+    queries = [random_features(rng) for _ in range(3)]
+
+    async def run(pool):
+        results = []
+        for query in queries:
+            for options in ({}, {'within_radius': True}, {'exclude': "c7", 'k': 0}, {'exclude': "c7", 'k': 25}):
+                results.append([s async for s in pool.iter_top_matches(candidates, query, chunk_size=64, **options)])
+                expected = list(candidates.iter_top_matches(query, chunk_size=64, **options))
+                assert results[-1] == expected
+        # A changed pool is republished
+        candidates.remove("c3")
+        ranked = [s async for s in pool.iter_top_matches(candidates, queries[0], k=500, chunk_size=64)]
+        assert ranked == list(candidates.iter_top_matches(queries[0], k=500, chunk_size=64))
+        assert "c3" not in {m['candidate_id'] for m in ranked[-1][0]}
+
+    pool = ScoringPool(2)
+    try:
+        asyncio.run(run(pool))
+    finally:
+        pool.close()
+
+def test_full_queue_applies_backpressure():
+    pool = ScoringPool(1, max_pending=2)
+
+    async def run():
+        busy = [await pool.dispatch(time.sleep, 0.5) for _ in range(2)]
+        with pytest.raises(PoolBusy):
+            await pool.dispatch(time.sleep, 0, timeout=0.05)
+        await asyncio.gather(*busy)
+        # Slots come back as tasks finish
+        assert await pool.submit(sum, [1, 2], timeout=1) == 3
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.close()
+
+def test_build_scoring_pool_reads_environment(monkeypatch):
+    monkeypatch.delenv("LOVEFI_SCORING_WORKERS", raising=False)
+    assert build_scoring_pool() is None
+
+def test_registrations_are_synced_into_the_published_block():
+    """Appends and replacements reuse the block; reallocated buffers get a new one"""
+    rng = random.Random(23)
+    candidates = CandidatePool()
+    for i in range(40):
+        candidates.register(f"c{i}", random_features(rng))
+    query = random_features(rng)
+
+    async def ranked(pool):
+        result = [s async for s in pool.iter_top_matches(candidates, query, k=100, chunk_size=16)]
+        assert result == list(candidates.iter_top_matches(query, k=100, chunk_size=16))
+        return pool._shared.name
+
+    async def run(pool):
+        first = await ranked(pool)
+        candidates.register("c41", random_features(rng))
+        candidates.register("c5", random_features(rng))
+        assert await ranked(pool) == first
+        # Past the builder's initial capacity of 64 rows its buffers are reallocated
+        for i in range(42, 80):
+            candidates.register(f"c{i}", random_features(rng))
+        assert await ranked(pool) != first
+
+    pool = ScoringPool(1)
+    try:
+        asyncio.run(run(pool))
+    finally:
+        pool.close()
+
+MAIN_SCRIPT = """
+import asyncio, os, sys
+sys.path.insert(0, {lovefi!r})
+with open({marker!r}, "a") as f:
+    f.write("main imported\\n")
+from scoring_pool import ScoringPool
+
+if __name__ == "__main__":
+    pool = ScoringPool(2)
+    async def run():
+        return await asyncio.gather(*(pool.submit(sorted, [2, 1]) for _ in range(4)))
+    print(asyncio.run(run()))
+    pool.close()
+"""
+
+def test_workers_do_not_import_the_parent_main(tmp_path):
+    marker = tmp_path / "imports.txt"
+    script = tmp_path / "agent_main.py"
+    script.write_text(MAIN_SCRIPT.format(lovefi=os.path.dirname(os.path.abspath(__file__)), marker=str(marker)))
+    subprocess.run([sys.executable, str(script)], check=True, timeout=60, capture_output=True)
+    assert marker.read_text().count("main imported") == 1
+
+def test_agent_falls_back_to_in_process_ranking(monkeypatch):
+    """A broken worker pool is replaced on the next request, and this one is ranked on the event loop"""
+    rng = random.Random(31)
+    candidates = CandidatePool()
+    for i in range(30):
+        candidates.register(f"c{i}", random_features(rng))
+    query = random_features(rng)
+
+    class BrokenPool:
+        closed = False
+
+        async def iter_top_matches(self, *args, **kwargs):
+            raise BrokenProcessPool("a worker died")
+            yield
+
+        def close(self):
+            self.closed = True
+
+    broken = BrokenPool()
+    sent = []
+
+    class Context:
+        logger = logging.getLogger("test")
+
+        async def send(self, destination, message):
+            sent.append(message)
+
+    async def profile_features(profiles):
+        return [query]
+
+    monkeypatch.setattr(dating_match_agent, "_candidate_pool", candidates)
+    monkeypatch.setattr(dating_match_agent, "_scoring_pool", broken)
+    monkeypatch.setattr(dating_match_agent, "_scoring_pool_checked", True)
+    monkeypatch.setattr(dating_match_agent, "profile_features", profile_features)
+    request = SimpleNamespace(profile=None, k=5, within_radius=False, exclude_id="")
+    asyncio.run(dating_match_agent.handle_top_matches(Context(), "user", request))
+
+    *_, (matches, _, _, _) = candidates.iter_top_matches(query, k=5)
+    assert not sent[-1].partial and [m.candidate_id for m in sent[-1].matches] == [m['candidate_id'] for m in matches]
+    assert broken.closed and not dating_match_agent._scoring_pool_checked
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the chat session store that replaced per-session ctx.storage keys
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import os
+from datetime import datetime
+from uuid import uuid4
+
+sys.path.append(os.path.dirname(__file__))
+import dating_match_agent
+from llm_pipeline import PendingPrompt, StructuredOutputPipeline
+from local_llm_agent import DEFAULT_OUTPUT_PATH, StandInLLM
+from session_store import ACTIVE, EXPIRED, UNKNOWN, SessionStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_sessions_expire_then_are_forgotten():
+    clock = FakeClock()
+    store = SessionStore(ttl=10, clock=clock)
+    store.open("s1", "alice")
+    clock.now += 8
+    store.open("s1", "alice")
+    clock.now += 8
+    assert store.lookup("s1") == (ACTIVE, "alice")
+    clock.now += 3
+    # Still known as expired, so a late answer can be reported cleanly
+    assert store.lookup("s1") == (EXPIRED, "alice") and store.purge() == 0
+    clock.now += 10
+    assert store.purge() == 1 and store.lookup("s1") == (UNKNOWN, None)
+    store.open("s2", "bob")
+    store.close("s2")
+    assert store.lookup("s2") == (UNKNOWN, None) and len(store) == 0
+
+def test_bounded_by_least_recent_use():
+    store = SessionStore(maxsize=2)
+    store.open("s1", "a")
+    store.open("s2", "b")
+    store.open("s1", "a")
+    store.open("s3", "c")
+    assert [store.lookup(s)[0] for s in ("s1", "s2", "s3")] == [ACTIVE, UNKNOWN, ACTIVE]
+    assert store.stats() == {'evictions': 1, 'expirations': 0, 'size': 2}
+
+def test_saves_only_live_sessions_and_only_when_changed(tmp_path):
+    path = str(tmp_path / "sessions.json")
+    clock = FakeClock()
+    store = SessionStore(path, ttl=10, clock=clock)
+    store.open("old", "alice")
+    clock.now += 5
+    store.open("new", "bob")
+    clock.now += 6
+    assert store.save() and not store.save()
+    with open(path) as f:
+        assert [item["session"] for item in json.load(f)["sessions"]] == ["new"]
+    reloaded = SessionStore(path, ttl=10, clock=clock)
+    assert reloaded.lookup("new") == (ACTIVE, "bob") and reloaded.lookup("old") == (UNKNOWN, None)
+
+def test_ending_a_session_waits_for_owed_answers():
+    store = SessionStore()
+    store.open("s1", "alice")
+    store.expect("s1")
+    store.expect("s1")
+    store.end("s1")
+    store.answered("s1")
+    assert store.lookup("s1") == (ACTIVE, "alice")
+    store.answered("s1")
+    assert store.lookup("s1") == (UNKNOWN, None)
+    store.open("s2", "bob")
+    store.end("s2")
+    assert store.lookup("s2") == (UNKNOWN, None)
+
+class FakeContext:
+    def __init__(self, session):
+        self.session = session
+        self.logger = logging.getLogger("test")
+        self.sent = []
+
+    async def send(self, destination, message):
+        self.sent.append((destination, message))
+
+def test_text_and_end_session_in_one_message_still_gets_a_reply(monkeypatch):
+    with open(DEFAULT_OUTPUT_PATH) as f:
+        stand_in = StandInLLM({"daniel and alex": json.load(f)})
+    llm_requests = []
+
+    async def send_prompt(ctx, prompt, output_schema):
+        llm_requests.append((ctx, dating_match_agent.StructuredOutputResponse(output=stand_in.answer(prompt, output_schema))))
+
+    pipeline = StructuredOutputPipeline(dating_match_agent.MatchRequest.schema, send_prompt, window=0.001)
+    monkeypatch.setattr(dating_match_agent, "llm_pipeline", pipeline)
+    monkeypatch.setattr(dating_match_agent, "prompt_cache", None)
+    monkeypatch.setattr(dating_match_agent, "chat_sessions", SessionStore())
+
+    async def run():
+        ctx = FakeContext("s1")
+        # What create_text_chat(text, end_session=True) produces
+        message = dating_match_agent.ChatMessage(timestamp=datetime.utcnow(), msg_id=uuid4(), content=[
+            dating_match_agent.TextContent(type="text", text="Daniel and Alex"),
+            dating_match_agent.EndSessionContent(type="end-session"),
+        ])
+        await dating_match_agent.handle_message(ctx, "user-1", message)
+        await asyncio.sleep(0.01)
+        llm_ctx, response = llm_requests[0]
+        await dating_match_agent.handle_structured_output_response(FakeContext(llm_ctx.session), "llm", response)
+        return llm_ctx
+
+    llm_ctx = asyncio.run(run())
+    replies = [message.content[0].text for _, message in llm_ctx.sent if hasattr(message, "content")]
+    assert len(replies) == 1 and replies[0].startswith("Match Score for Daniel")
+    assert dating_match_agent.chat_sessions.lookup("s1") == (UNKNOWN, None)
+
+def test_every_answer_to_an_expired_session_gets_a_reply(monkeypatch, caplog):
+    """Answers arriving after expiry each tell the sender, and the session closes after the last"""
+    clock = FakeClock()
+    sessions = SessionStore(ttl=10, clock=clock)
+    monkeypatch.setattr(dating_match_agent, "chat_sessions", sessions)
+    ctx = FakeContext("s1")
+    sessions.open("s1", "alice")
+    for _ in range(3):
+        sessions.expect("s1")
+    clock.now += 11
+    prompts = [PendingPrompt(f"r{n}", "Daniel and Alex", ctx, "alice") for n in range(3)]
+
+    async def run():
+        await dating_match_agent.reply_in_session(prompts[0], None)
+        await asyncio.gather(*(dating_match_agent.reply_in_session(prompt, None) for prompt in prompts[1:]))
+
+    with caplog.at_level(logging.WARNING, logger="test"):
+        asyncio.run(run())
+    replies = [message.content[0].text for destination, message in ctx.sent if destination == "alice"]
+    assert len(replies) == 3 and all("expired" in reply for reply in replies)
+    assert sessions.lookup("s1") == (UNKNOWN, None) and sessions.owed("s1") == 0
+    assert sum("expired before it arrived" in record.message for record in caplog.records) == 3
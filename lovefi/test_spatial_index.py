@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""
+Tests for radius-limited candidate retrieval
+"""
+
+import random
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__))
+from batch_scoring import haversine_km
+from spatial_index import CandidateStore
+
+def brute_force(points, lat, lon, radius_km):
+    return [key for key, (plat, plon) in points.items() if haversine_km(lat, lon, plat, plon) <= radius_km]
+
+def test_query_matches_brute_force():
+    """Grid lookups return exactly the points a full scan would, including across the antimeridian and poles"""
+    rng = random.Random(3)
+    points = {i: (rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(2000)}
+    points.update({"fiji": (-17.7, 179.9), "samoa": (-13.8, -179.9), "pole": (89.9, 10.0)})
+    store = CandidateStore(cell_km=50)
+    for key, (lat, lon) in points.items():
+        store.add(key, lat, lon)
+
+    queries = [(40.7, -74.0, 300), (-17.0, -179.5, 400), (89.5, -120.0, 200), (0.0, 0.0, 5000), (10.0, 10.0, 1)]
+    for lat, lon, radius in queries:
+        found = store.query_radius(lat, lon, radius)
+        assert sorted((key for key, _ in found), key=str) == sorted(brute_force(points, lat, lon, radius), key=str)
+        distances = [distance for _, distance in found]
+        assert distances == sorted(distances)
+
+def test_add_moves_and_remove_drops():
+    """Re-adding a key relocates it and removed keys are no longer returned"""
+    store = CandidateStore()
+    store.add("a", 40.71, -74.0)
+    store.add("a", 42.36, -71.06)
+    assert [key for key, _ in store.query_radius(42.36, -71.06, 10)] == ["a"]
+    assert store.query_radius(40.71, -74.0, 10) == []
+    store.remove("a")
+    assert len(store) == 0 and store.query_radius(42.36, -71.06, 10) == []
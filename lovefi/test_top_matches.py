@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Tests for bounded-heap top-k selection over the candidate pool
+"""
+
+import random
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+from batch_scoring import CandidateTable, QueryProfile, score_candidates
+from candidate_pool import CandidatePool
+from top_k import TopK, iter_top_k
+
+def test_top_k_keeps_best_and_first_on_ties():
+    """Only the k best survive, and equal scores keep the earlier arrival"""
+    top = TopK(3)
+    for key, score in enumerate([5, 1, 9, 5, 7, 9, 2]):
+        top.push(score, key)
+    assert [(score, key) for score, key, _ in top.results()] == [(9, 2), (9, 5), (7, 4)]
+
+def test_iter_top_k_streams_partial_results():
+    """A snapshot is produced every report_every items plus a final one"""
+    snapshots = list(iter_top_k(((i, i, None) for i in range(10)), k=2, report_every=4))
+    assert [(scanned, done) for _, scanned, done in snapshots] == [(4, False), (8, False), (10, True)]
+    assert [key for _, key, _ in snapshots[-1][0]] == [9, 8]
+
+def random_features(rng):
+    lat, lon = rng.choice([(40.71, -74.0), (40.68, -73.94), (34.05, -118.24), (None, None)])
+    return QueryProfile(
+        age=rng.choice([None, *range(20, 45)]),
+        coordinates=(lat, lon),
+        search_radius=rng.choice([10, 50]),
+        address=rng.choice(["New York", "Brooklyn", "Los Angeles"]),
+        interests=rng.sample(["hiking", "chess", "music", "travel", "yoga"], rng.randint(0, 4)),
+        preferences=rng.sample(["Homebody", "Nomad", "Night owl"], rng.randint(0, 2)),
+    )
+
+def test_pool_top_matches_equal_full_sort():
+    """Chunked heap selection returns the same ranking as scoring and sorting everything"""
+    rng = random.Random(5)
+    pool = CandidatePool()
+    features = {f"c{i}": random_features(rng) for i in range(500)}
+    for candidate_id, feature in features.items():
+        pool.register(candidate_id, feature)
+    query = random_features(rng)
+    query.lat, query.lon = 40.71, -74.0
+
+    *_, (matches, scanned, total, done) = pool.iter_top_matches(query, k=10, chunk_size=64, exclude="c0")
+    assert done and scanned == total == 500
+
+    table = CandidateTable.from_profiles(list(features), list(features.values()))
+    totals = score_candidates(query, table).total
+    expected = sorted((float(t) for i, t in zip(features, totals) if i != "c0"), reverse=True)[:10]
+    assert [m['score'] for m in matches] == pytest.approx(expected)
+    assert all("c0" != m['candidate_id'] for m in matches)
+
+def test_pool_within_radius_skips_far_candidates():
+    """Radius-limited ranking only scans candidates inside the searcher's search radius"""
+    rng = random.Random(9)
+    pool = CandidatePool()
+    for i in range(200):
+        pool.register(i, random_features(rng))
+    query = QueryProfile(30, (34.05, -118.24), 10, "Los Angeles", ["hiking"], [])
+
+    *_, (matches, scanned, total, done) = pool.iter_top_matches(query, k=5, within_radius=True)
+    assert done and 0 < total < 200
+    assert all(m['distance_km'] is not None and m['distance_km'] <= 10 for m in matches)
+
+def test_pool_grows_incrementally_like_a_rebuild():
+    """Registering between queries (including re-registering an id) matches a table built from scratch"""
+    rng = random.Random(3)
+    pool = CandidatePool()
+    features = {}
+    query = QueryProfile(30, (40.71, -74.0), 50, "New York", ["hiking"], ["Nomad"])
+    for step in range(300):
+        candidate_id = f"c{rng.randrange(120)}"
+        features[candidate_id] = random_features(rng)
+        pool.register(candidate_id, features[candidate_id])
+        if step % 37 == 0:
+            list(pool.iter_top_matches(query, k=5, within_radius=True))
+    removed = next(iter(features))
+    pool.remove(removed)
+    del features[removed]
+    features["new"] = random_features(rng)
+    pool.register("new", features["new"])
+
+    table = CandidateTable.from_profiles(list(features), list(features.values()))
+    assert pool.table.ids == table.ids
+    assert list(score_candidates(query, pool.table).total) == pytest.approx(list(score_candidates(query, table).total))
+    *_, (matches, _, total, _) = pool.iter_top_matches(query, k=200, within_radius=True)
+    in_radius = {m['candidate_id'] for m in matches}
+    expected = {i for i, f in features.items() if f.lat is not None and abs(f.lat - 40.7) < 1}
+    assert in_radius == expected and total == len(expected)
+    excluded = sorted(expected)[len(expected) // 2]
+    *_, (matches, _, _, _) = pool.iter_top_matches(query, k=200, chunk_size=7, within_radius=True, exclude=excluded)
+    assert {m['candidate_id'] for m in matches} == expected - {excluded}
@@ -0,0 +1,57 @@
+import heapq
+import itertools
+from typing import Any, Hashable, Iterable, Iterator, List, Tuple
+
+class TopK:
+    """Bounded min-heap keeping the k best-scoring items seen so far.
+
+    Memory stays O(k) however many candidates are pushed; ties keep the
+    item that arrived first.
+    """
+
+    def __init__(self, k: int):
+        if k < 0:
+            raise ValueError("k must be non-negative")
+        self.k = k
+        self.scanned = 0
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def threshold(self) -> float:
+        """Score an item must beat to enter a full heap"""
+        return self._heap[0][0] if len(self._heap) >= self.k and self._heap else float("-inf")
+
+    def push(self, score: float, key: Hashable, item: Any = None) -> bool:
+        self.scanned += 1
+        if self.k == 0:
+            return False
+        # Later arrivals get a smaller tiebreaker, so they are evicted first
+        entry = (score, -next(self._sequence), key, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def results(self) -> List[Tuple[float, Hashable, Any]]:
+        """(score, key, item) best first"""
+        return [(score, key, item) for score, _, key, item in sorted(self._heap, reverse=True)]
+
+def iter_top_k(scored: Iterable[Tuple[float, Hashable, Any]], k: int, report_every: int = 1000) -> Iterator[Tuple[List, int, bool]]:
+    """Stream the running top k over (score, key, item) triples.
+
+    Yields (results, scanned, done) after every `report_every` items and once
+    more when the input is exhausted, so callers can forward partial rankings
+    without materializing the full score list.
+    """
+    top = TopK(k)
+    for score, key, item in scored:
+        top.push(score, key, item)
+        if report_every and top.scanned % report_every == 0:
+            yield top.results(), top.scanned, False
+    yield top.results(), top.scanned, True